@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'billingapp.middleware.QueryTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -134,10 +135,54 @@ REST_FRAMEWORK = {
     # Use Django's standard `django.contrib.auth` permissions,
     # or allow read-only access for unauthenticated users.
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'billingapp.authentication.CachedJWTAuthentication',
     ),
 }
 
+# Seconds an authenticated user stays cached by CachedJWTAuthentication;
+# bump the version to drop every cached user at once
+BILLING_AUTH_USER_CACHE_TTL = int(os.environ.get('BILLING_AUTH_USER_CACHE_TTL', 60))
+BILLING_AUTH_USER_CACHE_VERSION = 1
+
+# Default and maximum page size for the cursor-paginated invoice and
+# subscription lists (?page_size= may ask for anything up to the maximum)
+BILLING_PAGE_SIZE = int(os.environ.get('BILLING_PAGE_SIZE', 50))
+BILLING_MAX_PAGE_SIZE = int(os.environ.get('BILLING_MAX_PAGE_SIZE', 500))
+
+# Invoices fetched per server-side cursor round trip by /invoices/export/
+BILLING_EXPORT_CHUNK_SIZE = int(os.environ.get('BILLING_EXPORT_CHUNK_SIZE', 2000))
+
+# Most entries accepted by one POST /subscriptions/bulk/
+BILLING_BULK_SUBSCRIPTION_MAX = int(os.environ.get('BILLING_BULK_SUBSCRIPTION_MAX', 5000))
+
+# Request instrumentation; see billingapp.middleware.QueryTimingMiddleware.
+# Server-Timing headers expose query counts and timings to clients, so they
+# are only sent in DEBUG unless switched on explicitly
+BILLING_SERVER_TIMING = os.environ.get('BILLING_SERVER_TIMING', str(DEBUG)) == 'True'
+BILLING_SLOW_REQUEST_MS = int(os.environ.get('BILLING_SLOW_REQUEST_MS', 500))
+BILLING_SLOW_REQUEST_QUERIES = int(os.environ.get('BILLING_SLOW_REQUEST_QUERIES', 50))
+
+# Times one statement may run in a request before it is logged as a likely N+1
+BILLING_REPEATED_QUERY_THRESHOLD = int(os.environ.get('BILLING_REPEATED_QUERY_THRESHOLD', 5))
+
+
+# Cache
+# Shared by every web and Celery process, which the plan catalog and the
+# cached JWT users rely on for invalidation; a per-process cache would keep
+# serving old prices and deactivated users. Defaults to the Redis server
+# Celery uses, in its own database so that clearing the cache never flushes
+# the task queue
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/1'),
+    }
+}
+
+# Seconds a plan catalog snapshot stays in the shared cache
+BILLING_PLAN_CATALOG_TTL = int(os.environ.get('BILLING_PLAN_CATALOG_TTL', 86400))
+
 
 AUTH_USER_MODEL = 'billingapp.User'
 
@@ -156,3 +201,64 @@ CELERY_TIMEZONE = 'UTC'
 
 # Enable Django-Celery-Beat scheduler
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+
+
+# Billing task tuning
+
+# Number of invoices written per bulk insert by generate_daily_invoices
+BILLING_INVOICE_BATCH_SIZE = int(os.environ.get('BILLING_INVOICE_BATCH_SIZE', 1000))
+
+# Id-range width of each shard dispatched by generate_daily_invoices_sharded
+BILLING_INVOICE_SHARD_SIZE = int(os.environ.get('BILLING_INVOICE_SHARD_SIZE', 10000))
+
+# Upper bound on shards per sharded run; shards are widened to stay under it
+BILLING_INVOICE_MAX_SHARDS = int(os.environ.get('BILLING_INVOICE_MAX_SHARDS', 32))
+
+# Where invoice reminders are delivered; see billingapp.notifications
+BILLING_REMINDER_BACKEND = os.environ.get(
+    'BILLING_REMINDER_BACKEND', 'billingapp.notifications.ConsoleReminderBackend'
+)
+
+# Output file for billingapp.notifications.FileReminderBackend
+BILLING_REMINDER_FILE_PATH = os.environ.get(
+    'BILLING_REMINDER_FILE_PATH', os.path.join(BASE_DIR, 'reminders.log')
+)
+
+# Number of reminders handed to the backend per batch
+BILLING_REMINDER_BATCH_SIZE = int(os.environ.get('BILLING_REMINDER_BATCH_SIZE', 500))
+
+# Stripe webhook events applied per transaction by process_stripe_events
+BILLING_STRIPE_EVENT_BATCH_SIZE = int(os.environ.get('BILLING_STRIPE_EVENT_BATCH_SIZE', 500))
+
+# Invoices moved to overdue per transaction by mark_overdue_invoices
+BILLING_OVERDUE_CHUNK_SIZE = int(os.environ.get('BILLING_OVERDUE_CHUNK_SIZE', 1000))
+
+# Seconds to pause between overdue chunks so other writers can get the rows
+BILLING_OVERDUE_CHUNK_PAUSE = float(os.environ.get('BILLING_OVERDUE_CHUNK_PAUSE', 0.05))
+
+# Paid invoices issued more than this many days ago are moved to the archive
+# table by archive_paid_invoices, this many per transaction
+BILLING_INVOICE_ARCHIVE_AFTER_DAYS = int(os.environ.get('BILLING_INVOICE_ARCHIVE_AFTER_DAYS', 365))
+BILLING_INVOICE_ARCHIVE_BATCH_SIZE = int(os.environ.get('BILLING_INVOICE_ARCHIVE_BATCH_SIZE', 1000))
+
+# Days of task run history kept by the prune_task_runs task
+BILLING_TASK_RUN_RETENTION_DAYS = int(os.environ.get('BILLING_TASK_RUN_RETENTION_DAYS', 30))
+
+# Lets a Prometheus scraper read /api/metrics/ by sending it in the
+# X-Metrics-Token header; admin users can always read it
+BILLING_METRICS_TOKEN = os.environ.get('BILLING_METRICS_TOKEN')
+
+
+# Stripe
+# Keys belong in the environment (or a secret store such as AWS SSM).
+STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
+
+# Override the Stripe API base, e.g. http://localhost:12111 for stripe-mock
+STRIPE_API_BASE = os.environ.get('STRIPE_API_BASE')
+
+# Signing secret of the /api/stripe/webhook/ endpoint
+STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET')
+
+STRIPE_CURRENCY = 'inr'
+STRIPE_TIMEOUT = 30
+STRIPE_MAX_NETWORK_RETRIES = 2
@@ -1,9 +1,47 @@
 """This module is used to register the models in admin center"""
 from django.contrib import admin
-from .models import User, Plan, Subscription, Invoice
+from .models import (
+    User,
+    Plan,
+    Subscription,
+    Invoice,
+    ArchivedInvoice,
+    StripeEvent,
+    TaskRun,
+    PlanSubscriptionSummary,
+    ReceivableBalance,
+    UserBillingSummary,
+)
 
 
 admin.site.register(User)
 admin.site.register(Plan)
-admin.site.register(Subscription)
-admin.site.register(Invoice)
+
+
+class SubscriptionAdmin(admin.ModelAdmin):
+    """Subscription changelist; the row label shows the user and plan."""
+    list_select_related = ("user", "plan")
+
+
+class InvoiceAdmin(admin.ModelAdmin):
+    """Invoice changelist; the row label shows the user."""
+    list_select_related = ("user",)
+
+
+admin.site.register(Subscription, SubscriptionAdmin)
+admin.site.register(Invoice, InvoiceAdmin)
+admin.site.register(ArchivedInvoice, InvoiceAdmin)
+admin.site.register(StripeEvent)
+
+
+class TaskRunAdmin(admin.ModelAdmin):
+    """Task run history, newest first."""
+    list_display = ("task_name", "status", "started_at", "duration", "rows_scanned", "rows_changed")
+    list_filter = ("task_name", "status")
+    ordering = ("-id",)
+
+
+admin.site.register(TaskRun, TaskRunAdmin)
+admin.site.register(PlanSubscriptionSummary)
+admin.site.register(ReceivableBalance)
+admin.site.register(UserBillingSummary)
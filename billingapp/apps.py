@@ -6,3 +6,6 @@ class BillingappConfig(AppConfig):
     """App configuration"""
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'billingapp'
+
+    def ready(self):
+        from . import signals  # noqa: F401 pylint:disable=C0415,W0611
@@ -0,0 +1,140 @@
+"""
+Async views for the payment and invoice read endpoints, served under ASGI.
+
+These are plain Django async views: the ORM calls use the async API and the
+Stripe call uses the async HTTP client, so one worker can keep many
+payment requests in flight while Stripe responds. They mirror the DRF
+views in ``views.py``, which keep serving the WSGI deployment unchanged.
+"""
+
+# pylint:disable=E1101
+import json
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from stripe import StripeError
+from .authentication import CachedJWTAuthentication
+from .models import Invoice
+from .pagination import InvoiceCursorPagination
+from .payments import aget_or_create_payment_intent
+from .serializers import InvoiceSerializer, ValuesReader
+from .transitions import pay_invoice
+
+invoice_reader = ValuesReader(InvoiceSerializer)
+
+
+async def _authenticate(request):
+    """Return the request's user, or None if it is not authenticated."""
+    try:
+        result = await CachedJWTAuthentication().aauthenticate(request)
+    except (AuthenticationFailed, InvalidToken):
+        return None
+    return result[0] if result else None
+
+
+def _unauthorized():
+    return JsonResponse(
+        {"detail": "Authentication credentials were not provided."}, status=401
+    )
+
+
+def _invoice_id(request):
+    try:
+        return json.loads(request.body or b"{}").get("invoice_id")
+    except (ValueError, AttributeError):
+        return None
+
+
+def _invoices_for(user):
+    return Invoice.objects.all() if user.is_staff else Invoice.objects.filter(user=user)
+
+
+@csrf_exempt
+@require_POST
+async def create_payment_intent(request):
+    """Async counterpart of CreatePaymentIntentView."""
+    invoice_id = _invoice_id(request)
+    if not invoice_id:
+        return JsonResponse({"detail": "Invoice ID is required."}, status=400)
+    try:
+        invoice = await Invoice.objects.exclude(status="paid").only(
+            "id", "amount", "payment_intent_id", "payment_client_secret"
+        ).aget(id=invoice_id)
+    except (Invoice.DoesNotExist, ValueError):
+        return JsonResponse({"detail": "Not found."}, status=404)
+
+    try:
+        intent_id, client_secret = await aget_or_create_payment_intent(invoice)
+    except StripeError as e:
+        return JsonResponse({"error": str(e.user_message or str(e))}, status=400)
+    except Exception as e:  # pylint:disable=W0718
+        return JsonResponse({"error": str(e)}, status=500)
+
+    return JsonResponse({"client_secret": client_secret, "payment_intent_id": intent_id})
+
+
+@csrf_exempt
+@require_POST
+async def payment_success(request):
+    """Async counterpart of PaymentSuccesstView."""
+    invoice_id = _invoice_id(request)
+    if not invoice_id:
+        return JsonResponse({"detail": "Invoice ID is required."}, status=400)
+    try:
+        invoice_id = int(invoice_id)
+    except (TypeError, ValueError):
+        return JsonResponse({"detail": "Invoice ID must be a number."}, status=400)
+    # The same guarded transition as the DRF view.
+    if not await sync_to_async(pay_invoice)(invoice_id):
+        return JsonResponse({"detail": "No unpaid invoice matches the given id."}, status=404)
+    return JsonResponse({"detail": f"Invoice {invoice_id} marked as paid."})
+
+
+@require_GET
+async def invoice_list(request):
+    """
+    List the caller's invoices, newest first; admins see every invoice.
+
+    Supports ``?status=``, ``?page_size=`` and the opaque ``?cursor=``
+    returned as ``next`` and ``previous``, as ``/invoices/`` does.
+    """
+    user = await _authenticate(request)
+    if user is None:
+        return _unauthorized()
+
+    queryset = _invoices_for(user)
+    status_param = request.GET.get("status")
+    if status_param:
+        queryset = queryset.filter(status=status_param)
+
+    # The same keyset pages, cursors and page sizes as /invoices/.
+    paginator = InvoiceCursorPagination()
+    try:
+        rows = paginator.page_rows(invoice_reader.values(queryset), Request(request))
+    except NotFound as err:
+        return JsonResponse({"detail": str(err.detail)}, status=404)
+    page = paginator.set_page([row async for row in rows])
+    return JsonResponse(
+        {
+            "next": paginator.get_next_link(),
+            "previous": paginator.get_previous_link(),
+            "results": invoice_reader.serialize(page),
+        }
+    )
+
+
+@require_GET
+async def invoice_detail(request, pk):
+    """Retrieve one of the caller's invoices; admins can retrieve any."""
+    user = await _authenticate(request)
+    if user is None:
+        return _unauthorized()
+    try:
+        row = await invoice_reader.values(_invoices_for(user)).aget(pk=pk)
+    except Invoice.DoesNotExist:
+        return JsonResponse({"detail": "No Invoice matches the given query."}, status=404)
+    return JsonResponse(invoice_reader.to_representation(row))
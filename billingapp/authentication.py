@@ -0,0 +1,128 @@
+"""
+JWT authentication with a cached user lookup.
+
+simplejwt's JWTAuthentication loads the user row on every request. The
+class here resolves it from the cache first, keyed by user id and
+``BILLING_AUTH_USER_CACHE_VERSION``, for ``BILLING_AUTH_USER_CACHE_TTL``
+seconds. Saving or deleting a user drops its entry, so deactivation,
+permission changes and password changes apply on the next request.
+
+Only the fields authentication and the permission checks read are cached
+(``CACHED_FIELDS``), never the password hash: the user is rebuilt from
+them with the other fields deferred. With ``CHECK_REVOKE_TOKEN`` on, the
+digest the token is checked against is cached in place of the hash.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+# User fields kept in the cache.
+CACHED_FIELDS = ("id", "username", "is_active", "is_staff", "is_superuser")
+
+
+def user_cache_key(user_id):
+    """Cache key of an authenticated user."""
+    return f"billing:auth-user:{user_id}"
+
+
+def _cache_version():
+    return getattr(settings, "BILLING_AUTH_USER_CACHE_VERSION", 1)
+
+
+def _cache_ttl():
+    return getattr(settings, "BILLING_AUTH_USER_CACHE_TTL", 60)
+
+
+def invalidate_cached_user(user_id):
+    """Drop a user from the authentication cache."""
+    cache.delete(user_cache_key(user_id), version=_cache_version())
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that reads the user from the cache when possible."""
+
+    def get_user(self, validated_token):
+        user_id = self._user_id(validated_token)
+        key = user_cache_key(user_id)
+        row = cache.get(key, version=_cache_version())
+        if row is None:
+            row = self._cached_row(self._user_rows(user_id).first())
+            cache.set(key, row, _cache_ttl(), version=_cache_version())
+        return self._check_user(row, validated_token)
+
+    async def aauthenticate(self, request):
+        """
+        Async counterpart of ``authenticate`` for plain Django async views.
+
+        Returns:
+            tuple | None: (user, validated_token), or None without a token.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        """Async counterpart of ``get_user``."""
+        user_id = self._user_id(validated_token)
+        key = user_cache_key(user_id)
+        row = await cache.aget(key, version=_cache_version())
+        if row is None:
+            row = self._cached_row(await self._user_rows(user_id).afirst())
+            await cache.aset(key, row, _cache_ttl(), version=_cache_version())
+        return self._check_user(row, validated_token)
+
+    def _user_rows(self, user_id):
+        fields = CACHED_FIELDS
+        if api_settings.CHECK_REVOKE_TOKEN:
+            fields += ("password",)
+        return self.user_model.objects.filter(
+            **{api_settings.USER_ID_FIELD: user_id}
+        ).values(*fields)
+
+    @staticmethod
+    def _cached_row(row):
+        """The cache entry for a user row; AuthenticationFailed if missing."""
+        if row is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if "password" in row:
+            row["password_digest"] = get_md5_hash_password(row.pop("password"))
+        return row
+
+    @staticmethod
+    def _user_id(validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(
+                _("Token contained no recognizable user identification")
+            ) from e
+
+    def _check_user(self, row, validated_token):
+        if api_settings.CHECK_USER_IS_ACTIVE and not row["is_active"]:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != row.get(
+                "password_digest"
+            ):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return self.user_model.from_db(
+            router.db_for_read(self.user_model),
+            list(CACHED_FIELDS),
+            [row[field] for field in CACHED_FIELDS],
+        )
@@ -0,0 +1,316 @@
+"""
+Billing engine for recurring subscriptions.
+
+Renewals are driven by ``Subscription.next_billing_date``: each run picks up
+the subscriptions that are due with an indexed range scan, issues one invoice
+per missed billing date and moves ``next_billing_date`` forward in the same
+transaction.
+
+Status transitions that touch many invoices run in bounded, id-ordered chunks
+so that no single transaction holds row locks for long. Old paid invoices are
+moved to the archive table in the same way, which keeps the invoice table and
+its indexes sized by the working set rather than by total history.
+"""
+
+# pylint:disable=E1101
+import calendar
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, Value, When
+from django.utils.timezone import now
+from . import reports, telemetry
+from .catalog import plan_prices
+from .models import ArchivedInvoice, Subscription, Invoice
+
+INTERVAL_MONTHS = {
+    "monthly": 1,
+    "yearly": 12,
+}
+
+INVOICE_DUE_DAYS = 7
+
+RenewalResult = namedtuple("RenewalResult", ["renewed", "invoiced"])
+
+
+def invoice_batch_size():
+    """Number of rows written per bulk statement."""
+    return getattr(settings, "BILLING_INVOICE_BATCH_SIZE", 1000)
+
+
+def add_months(day, months, anchor_day=None):
+    """
+    Return ``day`` moved forward by ``months``.
+
+    The day of month is ``anchor_day`` (defaulting to ``day.day``), clamped
+    to the length of the target month, so a subscription started on the
+    31st bills on the last day of shorter months without drifting.
+    """
+    month_index = day.month - 1 + months
+    year = day.year + month_index // 12
+    month = month_index % 12 + 1
+    last_day = calendar.monthrange(year, month)[1]
+    return date(year, month, min(anchor_day or day.day, last_day))
+
+
+def next_billing_date_after(billing_date, start_date, interval):
+    """Return the billing date following ``billing_date`` for a subscription."""
+    return add_months(billing_date, INTERVAL_MONTHS[interval], start_date.day)
+
+
+def due_subscriptions(today):
+    """Active subscriptions with a billing date on or before ``today``."""
+    return Subscription.objects.filter(status="active", next_billing_date__lte=today)
+
+
+def renew_due_subscriptions(today=None, subscriptions=None):
+    """
+    Invoice every due subscription and advance its ``next_billing_date``.
+
+    Due subscriptions are processed in id-ordered chunks. Each chunk is
+    locked (skipping rows another worker holds), invoiced with one
+    ``bulk_create`` and rescheduled with one ``bulk_update`` inside a single
+    transaction, so a subscription is never invoiced without its billing
+    date moving forward. Subscriptions that missed several billing dates
+    get one invoice per missed date. Billing dates past ``end_date`` are
+    skipped.
+
+    Args:
+        today (date): The billing day; defaults to the current date.
+        subscriptions (QuerySet): Optional subset of subscriptions to
+            consider, e.g. an id-range shard.
+
+    Returns:
+        RenewalResult: Subscriptions renewed and invoices created.
+    """
+    today = today or now().date()
+    queryset = due_subscriptions(today)
+    if subscriptions is not None:
+        queryset = queryset & subscriptions
+    prices = plan_prices()
+    batch_size = invoice_batch_size()
+
+    renewed = invoiced = 0
+    last_id = 0
+    while True:
+        started = time.perf_counter()
+        with transaction.atomic():
+            chunk = list(
+                queryset.filter(id__gt=last_id)
+                .order_by("id")
+                .select_for_update(skip_locked=True)
+                .only(
+                    "id",
+                    "user_id",
+                    "plan_id",
+                    "start_date",
+                    "end_date",
+                    "billing_interval",
+                    "next_billing_date",
+                )[:batch_size]
+            )
+            if not chunk:
+                break
+
+            invoices = []
+            for sub in chunk:
+                billing_date = sub.next_billing_date
+                while billing_date <= today:
+                    if billing_date <= sub.end_date:
+                        invoices.append(
+                            Invoice(
+                                user_id=sub.user_id,
+                                plan_id=sub.plan_id,
+                                subscription_id=sub.id,
+                                amount=prices[sub.plan_id],
+                                issue_date=billing_date,
+                                due_date=billing_date + timedelta(days=INVOICE_DUE_DAYS),
+                                status="pending",
+                            )
+                        )
+                    billing_date = next_billing_date_after(
+                        billing_date, sub.start_date, sub.billing_interval
+                    )
+                sub.next_billing_date = billing_date
+                sub.updated_at = now()
+
+            # Leave out invoices already issued for a date (say by a run
+            # that failed after inserting them), so only new rows are
+            # counted and added to the summaries. The chunk is locked, so
+            # the conflict check on insert only guards against writers
+            # outside the renewal engine.
+            issued = set(
+                Invoice.objects.filter(
+                    subscription_id__in=[sub.id for sub in chunk],
+                    issue_date__in={invoice.issue_date for invoice in invoices},
+                ).values_list("subscription_id", "issue_date")
+            ) if invoices else set()
+            invoices = [
+                invoice
+                for invoice in invoices
+                if (invoice.subscription_id, invoice.issue_date) not in issued
+            ]
+            Invoice.objects.bulk_create(
+                invoices, batch_size=batch_size, ignore_conflicts=True
+            )
+            reports.invoices_added(invoices)
+            Subscription.objects.bulk_update(
+                chunk, ["next_billing_date", "updated_at"], batch_size=batch_size
+            )
+
+        renewed += len(chunk)
+        invoiced += len(invoices)
+        last_id = chunk[-1].id
+        telemetry.record_chunk(
+            time.perf_counter() - started, scanned=len(chunk), changed=len(invoices)
+        )
+    return RenewalResult(renewed, invoiced)
+
+
+def mark_overdue_chunk(today, after_id=0, limit=1000):
+    """
+    Move one id-ordered chunk of past-due pending invoices to overdue.
+
+    The chunk is locked and updated in its own short transaction; rows
+    locked by a concurrent writer (e.g. a payment) are skipped rather than
+    waited on and are picked up by the next run. The users' billing
+    summaries move the chunk from pending to overdue in the same
+    transaction.
+
+    Returns:
+        list[int]: The ids of the invoices that were marked overdue.
+    """
+    started = time.perf_counter()
+    with transaction.atomic():
+        rows = list(
+            Invoice.objects.select_for_update(skip_locked=True)
+            .filter(status="pending", due_date__lt=today, id__gt=after_id)
+            .order_by("id")
+            .values_list("id", "user_id", "amount")[:limit]
+        )
+        if not rows:
+            return []
+        ids = [row[0] for row in rows]
+        changed = Invoice.objects.filter(id__in=ids, status="pending").update(
+            status="overdue", updated_at=now()
+        )
+        reports.balances_changed(
+            (
+                reports.balance_state("pending", user_id, amount),
+                reports.balance_state("overdue", user_id, amount),
+            )
+            for _, user_id, amount in rows
+        )
+    telemetry.record_chunk(time.perf_counter() - started, scanned=len(ids), changed=changed)
+    return ids
+
+
+def iter_overdue_transitions(today, chunk_size=1000, pause=0):
+    """
+    Mark past-due pending invoices overdue chunk by chunk.
+
+    Sleeps ``pause`` seconds between chunks to leave room for other
+    writers on the invoice table.
+
+    Yields:
+        list[int]: The ids changed by each committed chunk.
+    """
+    last_id = 0
+    while True:
+        ids = mark_overdue_chunk(today, after_id=last_id, limit=chunk_size)
+        if not ids:
+            return
+        yield ids
+        if len(ids) < chunk_size:
+            return
+        last_id = ids[-1]
+        if pause:
+            time.sleep(pause)
+
+
+def mark_invoices_paid(paid_at_by_id):
+    """
+    Mark unpaid invoices as paid with one set-based update.
+
+    The unpaid invoices are locked first, so the receivables and user
+    summaries are reduced by exactly the invoices that changed.
+
+    Args:
+        paid_at_by_id (dict): Maps invoice id to the time it was paid.
+
+    Returns:
+        int: The number of invoices that changed.
+    """
+    if not paid_at_by_id:
+        return 0
+    with transaction.atomic():
+        unpaid = list(
+            Invoice.objects.select_for_update()
+            .filter(id__in=paid_at_by_id)
+            .exclude(status="paid")
+            .values_list("id", "status", "due_date", "amount", "user_id")
+        )
+        if not unpaid:
+            return 0
+        paid_times = {paid_at_by_id[row[0]] for row in unpaid}
+        if len(paid_times) == 1:
+            paid_at = paid_times.pop()
+        else:
+            paid_at = Case(
+                *(When(id=row[0], then=Value(paid_at_by_id[row[0]])) for row in unpaid),
+                output_field=models.DateTimeField(),
+            )
+        changed = Invoice.objects.filter(id__in=[row[0] for row in unpaid]).update(
+            status="paid", paid_at=paid_at, updated_at=now()
+        )
+        reports.receivables_changed(
+            (reports.invoice_state(*row[1:4]), None) for row in unpaid
+        )
+        reports.balances_changed(
+            (reports.balance_state(row[1], row[4], row[3]), None) for row in unpaid
+        )
+    return changed
+
+
+ARCHIVED_FIELDS = [
+    field.attname for field in ArchivedInvoice._meta.concrete_fields if field.name != "archived_at"
+]
+
+
+def archive_paid_before(issued_before, batch_size=1000, pause=0):
+    """
+    Move paid invoices issued before ``issued_before`` to ArchivedInvoice.
+
+    Each batch is locked (skipping rows another writer holds), copied and
+    deleted in one short transaction, pausing ``pause`` seconds between
+    batches.
+
+    Returns:
+        int: The number of invoices archived.
+    """
+    archived = 0
+    while True:
+        started = time.perf_counter()
+        with transaction.atomic():
+            rows = list(
+                Invoice.objects.select_for_update(skip_locked=True)
+                .filter(status="paid", issue_date__lt=issued_before)
+                .order_by("id")
+                .values(*ARCHIVED_FIELDS)[:batch_size]
+            )
+            if not rows:
+                return archived
+            ArchivedInvoice.objects.bulk_create(
+                [ArchivedInvoice(**row) for row in rows], ignore_conflicts=True
+            )
+            Invoice.objects.filter(id__in=[row["id"] for row in rows]).delete()
+        archived += len(rows)
+        telemetry.record_chunk(
+            time.perf_counter() - started, scanned=len(rows), changed=len(rows)
+        )
+        if len(rows) < batch_size:
+            return archived
+        if pause:
+            time.sleep(pause)
@@ -0,0 +1,85 @@
+"""
+Two-tier cache for the plan catalog.
+
+Plans rarely change, so the serialized catalog is kept in a per-process
+dictionary in front of the shared Redis cache. Both tiers are keyed by a
+catalog version stored in the shared cache; saving or deleting a Plan
+bumps the version, so every web and Celery process drops its copy on its
+next lookup.
+"""
+
+# pylint:disable=E1101
+import time
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from .models import Plan
+from .serializers import PlanSerializer
+
+VERSION_KEY = "billing:plan-catalog:version"
+CATALOG_KEY = "billing:plan-catalog:{version}"
+
+# (version, plans) held by this process; replaced as a whole, never mutated.
+_snapshot = (None, None)
+
+
+def _new_version():
+    # Time-based so that a version lost from the shared cache is never reused.
+    return time.time_ns()
+
+
+def catalog_version():
+    """Return the current catalog version, initialising it if needed."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, _new_version(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate_catalog():
+    """Bump the catalog version so every process reloads the catalog."""
+    global _snapshot  # pylint:disable=W0603
+    cache.set(VERSION_KEY, _new_version(), timeout=None)
+    _snapshot = (None, None)
+
+
+def get_catalog():
+    """
+    Return the plan catalog as ``{plan_id: serialized_plan}``.
+
+    Served from the process dictionary when its version is current, then
+    from the shared cache, and only then from the database.
+    """
+    global _snapshot  # pylint:disable=W0603
+    version = catalog_version()
+    local_version, local_plans = _snapshot
+    if local_version == version:
+        return local_plans
+
+    key = CATALOG_KEY.format(version=version)
+    plans = cache.get(key)
+    if plans is None:
+        plans = {
+            plan["id"]: dict(plan)
+            for plan in PlanSerializer(Plan.objects.order_by("id"), many=True).data
+        }
+        cache.set(key, plans, getattr(settings, "BILLING_PLAN_CATALOG_TTL", 86400))
+
+    _snapshot = (version, plans)
+    return plans
+
+
+def list_plans():
+    """All plans, serialized, ordered by id."""
+    return list(get_catalog().values())
+
+
+def get_plan(plan_id):
+    """The serialized plan with ``plan_id``, or None."""
+    return get_catalog().get(plan_id)
+
+
+def plan_prices():
+    """Map each plan id to its price."""
+    return {plan_id: Decimal(plan["price"]) for plan_id, plan in get_catalog().items()}
@@ -0,0 +1,93 @@
+"""
+Microbenchmark for the invoice read path.
+
+Seeds invoices inside a transaction that is rolled back afterwards, then
+serializes them with InvoiceSerializer and with the values()-based
+ValuesReader and reports rows per second for each.
+"""
+
+# pylint:disable=E1101
+import time
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from billingapp.models import User, Plan, Subscription, Invoice
+from billingapp.serializers import InvoiceSerializer, ValuesReader
+
+
+class Command(BaseCommand):
+    """Compare ModelSerializer and ValuesReader throughput."""
+
+    help = "Benchmark invoice serialization: ModelSerializer vs values() fast path."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = self._seed(options["rows"])
+            # Only the seeded rows, whatever else the table holds.
+            queryset = Invoice.objects.filter(user=user).order_by("id")
+            reader = ValuesReader(InvoiceSerializer)
+
+            timings = {
+                "serializer": self._best_of(
+                    options["repeat"],
+                    lambda: InvoiceSerializer(queryset.all(), many=True).data,
+                ),
+                "values": self._best_of(
+                    options["repeat"],
+                    lambda: reader.serialize(reader.values(queryset.all())),
+                ),
+            }
+            transaction.set_rollback(True)
+
+        for name, (elapsed, rows) in timings.items():
+            self.stdout.write(
+                f"{name:<10} {rows} rows in {elapsed:.3f}s "
+                f"({rows / elapsed:,.0f} rows/s)"
+            )
+        self.stdout.write(
+            f"speedup    {timings['serializer'][0] / timings['values'][0]:.1f}x"
+        )
+
+    @staticmethod
+    def _best_of(repeat, func):
+        """Best time of ``repeat`` calls and the number of rows serialized."""
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = len(func())
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, rows
+
+    @staticmethod
+    def _seed(rows):
+        """Create ``rows`` paid invoices for a new user and return the user."""
+        plan, _ = Plan.objects.get_or_create(name="basic", defaults={"price": 100})
+        user = User.objects.create(username=f"bench-read-{time.time_ns()}")
+        sub = Subscription.objects.create(
+            user=user,
+            plan=plan,
+            status="expired",
+            start_date=date(2000, 1, 1),
+            end_date=date(2000, 1, 1),
+        )
+        Invoice.objects.bulk_create(
+            (
+                Invoice(
+                    user=user,
+                    plan=plan,
+                    subscription=sub,
+                    amount=plan.price,
+                    issue_date=date(2000, 1, 1) + timedelta(days=i),
+                    due_date=date(2000, 1, 8) + timedelta(days=i),
+                    status="paid",
+                )
+                for i in range(rows)
+            ),
+            batch_size=1000,
+        )
+        return user
@@ -0,0 +1,239 @@
+"""
+Benchmark the billing Celery tasks against seeded data.
+
+Bulk-seeds users, plans, subscriptions and invoices with realistic status
+and date distributions, runs generate_daily_invoices, mark_overdue_invoices
+and send_pending_invoice_reminders eagerly, and reports wall time, query
+count and rows per second for each as JSON, so results can be compared
+between commits.
+
+The seed is committed and the tasks run as they do in production,
+committing each chunk and applying the summary deltas on commit, so the
+timings include that work. The tasks act on every row in the database,
+so the command refuses to run against one that already holds
+subscriptions or invoices. Unless ``--keep`` is given, the seeded rows
+and the runs' telemetry are deleted afterwards.
+"""
+
+# pylint:disable=E1101
+import json
+import random
+import time
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils.timezone import now
+from billingapp.billing import add_months
+from billingapp.models import User, Plan, Subscription, Invoice, TaskRun
+from billingapp.reports import reconcile
+from billingapp.tasks import (
+    generate_daily_invoices,
+    mark_overdue_invoices,
+    send_pending_invoice_reminders,
+)
+
+TASKS = [
+    ("generate_daily_invoices", generate_daily_invoices),
+    ("mark_overdue_invoices", mark_overdue_invoices),
+    ("send_pending_invoice_reminders", send_pending_invoice_reminders),
+]
+
+SUBSCRIPTION_STATUSES = (["active"] * 16) + (["cancelled"] * 3) + ["expired"]
+
+
+class Command(BaseCommand):
+    """Seed billing data and time the billing tasks."""
+
+    help = "Seed billing data and report task timings, query counts and throughput as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000)
+        parser.add_argument("--plans", type=int, default=3)
+        parser.add_argument(
+            "--invoices-per-subscription",
+            type=int,
+            default=6,
+            help="Historical invoices seeded per subscription.",
+        )
+        parser.add_argument(
+            "--due-fraction",
+            type=float,
+            default=0.05,
+            help="Share of active subscriptions due for billing today or earlier.",
+        )
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the JSON report to this file.")
+        parser.add_argument(
+            "--keep", action="store_true", help="Keep the seeded rows instead of deleting them."
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        report = {"database": connection.vendor, "options": {
+            key: options[key]
+            for key in ("users", "plans", "invoices_per_subscription", "due_fraction", "seed")
+        }}
+
+        if Subscription.objects.exists() or Invoice.objects.exists():
+            raise CommandError(
+                "The database already holds subscriptions or invoices, which the "
+                "benchmarked tasks would change; run against an empty database."
+            )
+
+        self.run = f"bench{time.time_ns() % 10**8}"
+        self.created_plans = []
+        self.task_ids = []
+        try:
+            with transaction.atomic():
+                started = time.perf_counter()
+                report["seed"] = self._seed(options)
+                report["seed"]["seconds"] = round(time.perf_counter() - started, 3)
+                # Seeding bypasses the summary hooks.
+                reconcile()
+
+            report["tasks"] = {}
+            with override_settings(
+                BILLING_REMINDER_BACKEND="billingapp.notifications.LocMemReminderBackend",
+                BILLING_OVERDUE_CHUNK_PAUSE=0,
+            ):
+                for name, task in TASKS:
+                    report["tasks"][name] = self._run(task)
+        finally:
+            if not options["keep"]:
+                self._clean_up()
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as stream:
+                stream.write(output + "\n")
+        self.stdout.write(output)
+
+    def _clean_up(self):
+        """Delete the seeded users (and with them their billing rows) and plans."""
+        users = User.objects.filter(username__startswith=f"{self.run}-")
+        while True:
+            with transaction.atomic():
+                batch = list(users.values_list("id", flat=True)[: self.batch_size])
+                if not batch:
+                    break
+                User.objects.filter(id__in=batch).delete()
+        Plan.objects.filter(id__in=self.created_plans).delete()
+        TaskRun.objects.filter(task_id__in=self.task_ids).delete()
+        reconcile()
+
+    def _run(self, task):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            run = task.apply()
+            result = run.get()
+            elapsed = time.perf_counter() - started
+        self.task_ids.append(run.id)
+        rows = int(str(result).split()[0])
+        return {
+            "result": result,
+            "seconds": round(elapsed, 4),
+            "queries": len(queries),
+            "rows": rows,
+            "rows_per_second": round(rows / elapsed, 1) if elapsed else None,
+        }
+
+    def _seed(self, options):
+        today = now().date()
+        run = self.run
+        plans = self._plans(options["plans"])
+
+        password = make_password(None)
+        User.objects.bulk_create(
+            (
+                User(username=f"{run}-{i}", email=f"{run}-{i}@example.com", password=password)
+                for i in range(options["users"])
+            ),
+            batch_size=self.batch_size,
+        )
+        user_ids = list(
+            User.objects.filter(username__startswith=f"{run}-").values_list("id", flat=True)
+        )
+
+        subscriptions = []
+        for user_id in user_ids:
+            start_date = today - timedelta(days=self.rng.randint(0, 730))
+            status = self.rng.choice(SUBSCRIPTION_STATUSES)
+            if status == "active" and self.rng.random() < options["due_fraction"]:
+                # Due today, or a few missed days back.
+                next_billing_date = today - timedelta(days=self.rng.choice([0, 0, 0, 1, 2]))
+            else:
+                next_billing_date = today + timedelta(days=self.rng.randint(1, 30))
+            subscriptions.append(
+                Subscription(
+                    user_id=user_id,
+                    plan=self.rng.choice(plans),
+                    start_date=start_date,
+                    end_date=start_date + timedelta(days=1095),
+                    status=status,
+                    billing_interval="yearly" if self.rng.random() < 0.1 else "monthly",
+                    next_billing_date=next_billing_date,
+                )
+            )
+        Subscription.objects.bulk_create(subscriptions, batch_size=self.batch_size)
+        subscription_count = len(subscriptions)
+        subscriptions = Subscription.objects.filter(user_id__in=user_ids).values_list(
+            "id", "user_id", "plan_id", "start_date"
+        )
+
+        prices = {plan.id: plan.price for plan in plans}
+        invoice_count = 0
+        batch = []
+        for sub_id, user_id, plan_id, start_date in subscriptions.iterator():
+            for month in range(options["invoices_per_subscription"]):
+                issue_date = add_months(start_date, month)
+                if issue_date > today:
+                    break
+                due_date = issue_date + timedelta(days=7)
+                roll = self.rng.random()
+                if due_date >= today or roll < 0.1:
+                    status = "pending"
+                elif roll < 0.2:
+                    status = "overdue"
+                else:
+                    status = "paid"
+                batch.append(
+                    Invoice(
+                        user_id=user_id,
+                        plan_id=plan_id,
+                        subscription_id=sub_id,
+                        amount=prices[plan_id],
+                        issue_date=issue_date,
+                        due_date=due_date,
+                        status=status,
+                    )
+                )
+            if len(batch) >= self.batch_size:
+                Invoice.objects.bulk_create(batch)
+                invoice_count += len(batch)
+                batch = []
+        Invoice.objects.bulk_create(batch)
+        invoice_count += len(batch)
+
+        return {
+            "users": len(user_ids),
+            "plans": len(plans),
+            "subscriptions": subscription_count,
+            "invoices": invoice_count,
+        }
+
+    def _plans(self, count):
+        names = [name for name, _ in Plan.PLAN_CHOICES]
+        names += [f"bench-plan-{i}" for i in range(len(names), count)]
+        plans = []
+        for i, name in enumerate(names[:count]):
+            plan, created = Plan.objects.get_or_create(
+                name=name, defaults={"price": 100 * (i + 1)}
+            )
+            if created:
+                self.created_plans.append(plan.id)
+            plans.append(plan)
+        return plans
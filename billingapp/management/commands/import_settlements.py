@@ -0,0 +1,136 @@
+"""
+Bulk-apply a bank or Stripe settlement file to invoices.
+
+The file is streamed row by row, so it is never held in memory. Rows are
+checked against ``Invoice.amount`` a chunk at a time, and matching unpaid
+invoices are marked paid with one set-based update per chunk.
+
+Accepted formats are CSV with an ``invoice_id,amount,paid_at`` header, and
+JSONL with one ``{"invoice_id": ..., "amount": ..., "paid_at": ...}`` object
+per line. ``paid_at`` is an ISO 8601 date or datetime.
+"""
+
+# pylint:disable=E1101
+import csv
+import json
+from collections import Counter
+from datetime import datetime, time
+from decimal import Decimal, InvalidOperation
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from billingapp.billing import mark_invoices_paid
+from billingapp.models import Invoice
+
+
+def parse_paid_at(value):
+    """Parse an ISO date or datetime into an aware datetime."""
+    paid_at = parse_datetime(value)
+    if paid_at is None:
+        paid_date = parse_date(value)
+        if paid_date is None:
+            raise ValueError(f"invalid paid_at {value!r}")
+        paid_at = datetime.combine(paid_date, time.min)
+    if timezone.is_naive(paid_at):
+        paid_at = timezone.make_aware(paid_at)
+    return paid_at
+
+
+class Command(BaseCommand):
+    """Mark invoices paid from a settlement file."""
+
+    help = "Stream a CSV/JSONL settlement file and mark matching invoices paid."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Settlement file (.csv or .jsonl).")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="File format; inferred from the extension by default.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Validate and count without updating invoices.",
+        )
+
+    def handle(self, *args, **options):
+        file_format = options["format"] or (
+            "jsonl" if options["path"].endswith((".jsonl", ".json")) else "csv"
+        )
+        chunk_size = options["chunk_size"]
+        self.dry_run = options["dry_run"]
+        self.verbose = options["verbosity"] > 1
+        self.counts = Counter(matched=0, mismatched=0, already_paid=0, missing=0, invalid=0)
+
+        try:
+            with open(options["path"], newline="", encoding="utf-8") as stream:
+                chunk = []
+                for row in self._rows(stream, file_format):
+                    chunk.append(row)
+                    if len(chunk) >= chunk_size:
+                        self._apply(chunk)
+                        chunk = []
+                if chunk:
+                    self._apply(chunk)
+        except OSError as err:
+            raise CommandError(str(err)) from err
+
+        for key in ("matched", "mismatched", "already_paid", "missing", "invalid"):
+            self.stdout.write(f"{key}: {self.counts[key]}")
+
+    def _rows(self, stream, file_format):
+        """Yield (line, invoice_id, amount, paid_at); count unparseable rows."""
+        if file_format == "csv":
+            records = csv.DictReader(stream)
+        else:
+            records = (line for line in stream if line.strip())
+        for line, record in enumerate(records, start=1):
+            try:
+                if isinstance(record, str):
+                    record = json.loads(record)
+                yield (
+                    line,
+                    int(record["invoice_id"]),
+                    Decimal(str(record["amount"])),
+                    parse_paid_at(str(record["paid_at"])),
+                )
+            except (KeyError, TypeError, ValueError, InvalidOperation):
+                self.counts["invalid"] += 1
+                if self.verbose:
+                    self.stderr.write(f"row {line}: invalid record {record!r}")
+
+    def _apply(self, chunk):
+        """Validate one chunk against the invoices and mark the matches paid."""
+        invoices = {
+            invoice_id: (amount, status)
+            for invoice_id, amount, status in Invoice.objects.filter(
+                id__in={row[1] for row in chunk}
+            ).values_list("id", "amount", "status")
+        }
+        to_pay = {}
+        for line, invoice_id, amount, paid_at in chunk:
+            if invoice_id not in invoices:
+                self.counts["missing"] += 1
+            elif invoices[invoice_id][1] == "paid" or invoice_id in to_pay:
+                self.counts["already_paid"] += 1
+            elif invoices[invoice_id][0] != amount:
+                self.counts["mismatched"] += 1
+                if self.verbose:
+                    self.stderr.write(
+                        f"row {line}: invoice {invoice_id} amount {amount} "
+                        f"!= {invoices[invoice_id][0]}"
+                    )
+            else:
+                to_pay[invoice_id] = paid_at
+
+        if self.dry_run:
+            self.counts["matched"] += len(to_pay)
+            return
+        with transaction.atomic():
+            changed = mark_invoices_paid(to_pay)
+        self.counts["matched"] += changed
+        # Invoices paid by someone else since they were read.
+        self.counts["already_paid"] += len(to_pay) - changed
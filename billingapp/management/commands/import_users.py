@@ -0,0 +1,165 @@
+"""
+Bulk-import users, e.g. when migrating from a legacy system.
+
+The file is streamed and imported a chunk at a time. Plain passwords in a
+chunk are hashed across a pool of worker processes, one per core by
+default, since hashing dominates the import; the chunk is then inserted
+with one ``bulk_create``. Passwords already hashed in a format Django
+understands (``password_hash``) are stored as they are, and users with
+neither get an unusable password.
+
+Accepted formats are CSV with a header naming any of ``username``,
+``email``, ``first_name``, ``last_name``, ``password`` and
+``password_hash``, and JSONL with one object per line with the same keys.
+Only ``username`` is required.
+"""
+
+# pylint:disable=E1101
+import csv
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+from django.db import transaction
+from billingapp.models import User
+
+FIELDS = ("username", "email", "first_name", "last_name")
+
+
+class Command(BaseCommand):
+    """Create users from a user file."""
+
+    help = "Stream a CSV/JSONL user file and bulk-create users, hashing passwords in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="User file (.csv or .jsonl).")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="File format; inferred from the extension by default.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Processes hashing passwords; 1 hashes in this process. Defaults to one per core.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Validate and count without hashing or creating users.",
+        )
+
+    def handle(self, *args, **options):
+        file_format = options["format"] or (
+            "jsonl" if options["path"].endswith((".jsonl", ".json")) else "csv"
+        )
+        chunk_size = options["chunk_size"]
+        self.dry_run = options["dry_run"]
+        self.verbose = options["verbosity"] > 1
+        self.counts = Counter(created=0, existing=0, invalid=0)
+        self.seen = set()
+
+        self.workers = options["workers"]
+        self.pool = None
+        if self.workers > 1 and not self.dry_run:
+            # Workers only hash, but need settings for PASSWORD_HASHERS.
+            self.pool = ProcessPoolExecutor(self.workers, initializer=django.setup)
+        try:
+            with open(options["path"], newline="", encoding="utf-8") as stream:
+                chunk = []
+                for row in self._rows(stream, file_format):
+                    chunk.append(row)
+                    if len(chunk) >= chunk_size:
+                        self._apply(chunk)
+                        chunk = []
+                if chunk:
+                    self._apply(chunk)
+        except OSError as err:
+            raise CommandError(str(err)) from err
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown()
+
+        for key in ("created", "existing", "invalid"):
+            self.stdout.write(f"{key}: {self.counts[key]}")
+
+    def _invalid(self, line, reason):
+        self.counts["invalid"] += 1
+        if self.verbose:
+            self.stderr.write(f"row {line}: {reason}")
+
+    def _rows(self, stream, file_format):
+        """Yield (line, fields, password, password_hash); count invalid rows."""
+        if file_format == "csv":
+            records = csv.DictReader(stream)
+        else:
+            records = (line for line in stream if line.strip())
+        for line, record in enumerate(records, start=1):
+            try:
+                if isinstance(record, str):
+                    record = json.loads(record)
+                fields = {field: str(record.get(field) or "").strip() for field in FIELDS}
+                password = str(record["password"]) if record.get("password") else None
+                password_hash = record.get("password_hash") or None
+            except (AttributeError, ValueError):
+                self._invalid(line, f"invalid record {record!r}")
+                continue
+            try:
+                if not fields["username"]:
+                    raise ValidationError("username is required")
+                User.username_validator(fields["username"])
+                if fields["email"]:
+                    validate_email(fields["email"])
+                if password_hash is not None:
+                    identify_hasher(password_hash)
+            except ValidationError as err:
+                self._invalid(line, "; ".join(err.messages))
+                continue
+            except ValueError:
+                self._invalid(line, "password_hash is not in a known format")
+                continue
+            yield line, fields, password, password_hash
+
+    def _hash(self, passwords):
+        """Hash ``passwords``, across the worker pool if there is one."""
+        if self.pool is None:
+            return [make_password(password) for password in passwords]
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        return list(self.pool.map(make_password, passwords, chunksize=chunksize))
+
+    def _apply(self, chunk):
+        """Skip existing usernames, hash the chunk's passwords and insert it."""
+        existing = set(
+            User.objects.filter(
+                username__in={fields["username"] for _, fields, _, _ in chunk}
+            ).values_list("username", flat=True)
+        )
+        new = []
+        for line, fields, password, password_hash in chunk:
+            if fields["username"] in existing or fields["username"] in self.seen:
+                self.counts["existing"] += 1
+                if self.verbose:
+                    self.stderr.write(f"row {line}: user {fields['username']!r} exists")
+                continue
+            self.seen.add(fields["username"])
+            new.append((fields, password, password_hash))
+
+        if self.dry_run:
+            self.counts["created"] += len(new)
+            return
+        plain = [password for _, password, password_hash in new if password_hash is None]
+        hashed = iter(self._hash(plain))
+        users = [
+            User(**fields, password=password_hash or next(hashed))
+            for fields, _, password_hash in new
+        ]
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+        self.counts["created"] += len(users)
@@ -0,0 +1,154 @@
+"""
+Per-request query and timing instrumentation.
+
+``QueryTimingMiddleware`` records every SQL statement a request runs, then
+reports the query count, time spent in the database and time spent in the
+view. With ``BILLING_SERVER_TIMING`` on, the numbers are added to the
+response as ``Server-Timing`` metrics so they show up in the browser's
+network panel. Requests slower than ``BILLING_SLOW_REQUEST_MS`` or running
+more than ``BILLING_SLOW_REQUEST_QUERIES`` queries are logged, and a
+statement repeated ``BILLING_REPEATED_QUERY_THRESHOLD`` times or more is
+logged as a likely N+1.
+
+Statements are seen through ``record_query``, an execute wrapper installed
+on every database connection when it is opened. It reports to whichever
+recorders are active in the current context; context variables follow the
+request into the threads that run async ORM calls, so async views are
+measured too. Queries issued while a streaming response is consumed happen
+after the middleware returns and are not counted.
+"""
+
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_recorders = ContextVar("billing_query_recorders", default=())
+
+
+class QueryRecorder:
+    """
+    The statements run while recording, with their durations.
+
+    Statements are kept with their placeholders, so the same query run with
+    different parameters counts as a repeat.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    @property
+    def count(self):
+        """Number of statements executed."""
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        """Seconds spent executing statements."""
+        return sum(duration for _, duration in self.queries)
+
+    def repeated(self, threshold):
+        """
+        Statements executed at least ``threshold`` times.
+
+        Returns:
+            dict: Maps the statement to how often it ran, most frequent first.
+        """
+        return {
+            sql: times
+            for sql, times in Counter(sql for sql, _ in self.queries).most_common()
+            if times >= threshold
+        }
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper passing each statement to the active recorders."""
+    recorders = _recorders.get()
+    if not recorders:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        for recorder in recorders:
+            recorder.queries.append((sql, duration))
+
+
+@contextmanager
+def recording(recorder):
+    """Record the statements run in this context (and nested ones) into ``recorder``."""
+    token = _recorders.set(_recorders.get() + (recorder,))
+    try:
+        yield recorder
+    finally:
+        _recorders.reset(token)
+
+
+class QueryTimingMiddleware:
+    """Measure the queries and time each request takes, under WSGI or ASGI."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with recording(recorder):
+            response = self.get_response(request)
+        return self.report(request, response, recorder, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with recording(recorder):
+            response = await self.get_response(request)
+        return self.report(request, response, recorder, time.perf_counter() - started)
+
+    @staticmethod
+    def report(request, response, recorder, total):
+        """Add the Server-Timing header and log slow requests and likely N+1s."""
+        db_time = recorder.duration
+        if getattr(settings, "BILLING_SERVER_TIMING", False):
+            response["Server-Timing"] = ", ".join(
+                [
+                    f'db;dur={db_time * 1000:.1f};desc="{recorder.count} queries"',
+                    f"app;dur={(total - db_time) * 1000:.1f}",
+                    f"total;dur={total * 1000:.1f}",
+                ]
+            )
+
+        if total * 1000 >= getattr(
+            settings, "BILLING_SLOW_REQUEST_MS", 500
+        ) or recorder.count > getattr(settings, "BILLING_SLOW_REQUEST_QUERIES", 50):
+            logger.warning(
+                "Slow request %s %s: %.1f ms, %d queries, %.1f ms in the database",
+                request.method,
+                request.path,
+                total * 1000,
+                recorder.count,
+                db_time * 1000,
+            )
+
+        threshold = getattr(settings, "BILLING_REPEATED_QUERY_THRESHOLD", 5)
+        for sql, times in recorder.repeated(threshold).items():
+            logger.warning(
+                "Likely N+1 on %s %s: query ran %d times: %s",
+                request.method,
+                request.path,
+                times,
+                sql,
+            )
+        return response
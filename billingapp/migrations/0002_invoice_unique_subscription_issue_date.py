@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-17 04:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billingapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='invoice',
+            constraint=models.UniqueConstraint(fields=('subscription', 'issue_date'), name='unique_invoice_per_subscription_issue_date'),
+        ),
+    ]
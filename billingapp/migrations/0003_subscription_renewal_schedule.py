@@ -0,0 +1,62 @@
+# Generated by Django 5.2.1 on 2026-10-17 04:25
+
+import calendar
+from datetime import date
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def _add_months(day, months, anchor_day):
+    month_index = day.month - 1 + months
+    year = day.year + month_index // 12
+    month = month_index % 12 + 1
+    return date(year, month, min(anchor_day, calendar.monthrange(year, month)[1]))
+
+
+def backfill_next_billing_date(apps, schema_editor):
+    """
+    Schedule existing subscriptions from their next monthly anniversary.
+
+    Subscriptions that have not started yet bill on their start date; the
+    rest were already invoiced on their start date, so they resume on the
+    first anniversary on or after today instead of back-billing history.
+    """
+    Subscription = apps.get_model("billingapp", "Subscription")
+    today = timezone.now().date()
+    Subscription.objects.filter(start_date__gte=today).update(
+        next_billing_date=models.F("start_date")
+    )
+    pending = []
+    for sub in Subscription.objects.filter(start_date__lt=today).only("id", "start_date").iterator():
+        start = sub.start_date
+        months = max((today.year - start.year) * 12 + today.month - start.month, 1)
+        if _add_months(start, months, start.day) < today:
+            months += 1
+        sub.next_billing_date = _add_months(start, months, start.day)
+        pending.append(sub)
+        if len(pending) >= 1000:
+            Subscription.objects.bulk_update(pending, ["next_billing_date"])
+            pending = []
+    Subscription.objects.bulk_update(pending, ["next_billing_date"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billingapp', '0002_invoice_unique_subscription_issue_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='billing_interval',
+            field=models.CharField(choices=[('monthly', 'Monthly'), ('yearly', 'Yearly')], default='monthly', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='subscription',
+            name='next_billing_date',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(backfill_next_billing_date, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-17 04:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billingapp', '0003_subscription_renewal_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='reminder_sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-17 04:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billingapp', '0005_billing_indexes_and_active_subscription_constraint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['-issue_date', '-id'], name='invoice_page_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['user', '-issue_date', '-id'], name='invoice_user_page_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['-created_at', '-id'], name='subscription_page_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='subscription_user_page_idx'),
+        ),
+    ]
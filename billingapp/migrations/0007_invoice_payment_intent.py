@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-17 04:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billingapp', '0006_list_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='payment_client_secret',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='payment_intent_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-17 04:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billingapp', '0008_stripe_event_inbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='paid_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-17 04:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billingapp', '0009_invoice_paid_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_name', models.CharField(max_length=100)),
+                ('task_id', models.CharField(blank=True, max_length=255)),
+                ('status', models.CharField(choices=[('success', 'Success'), ('failure', 'Failure')], max_length=20)),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField()),
+                ('duration', models.FloatField(help_text='Seconds')),
+                ('rows_scanned', models.PositiveBigIntegerField(default=0)),
+                ('rows_changed', models.PositiveBigIntegerField(default=0)),
+                ('chunks', models.PositiveIntegerField(default=0)),
+                ('max_chunk_duration', models.FloatField(default=0, help_text='Seconds')),
+                ('error', models.TextField(blank=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['task_name', '-id'], name='task_run_task_idx'), models.Index(fields=['started_at'], name='task_run_started_idx')],
+            },
+        ),
+    ]
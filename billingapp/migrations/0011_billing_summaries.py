@@ -0,0 +1,68 @@
+# Generated by Django 5.2.1 on 2026-10-17 04:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def build_summaries(apps, schema_editor):
+    """Fill the summary tables from the existing subscriptions and invoices."""
+    Subscription = apps.get_model("billingapp", "Subscription")
+    Invoice = apps.get_model("billingapp", "Invoice")
+    PlanSubscriptionSummary = apps.get_model("billingapp", "PlanSubscriptionSummary")
+    ReceivableBalance = apps.get_model("billingapp", "ReceivableBalance")
+    PlanSubscriptionSummary.objects.bulk_create(
+        PlanSubscriptionSummary(
+            plan_id=row["plan_id"],
+            billing_interval=row["billing_interval"],
+            active_subscriptions=row["active"],
+        )
+        for row in Subscription.objects.filter(status="active")
+        .values("plan_id", "billing_interval")
+        .annotate(active=Count("id"))
+        .order_by()
+    )
+    ReceivableBalance.objects.bulk_create(
+        (
+            ReceivableBalance(due_date=row["due_date"], invoices=row["unpaid"], amount=row["total"])
+            for row in Invoice.objects.exclude(status="paid")
+            .values("due_date")
+            .annotate(unpaid=Count("id"), total=Sum("amount"))
+            .order_by()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billingapp', '0010_task_run'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceivableBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('due_date', models.DateField(unique=True)),
+                ('invoices', models.IntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PlanSubscriptionSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('billing_interval', models.CharField(choices=[('monthly', 'Monthly'), ('yearly', 'Yearly')], max_length=20)),
+                ('active_subscriptions', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='billingapp.plan')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('plan', 'billing_interval'), name='unique_plan_subscription_summary')],
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-17 04:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billingapp', '0011_billing_summaries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedInvoice',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('issue_date', models.DateField()),
+                ('due_date', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('paid', 'Paid'), ('overdue', 'Overdue')], max_length=20)),
+                ('reminder_sent_at', models.DateTimeField(blank=True, null=True)),
+                ('paid_at', models.DateTimeField(blank=True, null=True)),
+                ('payment_intent_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('plan', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='billingapp.plan')),
+                ('subscription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='billingapp.subscription')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-issue_date', '-id'], name='archived_invoice_page_idx'), models.Index(fields=['user', '-issue_date', '-id'], name='archived_invoice_user_page_idx')],
+            },
+        ),
+    ]
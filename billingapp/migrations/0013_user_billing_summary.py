@@ -0,0 +1,52 @@
+# Generated by Django 5.2.1 on 2026-10-17 05:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def build_user_summaries(apps, schema_editor):
+    """Fill the per-user summaries from the existing unpaid invoices."""
+    Invoice = apps.get_model("billingapp", "Invoice")
+    UserBillingSummary = apps.get_model("billingapp", "UserBillingSummary")
+    UserBillingSummary.objects.bulk_create(
+        (
+            UserBillingSummary(
+                user_id=row["user_id"],
+                pending_invoices=row["pending"],
+                overdue_invoices=row["overdue"],
+                outstanding_amount=row["total"],
+            )
+            for row in Invoice.objects.exclude(status="paid")
+            .values("user_id")
+            .annotate(
+                pending=Count("id", filter=Q(status="pending")),
+                overdue=Count("id", filter=Q(status="overdue")),
+                total=Sum("amount"),
+            )
+            .order_by()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billingapp', '0012_archived_invoice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserBillingSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='billing_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('pending_invoices', models.IntegerField(default=0)),
+                ('overdue_invoices', models.IntegerField(default=0)),
+                ('outstanding_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(build_user_summaries, migrations.RunPython.noop),
+    ]
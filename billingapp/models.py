@@ -1,7 +1,7 @@
 """This module hold all the models for billing app"""
 
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 
 
@@ -26,27 +26,105 @@ class Plan(models.Model):
         return str(self.name)
 
 
-class Subscription(models.Model):
+class SummarizedQuerySet(models.QuerySet):
+    """Deletes that report the rows they remove to the billing summaries."""
+
+    def delete(self):
+        # billingapp.reports imports the models.
+        from .reports import deleting  # pylint:disable=C0415
+
+        with transaction.atomic(using=self.db, savepoint=False):
+            deleting(self.model, self)
+            return super().delete()
+
+
+class SummarizedModel(models.Model):
+    """
+    A model the billing summaries follow (see billingapp.reports).
+
+    Deletes are reported to the summaries with one grouped query instead of
+    per-row signals, so bulk deletes stay set-based. Saves are followed by
+    signals that compare the summarized fields with the values the instance
+    was loaded with, kept here so a save does not re-read the row.
+    """
+
+    objects = SummarizedQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))  # pylint:disable=W0201
+        return instance
+
+    def delete(self, using=None, keep_parents=False):
+        from .reports import deleting  # pylint:disable=C0415
+
+        with transaction.atomic(using=using, savepoint=False):
+            deleting(type(self), type(self).objects.filter(pk=self.pk))
+            return super().delete(using=using, keep_parents=keep_parents)
+
+
+class Subscription(SummarizedModel):
     """Subscription model"""
     STATUS_CHOICES = [
         ("active", "Active"),
         ("cancelled", "Cancelled"),
         ("expired", "Expired"),
     ]
+    BILLING_INTERVAL_CHOICES = [
+        ("monthly", "Monthly"),
+        ("yearly", "Yearly"),
+    ]
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     plan = models.ForeignKey(Plan, on_delete=models.CASCADE)
     start_date = models.DateField()
     end_date = models.DateField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="active")
+    billing_interval = models.CharField(
+        max_length=20, choices=BILLING_INTERVAL_CHOICES, default="monthly"
+    )
+    # Date of the next invoice; maintained by the renewal engine.
+    next_billing_date = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "status"], name="subscription_user_status_idx"),
+            # Cursor pagination order, for admins and per user.
+            models.Index(fields=["-created_at", "-id"], name="subscription_page_idx"),
+            models.Index(
+                fields=["user", "-created_at", "-id"], name="subscription_user_page_idx"
+            ),
+            # Renewal scan: active subscriptions with next_billing_date <= today.
+            models.Index(
+                fields=["next_billing_date"],
+                condition=models.Q(status="active"),
+                name="subscription_active_renew_idx",
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user"],
+                condition=models.Q(status="active"),
+                name="unique_active_subscription_per_user",
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.next_billing_date is None:
+            self.next_billing_date = self.start_date
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.user.username} - {self.plan.name}"
 
 
-class Invoice(models.Model):
+class Invoice(SummarizedModel):
     """Invoice model"""
     STATUS_CHOICES = [
         ("pending", "Pending"),
@@ -61,8 +139,198 @@ class Invoice(models.Model):
     issue_date = models.DateField()
     due_date = models.DateField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    reminder_sent_at = models.DateTimeField(null=True, blank=True)
+    paid_at = models.DateTimeField(null=True, blank=True)
+    payment_intent_id = models.CharField(max_length=255, null=True, blank=True)
+    payment_client_secret = models.CharField(max_length=255, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "status"], name="invoice_user_status_idx"),
+            models.Index(fields=["status", "due_date"], name="invoice_status_due_idx"),
+            # Cursor pagination order, for admins and per user.
+            models.Index(fields=["-issue_date", "-id"], name="invoice_page_idx"),
+            models.Index(fields=["user", "-issue_date", "-id"], name="invoice_user_page_idx"),
+            # Overdue and reminder scans only ever look at pending invoices.
+            models.Index(
+                fields=["due_date"],
+                condition=models.Q(status="pending"),
+                name="invoice_pending_due_idx",
+            ),
+        ]
+        constraints = [
+            # One invoice per subscription per issue date keeps invoice
+            # generation idempotent without a per-row existence check.
+            models.UniqueConstraint(
+                fields=["subscription", "issue_date"],
+                name="unique_invoice_per_subscription_issue_date",
+            ),
+        ]
+
     def __str__(self):
         return f"Invoice {self.id} for {self.user.username} - {self.status}"
+
+
+class ArchivedInvoice(models.Model):
+    """
+    A paid invoice moved out of the invoice table by archive_paid_invoices.
+
+    Keeps the invoice's id and columns, except the Stripe client secret, so
+    archived invoices read like live ones.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    plan = models.ForeignKey(Plan, on_delete=models.SET_NULL, null=True)
+    subscription = models.ForeignKey(Subscription, on_delete=models.CASCADE)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    issue_date = models.DateField()
+    due_date = models.DateField()
+    status = models.CharField(max_length=20, choices=Invoice.STATUS_CHOICES)
+    reminder_sent_at = models.DateTimeField(null=True, blank=True)
+    paid_at = models.DateTimeField(null=True, blank=True)
+    payment_intent_id = models.CharField(max_length=255, null=True, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Same cursor pagination order as live invoices.
+            models.Index(fields=["-issue_date", "-id"], name="archived_invoice_page_idx"),
+            models.Index(
+                fields=["user", "-issue_date", "-id"], name="archived_invoice_user_page_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"Archived invoice {self.id} - {self.status}"
+
+
+class StripeEvent(models.Model):
+    """
+    Inbox of verified Stripe webhook events.
+
+    Events are stored as received and applied later in batches by the
+    process_stripe_events task; the unique event_id makes retried and
+    replayed deliveries no-ops.
+    """
+
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(processed_at__isnull=True),
+                name="stripe_event_unprocessed_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.type} {self.event_id}"
+
+
+class TaskRun(models.Model):
+    """
+    One run of a billing Celery task, recorded by billingapp.telemetry.
+
+    Rows scanned and changed, and the chunk count and slowest chunk, are
+    reported by the task as it works; the rest comes from Celery's task
+    signals.
+    """
+    STATUS_CHOICES = [
+        ("success", "Success"),
+        ("failure", "Failure"),
+    ]
+
+    task_name = models.CharField(max_length=100)
+    task_id = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField()
+    duration = models.FloatField(help_text="Seconds")
+    rows_scanned = models.PositiveBigIntegerField(default=0)
+    rows_changed = models.PositiveBigIntegerField(default=0)
+    chunks = models.PositiveIntegerField(default=0)
+    max_chunk_duration = models.FloatField(default=0, help_text="Seconds")
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["task_name", "-id"], name="task_run_task_idx"),
+            models.Index(fields=["started_at"], name="task_run_started_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.task_name} {self.status} at {self.started_at}"
+
+
+class PlanSubscriptionSummary(models.Model):
+    """
+    Active subscriptions per plan and billing interval, kept up to date by
+    billingapp.reports for MRR reporting.
+    """
+
+    plan = models.ForeignKey(Plan, on_delete=models.CASCADE)
+    billing_interval = models.CharField(
+        max_length=20, choices=Subscription.BILLING_INTERVAL_CHOICES
+    )
+    active_subscriptions = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["plan", "billing_interval"],
+                name="unique_plan_subscription_summary",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.plan_id} {self.billing_interval}: {self.active_subscriptions}"
+
+
+class ReceivableBalance(models.Model):
+    """
+    Unpaid invoices per due date, kept up to date by billingapp.reports for
+    receivables and aging reports.
+    """
+
+    due_date = models.DateField(unique=True)
+    invoices = models.IntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.due_date}: {self.invoices} unpaid, {self.amount}"
+
+
+class UserBillingSummary(models.Model):
+    """
+    A user's unpaid invoices, kept up to date by billingapp.reports in the
+    same transaction as each invoice change, for badges and summaries.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="billing_summary",
+    )
+    pending_invoices = models.IntegerField(default=0)
+    overdue_invoices = models.IntegerField(default=0)
+    outstanding_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return (
+            f"{self.user_id}: {self.pending_invoices} pending, "
+            f"{self.overdue_invoices} overdue, {self.outstanding_amount}"
+        )
@@ -0,0 +1,93 @@
+"""
+Notification backends for invoice reminders.
+
+The backend is selected with the ``BILLING_REMINDER_BACKEND`` setting, in the
+same way Django selects an email backend. Each backend receives reminders in
+batches and returns how many it delivered.
+"""
+
+import sys
+import threading
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Reminders delivered by LocMemReminderBackend, for use in tests.
+outbox = []
+
+
+class BaseReminderBackend:
+    """
+    Base class for reminder backends.
+
+    Subclasses implement ``send_reminders``.
+    """
+
+    def send_reminders(self, invoices):
+        """
+        Deliver a reminder for each invoice in the batch.
+
+        Args:
+            invoices (list[Invoice]): Pending invoices with ``user`` loaded.
+
+        Returns:
+            int: The number of reminders delivered.
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def format_reminder(invoice):
+        """Return the reminder text for an invoice."""
+        return (
+            f"[REMINDER] Invoice #{invoice.id} for user "
+            f"{invoice.user.username} is still pending. Due on {invoice.due_date}."
+        )
+
+
+class ConsoleReminderBackend(BaseReminderBackend):
+    """Write reminders to a stream, stdout by default."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self._lock = threading.RLock()
+
+    def send_reminders(self, invoices):
+        text = "".join(f"{self.format_reminder(invoice)}\n" for invoice in invoices)
+        with self._lock:
+            self.stream.write(text)
+            self.stream.flush()
+        return len(invoices)
+
+
+class FileReminderBackend(BaseReminderBackend):
+    """Append reminders to the file named by ``BILLING_REMINDER_FILE_PATH``."""
+
+    def __init__(self, file_path=None):
+        self.file_path = file_path or settings.BILLING_REMINDER_FILE_PATH
+
+    def send_reminders(self, invoices):
+        with open(self.file_path, "a", encoding="utf-8") as stream:
+            stream.writelines(
+                f"{self.format_reminder(invoice)}\n" for invoice in invoices
+            )
+        return len(invoices)
+
+
+class LocMemReminderBackend(BaseReminderBackend):
+    """Keep reminders in ``billingapp.notifications.outbox``."""
+
+    def send_reminders(self, invoices):
+        outbox.extend(self.format_reminder(invoice) for invoice in invoices)
+        return len(invoices)
+
+
+def get_reminder_backend(backend=None, **kwargs):
+    """Instantiate the configured reminder backend."""
+    backend_class = import_string(
+        backend
+        or getattr(
+            settings,
+            "BILLING_REMINDER_BACKEND",
+            "billingapp.notifications.ConsoleReminderBackend",
+        )
+    )
+    return backend_class(**kwargs)
@@ -0,0 +1,165 @@
+"""
+Keyset pagination for the billing list endpoints.
+
+Lists are ordered newest first by a (key, id) pair, and the cursor encodes
+the full pair of the row it points past. Each page is then a seek on the
+matching index, ``(key, id) < (cursor_key, cursor_id)``, so deep
+pages cost the same as the first one, however many rows share a key (a
+nightly renewal run issues thousands of invoices on one date).
+
+DRF's ``CursorPagination`` is not used because it only encodes the first
+ordering field and falls back to an OFFSET among rows sharing it.
+"""
+
+import base64
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class BillingKeysetPagination(BasePagination):
+    """
+    Pagination by a descending ``(key, id)`` keyset with a page size taken
+    from settings.
+
+    Clients may ask for a smaller or larger page with ``?page_size=``, capped
+    at ``BILLING_MAX_PAGE_SIZE``. Responses look like
+    ``{"next": ..., "previous": ..., "results": [...]}``.
+    """
+
+    # Descending (key, id); subclasses set the key.
+    ordering = None
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Invalid cursor"
+
+    def get_page_size(self, request):
+        max_page_size = getattr(settings, "BILLING_MAX_PAGE_SIZE", 500)
+        page_size = getattr(settings, "BILLING_PAGE_SIZE", 50)
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            requested = 0
+        if requested > 0:
+            page_size = requested
+        return min(page_size, max_page_size)
+
+    @property
+    def key(self):
+        """The field ordered on before the id."""
+        return self.ordering[0].lstrip("-")
+
+    def encode_cursor(self, row, backwards=False):
+        """Opaque cursor pointing past ``row``, forwards or backwards."""
+        direction = "p" if backwards else "n"
+        position = f"{direction}|{self._value(row, self.key)}|{self._value(row, 'id')}"
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, queryset, cursor):
+        """Return ``(backwards, key, id)`` from a cursor; NotFound if malformed."""
+        try:
+            direction, key, row_id = (
+                base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            )
+            key = queryset.model._meta.get_field(self.key).to_python(key)  # pylint:disable=W0212
+            if direction not in ("n", "p") or key is None:
+                raise ValueError(cursor)
+            return direction == "p", key, int(row_id)
+        except (ValidationError, ValueError) as err:
+            raise NotFound(self.invalid_cursor_message) from err
+
+    @staticmethod
+    def _value(row, field):
+        value = row[field] if isinstance(row, dict) else getattr(row, field)
+        return value.isoformat() if hasattr(value, "isoformat") else value
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_rows(queryset, request)))
+
+    def page_rows(self, queryset, request):
+        """
+        The slice of ``queryset`` holding the requested page and one row more.
+
+        ``paginate_queryset`` is this and ``set_page``; async callers fetch
+        the slice themselves in between.
+        """
+        self.request = request  # pylint:disable=W0201
+        self.page_size = self.get_page_size(request)  # pylint:disable=W0201
+        cursor = request.query_params.get(self.cursor_query_param)
+        self.backwards, self.position = False, None  # pylint:disable=W0201
+        if cursor:
+            self.backwards, *self.position = self.decode_cursor(queryset, cursor)
+
+        key, position = self.key, self.position
+        if position is None:
+            rows = queryset.order_by(f"-{key}", "-id")
+        elif self.backwards:
+            # (key, id) > position, with a leading range on key for the index.
+            rows = queryset.filter(
+                Q(**{f"{key}__gte": position[0]})
+                & (Q(**{f"{key}__gt": position[0]}) | Q(id__gt=position[1]))
+            ).order_by(key, "id")
+        else:
+            rows = queryset.filter(
+                Q(**{f"{key}__lte": position[0]})
+                & (Q(**{f"{key}__lt": position[0]}) | Q(id__lt=position[1]))
+            ).order_by(f"-{key}", "-id")
+        return rows[: self.page_size + 1]
+
+    def set_page(self, rows):
+        """Trim the rows fetched from ``page_rows`` to the page and set its cursors."""
+        more = len(rows) > self.page_size
+        page = rows[: self.page_size]
+
+        if self.backwards:
+            page.reverse()
+            has_next, has_previous = True, more
+        else:
+            has_next, has_previous = more, self.position is not None
+        self.next_cursor = (  # pylint:disable=W0201
+            self.encode_cursor(page[-1]) if page and has_next else None
+        )
+        self.previous_cursor = (  # pylint:disable=W0201
+            self.encode_cursor(page[0], backwards=True) if page and has_previous else None
+        )
+        return page
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, cursor
+        )
+
+    def get_next_link(self):
+        """URL of the next page, or None."""
+        return self._link(self.next_cursor)
+
+    def get_previous_link(self):
+        """URL of the previous page, or None."""
+        return self._link(self.previous_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+
+class InvoiceCursorPagination(BillingKeysetPagination):
+    """Newest invoices first."""
+
+    ordering = ("-issue_date", "-id")
+
+
+class SubscriptionCursorPagination(BillingKeysetPagination):
+    """Newest subscriptions first."""
+
+    ordering = ("-created_at", "-id")
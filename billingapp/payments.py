@@ -0,0 +1,143 @@
+"""
+Stripe PaymentIntent service.
+
+A single StripeClient is shared by the process. Its RequestsClient keeps a
+pooled HTTP session per thread, so requests reuse connections instead of
+configuring the global ``stripe.api_key`` on every call. Each invoice's
+intent is created with a deterministic idempotency key and stored on the
+invoice, so repeat requests are answered without calling Stripe.
+
+The same client serves async callers: its RequestsClient falls back to an
+httpx-based client for ``*_async`` calls, used by the ASGI views.
+
+Point ``STRIPE_API_BASE`` at a local stripe-mock (``http://localhost:12111``)
+to exercise the service without reaching Stripe.
+"""
+
+# pylint:disable=E1101
+import threading
+import stripe
+from django.conf import settings
+from django.utils.timezone import now
+from .models import Invoice
+
+_client_lock = threading.Lock()
+_clients = {}
+
+
+def get_stripe_client():
+    """
+    Return the shared StripeClient for the configured key and API base.
+
+    Raises:
+        ValueError: If no Stripe secret key is configured.
+    """
+    api_key = getattr(settings, "STRIPE_SECRET_KEY", None)
+    if not api_key:
+        raise ValueError("Stripe api key not found")
+    api_base = getattr(settings, "STRIPE_API_BASE", None)
+    config = (api_key, api_base)
+    client = _clients.get(config)
+    if client is None:
+        with _client_lock:
+            client = _clients.get(config)
+            if client is None:
+                client = stripe.StripeClient(
+                    api_key,
+                    base_addresses={"api": api_base} if api_base else None,
+                    max_network_retries=getattr(settings, "STRIPE_MAX_NETWORK_RETRIES", 2),
+                    http_client=stripe.RequestsClient(
+                        timeout=getattr(settings, "STRIPE_TIMEOUT", 30),
+                        async_fallback_client=stripe.HTTPXClient(
+                            timeout=getattr(settings, "STRIPE_TIMEOUT", 30)
+                        ),
+                    ),
+                )
+                _clients[config] = client
+    return client
+
+
+def amount_in_minor_units(invoice):
+    """Invoice amount in paisa/cents."""
+    return int(invoice.amount * 100)
+
+
+def idempotency_key(invoice):
+    """
+    Deterministic idempotency key for an invoice's PaymentIntent.
+
+    It includes the amount, so if an invoice is re-priced before an intent
+    is stored for it, Stripe does not answer the new request with the old
+    intent. An intent already stored is returned as is by
+    ``get_or_create_payment_intent``, whatever the invoice amount now is.
+    """
+    return f"invoice-{invoice.id}-{amount_in_minor_units(invoice)}"
+
+
+def intent_params(invoice):
+    """PaymentIntent creation parameters for an invoice."""
+    return {
+        "amount": amount_in_minor_units(invoice),
+        "currency": getattr(settings, "STRIPE_CURRENCY", "inr"),
+        "payment_method_types": ["card"],
+        "metadata": {"invoice_id": str(invoice.id)},
+    }
+
+
+def _stored_intent_update(invoice, intent):
+    queryset = Invoice.objects.filter(pk=invoice.pk, payment_intent_id__isnull=True)
+    values = {
+        "payment_intent_id": intent.id,
+        "payment_client_secret": intent.client_secret,
+        "updated_at": now(),
+    }
+    invoice.payment_intent_id = intent.id
+    invoice.payment_client_secret = intent.client_secret
+    return queryset, values
+
+
+def store_payment_intent(invoice, intent):
+    """Record a created intent against the invoice, unless one is already set."""
+    queryset, values = _stored_intent_update(invoice, intent)
+    queryset.update(**values)
+
+
+def get_or_create_payment_intent(invoice):
+    """
+    Return the (payment_intent_id, client_secret) for an invoice.
+
+    The stored intent is returned when there is one; otherwise an intent is
+    created through the shared client and stored. Concurrent first requests
+    send the same idempotency key, so Stripe returns one intent to both.
+
+    Raises:
+        stripe.StripeError: If Stripe rejects the request.
+    """
+    if invoice.payment_intent_id and invoice.payment_client_secret:
+        return invoice.payment_intent_id, invoice.payment_client_secret
+
+    intent = get_stripe_client().v1.payment_intents.create(
+        params=intent_params(invoice),
+        options={"idempotency_key": idempotency_key(invoice)},
+    )
+    store_payment_intent(invoice, intent)
+    return intent.id, intent.client_secret
+
+
+async def aget_or_create_payment_intent(invoice):
+    """
+    Async counterpart of ``get_or_create_payment_intent``.
+
+    The Stripe call goes through the async HTTP client and the invoice is
+    updated with the async ORM, so the event loop is never blocked.
+    """
+    if invoice.payment_intent_id and invoice.payment_client_secret:
+        return invoice.payment_intent_id, invoice.payment_client_secret
+
+    intent = await get_stripe_client().v1.payment_intents.create_async(
+        params=intent_params(invoice),
+        options={"idempotency_key": idempotency_key(invoice)},
+    )
+    queryset, values = _stored_intent_update(invoice, intent)
+    await queryset.aupdate(**values)
+    return intent.id, intent.client_secret
@@ -1,5 +1,7 @@
 """THis module is used to define custom permissions"""
 
+import hmac
+from django.conf import settings
 from rest_framework.permissions import BasePermission
 
 
@@ -19,3 +21,18 @@ class IsOwnerOrAdmin(BasePermission):
 
     def has_object_permission(self, request, view, obj):
         return obj.user == request.user or request.user.is_staff
+
+
+class IsAdminOrMetricsToken(BasePermission):
+    """
+    Allow admin users, and scrapers sending ``BILLING_METRICS_TOKEN`` in the
+    ``X-Metrics-Token`` header.
+    """
+
+    def has_permission(self, request, view):
+        token = getattr(settings, "BILLING_METRICS_TOKEN", None)
+        if token and hmac.compare_digest(
+            request.headers.get("X-Metrics-Token", "").encode(), token.encode()
+        ):
+            return True
+        return bool(request.user and request.user.is_staff)
@@ -0,0 +1,146 @@
+"""
+Bulk subscription provisioning for onboarding many seats at once.
+
+A request is validated in one pass with no per-entry queries. Users are then
+checked with one query, and users who already have an active subscription
+with another. The valid entries are inserted with ``bulk_create``, so the
+whole request runs in a bounded number of queries whatever its size. Invalid
+entries are reported by index and do not block the valid ones.
+
+If concurrent requests keep making the batch insert conflict, the entries
+are inserted one at a time instead, and those that still conflict are
+reported like any other rejected entry.
+"""
+
+# pylint:disable=E1101
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from . import reports
+from .catalog import get_catalog
+from .models import Subscription, User
+from .serializers import BulkSubscriptionEntrySerializer
+
+# Attempts at the batch insert when a concurrent request activates a
+# subscription for one of the users between the check and the insert.
+INSERT_ATTEMPTS = 2
+
+ALREADY_ACTIVE = {"user": ["User already has an active subscription."]}
+
+
+def max_entries():
+    """Largest number of entries accepted per request."""
+    return getattr(settings, "BILLING_BULK_SUBSCRIPTION_MAX", 5000)
+
+
+def _validate(entries):
+    """Validate entries; return (valid {index: data}, errors {index: detail})."""
+    valid, errors = {}, {}
+    plans = get_catalog()
+    seen_users = {}
+    for index, entry in enumerate(entries):
+        serializer = BulkSubscriptionEntrySerializer(data=entry)
+        if not serializer.is_valid():
+            errors[index] = serializer.errors
+            continue
+        data = serializer.validated_data
+        if data["plan"] not in plans:
+            errors[index] = {"plan": ["Plan not found."]}
+        elif data["user"] in seen_users:
+            errors[index] = {
+                "user": [f"User is also subscribed by entry {seen_users[data['user']]}."]
+            }
+        else:
+            seen_users[data["user"]] = index
+            valid[index] = data
+
+    known_users = set(
+        User.objects.filter(id__in=seen_users).values_list("id", flat=True)
+    )
+    for index, data in list(valid.items()):
+        if data["user"] not in known_users:
+            errors[index] = {"user": ["User not found."]}
+            del valid[index]
+    return valid, errors
+
+
+def _drop_active(valid, errors):
+    """Move entries for users with an active subscription to ``errors``."""
+    active = set(
+        Subscription.objects.filter(
+            user_id__in=[data["user"] for data in valid.values()], status="active"
+        ).values_list("user_id", flat=True)
+    )
+    for index, data in list(valid.items()):
+        if data["user"] in active:
+            errors[index] = ALREADY_ACTIVE
+            del valid[index]
+
+
+def provision_subscriptions(entries):
+    """
+    Create an active subscription for each valid entry.
+
+    Args:
+        entries (list[dict]): ``user``, ``plan``, ``start_date``,
+            ``end_date`` and optionally ``billing_interval``.
+
+    Returns:
+        tuple: ``(created, errors)``. ``created`` lists
+        ``{"index", "id"}`` per new subscription. ``errors`` lists
+        ``{"index", "errors"}`` per rejected entry.
+    """
+    valid, errors = _validate(entries)
+    for attempt in range(INSERT_ATTEMPTS):
+        _drop_active(valid, errors)
+        subscriptions = [_subscription(data) for data in valid.values()]
+        try:
+            with transaction.atomic():
+                Subscription.objects.bulk_create(subscriptions, batch_size=1000)
+                reports.subscriptions_added(subscriptions)
+        except IntegrityError:
+            continue
+        created = [
+            {"index": index, "id": subscription.id}
+            for index, subscription in zip(valid, subscriptions)
+        ]
+        break
+    else:
+        created = _insert_each(valid, errors)
+    return created, [
+        {"index": index, "errors": errors[index]} for index in sorted(errors)
+    ]
+
+
+def _subscription(data):
+    return Subscription(
+        user_id=data["user"],
+        plan_id=data["plan"],
+        start_date=data["start_date"],
+        end_date=data["end_date"],
+        billing_interval=data["billing_interval"],
+        status="active",
+        # bulk_create skips save(), which would default it.
+        next_billing_date=data["start_date"],
+    )
+
+
+def _insert_each(valid, errors):
+    """Insert entries one by one, moving those that conflict to ``errors``."""
+    created = []
+    for index, data in valid.items():
+        subscription = _subscription(data)
+        try:
+            with transaction.atomic():
+                Subscription.objects.bulk_create([subscription])
+                reports.subscriptions_added([subscription])
+        except IntegrityError:
+            # The active-subscription constraint, or a user or plan deleted
+            # since the check.
+            errors[index] = (
+                ALREADY_ACTIVE
+                if Subscription.objects.filter(user_id=data["user"], status="active").exists()
+                else {"non_field_errors": ["Conflicts with a concurrent change."]}
+            )
+            continue
+        created.append({"index": index, "id": subscription.id})
+    return created
@@ -0,0 +1,487 @@
+"""
+Revenue, receivables and per-user billing summaries.
+
+Summary tables follow invoice and subscription state, so a report or badge
+reads a handful of summary rows instead of scanning invoice history:
+
+- ``PlanSubscriptionSummary`` counts active subscriptions per plan and
+  billing interval. MRR is each count times the current plan price, with
+  yearly prices spread over twelve months.
+- ``ReceivableBalance`` holds the number and total of unpaid invoices per
+  due date. Aging buckets are sums over due-date ranges.
+- ``UserBillingSummary`` holds each user's pending and overdue invoice
+  counts and outstanding amount.
+
+Every path that changes invoices or subscriptions reports a delta here:
+model saves through signals, and bulk writes and deletes (including the
+cascades of user and plan deletes) with one delta per statement. Plan and receivables deltas are applied once the transaction that caused
+them commits, so concurrent writers, such as invoice shards, never queue on
+a shared summary row. Per-user rows are only shared by one user's invoices,
+so their deltas are applied inside the transaction and commit with the
+invoice change. Rows that fall to zero are kept rather than deleted, so a
+concurrent delta that found its row already there still has a row to
+update. A delta lost between a commit and its own, or a write that
+bypasses the hooks, leaves drift; ``reconcile`` rebuilds all three tables
+and is run nightly by the ``reconcile_billing_summaries`` task.
+"""
+
+# pylint:disable=E1101
+import logging
+from collections import Counter, defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.utils.timezone import now
+from .catalog import get_catalog
+from .models import (
+    Invoice,
+    PlanSubscriptionSummary,
+    ReceivableBalance,
+    Subscription,
+    UserBillingSummary,
+)
+
+logger = logging.getLogger(__name__)
+
+MONTHS_PER_INTERVAL = {
+    "monthly": 1,
+    "yearly": 12,
+}
+
+# (label, first day overdue, last day overdue or None for no limit)
+AGING_BUCKETS = [
+    ("1-30", 1, 30),
+    ("31-60", 31, 60),
+    ("61+", 61, None),
+]
+
+CENT = Decimal("0.01")
+
+# Users whose summaries are updated per statement.
+BALANCE_BATCH_SIZE = 500
+
+
+def invoice_state(status, due_date, amount):
+    """The receivables an invoice contributes to: (due_date, amount), or None if paid."""
+    return None if status == "paid" else (due_date, Decimal(amount))
+
+
+def balance_state(status, user_id, amount):
+    """What an invoice adds to its user's summary: (user_id, status, amount), or None if paid."""
+    return None if status == "paid" else (user_id, status, Decimal(amount))
+
+
+def subscription_state(status, plan_id, billing_interval):
+    """The summary row a subscription counts in: (plan_id, interval), or None."""
+    return (plan_id, billing_interval) if status == "active" else None
+
+
+def _on_commit(apply, deltas):
+    if deltas:
+        transaction.on_commit(partial(apply, deltas))
+
+
+def _apply_receivables(deltas):
+    with transaction.atomic():
+        due_dates = sorted(deltas)
+        ReceivableBalance.objects.bulk_create(
+            [
+                ReceivableBalance(due_date=due_date)
+                for due_date in due_dates
+                if deltas[due_date][0] > 0
+            ],
+            ignore_conflicts=True,
+        )
+        for due_date in due_dates:
+            count, amount = deltas[due_date]
+            ReceivableBalance.objects.filter(due_date=due_date).update(
+                invoices=F("invoices") + count,
+                amount=F("amount") + amount,
+                updated_at=now(),
+            )
+
+
+def _apply_subscriptions(deltas):
+    with transaction.atomic():
+        keys = sorted(deltas)
+        # Only additions create rows: a removal may come from the plan's
+        # deletion, and a row for it would no longer have a plan to point at.
+        PlanSubscriptionSummary.objects.bulk_create(
+            [
+                PlanSubscriptionSummary(plan_id=plan_id, billing_interval=interval)
+                for plan_id, interval in keys
+                if deltas[(plan_id, interval)] > 0
+            ],
+            ignore_conflicts=True,
+        )
+        for plan_id, interval in keys:
+            PlanSubscriptionSummary.objects.filter(
+                plan_id=plan_id, billing_interval=interval
+            ).update(
+                active_subscriptions=F("active_subscriptions") + deltas[(plan_id, interval)],
+                updated_at=now(),
+            )
+
+
+def _delta_column(deltas, user_ids, index, output_field):
+    return Case(
+        *(When(user_id=user_id, then=Value(deltas[user_id][index])) for user_id in user_ids),
+        default=Value(0),
+        output_field=output_field,
+    )
+
+
+def _apply_balances(deltas):
+    # Joins the caller's transaction, so the row moves with the invoice.
+    with transaction.atomic(savepoint=False):
+        user_ids = sorted(deltas)
+        # As for plans, removals (say from the user's own deletion cascading
+        # to their invoices) only update a row that is already there.
+        UserBillingSummary.objects.bulk_create(
+            [
+                UserBillingSummary(user_id=user_id)
+                for user_id in user_ids
+                if deltas[user_id][0] > 0 or deltas[user_id][1] > 0
+            ],
+            ignore_conflicts=True,
+        )
+        for start in range(0, len(user_ids), BALANCE_BATCH_SIZE):
+            batch = user_ids[start:start + BALANCE_BATCH_SIZE]
+            UserBillingSummary.objects.filter(user_id__in=batch).update(
+                pending_invoices=F("pending_invoices")
+                + _delta_column(deltas, batch, 0, models.IntegerField()),
+                overdue_invoices=F("overdue_invoices")
+                + _delta_column(deltas, batch, 1, models.IntegerField()),
+                outstanding_amount=F("outstanding_amount")
+                + _delta_column(
+                    deltas, batch, 2, models.DecimalField(max_digits=14, decimal_places=2)
+                ),
+                updated_at=now(),
+            )
+
+
+def receivables_changed(changes):
+    """
+    Record invoice changes.
+
+    Args:
+        changes: ``(before, after)`` pairs of ``invoice_state`` values.
+    """
+    deltas = defaultdict(lambda: (0, Decimal(0)))
+    for before, after in changes:
+        if before == after:
+            continue
+        for state, sign in ((before, -1), (after, 1)):
+            if state is not None:
+                count, amount = deltas[state[0]]
+                deltas[state[0]] = (count + sign, amount + sign * state[1])
+    _on_commit(
+        _apply_receivables,
+        {due_date: delta for due_date, delta in deltas.items() if delta != (0, 0)},
+    )
+
+
+def balances_changed(changes):
+    """
+    Apply invoice changes to the users' summaries, in the current transaction.
+
+    Args:
+        changes: ``(before, after)`` pairs of ``balance_state`` values.
+    """
+    deltas = defaultdict(lambda: [0, 0, Decimal(0)])
+    for before, after in changes:
+        if before == after:
+            continue
+        for state, sign in ((before, -1), (after, 1)):
+            if state is not None:
+                user_id, status, amount = state
+                delta = deltas[user_id]
+                delta[0 if status == "pending" else 1] += sign
+                delta[2] += sign * amount
+    deltas = {user_id: delta for user_id, delta in deltas.items() if any(delta)}
+    if deltas:
+        _apply_balances(deltas)
+
+
+def invoices_added(invoices):
+    """Record newly created invoices."""
+    invoices = list(invoices)
+    receivables_changed(
+        (None, invoice_state(invoice.status, invoice.due_date, invoice.amount))
+        for invoice in invoices
+    )
+    balances_changed(
+        (None, balance_state(invoice.status, invoice.user_id, invoice.amount))
+        for invoice in invoices
+    )
+
+
+def subscriptions_changed(changes):
+    """
+    Record subscription changes.
+
+    Args:
+        changes: ``(before, after)`` pairs of ``subscription_state`` values.
+    """
+    deltas = Counter()
+    for before, after in changes:
+        if before == after:
+            continue
+        if before is not None:
+            deltas[before] -= 1
+        if after is not None:
+            deltas[after] += 1
+    _on_commit(_apply_subscriptions, {key: delta for key, delta in deltas.items() if delta})
+
+
+def subscriptions_added(subscriptions):
+    """Record newly created subscriptions."""
+    subscriptions_changed(
+        (None, subscription_state(sub.status, sub.plan_id, sub.billing_interval))
+        for sub in subscriptions
+    )
+
+
+def _invoice_states(status, due_date, amount, user_id):
+    return (
+        invoice_state(status, due_date, amount),
+        balance_state(status, user_id, amount),
+    )
+
+
+# Fields each summarized model's summary state is read from.
+SUMMARY_FIELDS = {
+    Invoice: (("status", "due_date", "amount", "user_id"), _invoice_states),
+    Subscription: (("status", "plan_id", "billing_interval"), subscription_state),
+}
+
+
+def summary_state(model, values):
+    """The summary state of an invoice or subscription, from its ``SUMMARY_FIELDS`` values."""
+    fields, state = SUMMARY_FIELDS[model]
+    return state(*(values[field] for field in fields))
+
+
+def summaries_changed(model, before, after):
+    """Record one invoice or subscription moving between ``summary_state`` values."""
+    if model is Invoice:
+        receivable_before, balance_before = before or (None, None)
+        receivable_after, balance_after = after or (None, None)
+        receivables_changed([(receivable_before, receivable_after)])
+        balances_changed([(balance_before, balance_after)])
+    else:
+        subscriptions_changed([(before, after)])
+
+
+def rows_deleted(invoices=None, subscriptions=None):
+    """
+    Record invoices and subscriptions that are about to be deleted.
+
+    Deletes are not followed by per-row signals: whatever deletes them
+    reports the rows here first, in the same transaction, with one grouped
+    query per table however many rows go.
+
+    Args:
+        invoices: The invoices being deleted, including any a cascade will
+            delete.
+        subscriptions: The subscriptions being deleted.
+    """
+    if invoices is not None:
+        receivables = defaultdict(lambda: (0, Decimal(0)))
+        balances = defaultdict(lambda: [0, 0, Decimal(0)])
+        for row in (
+            invoices.exclude(status="paid")
+            .values("due_date", "user_id", "status")
+            .annotate(unpaid=Count("id"), total=Sum("amount"))
+            .order_by()
+        ):
+            count, amount = receivables[row["due_date"]]
+            receivables[row["due_date"]] = (count - row["unpaid"], amount - row["total"])
+            balance = balances[row["user_id"]]
+            balance[0 if row["status"] == "pending" else 1] -= row["unpaid"]
+            balance[2] -= row["total"]
+        _on_commit(_apply_receivables, dict(receivables))
+        if balances:
+            _apply_balances(dict(balances))
+    if subscriptions is not None:
+        _on_commit(
+            _apply_subscriptions,
+            {
+                (row["plan_id"], row["billing_interval"]): -row["active"]
+                for row in subscriptions.filter(status="active")
+                .values("plan_id", "billing_interval")
+                .annotate(active=Count("id"))
+                .order_by()
+            },
+        )
+
+
+def deleting(model, queryset):
+    """Record the invoices or subscriptions in ``queryset``, and what they cascade to, as deleted."""
+    if model is Invoice:
+        rows_deleted(invoices=queryset)
+    else:
+        rows_deleted(
+            invoices=Invoice.objects.filter(subscription__in=queryset),
+            subscriptions=queryset,
+        )
+
+
+def _sync(model, key_fields, expected, value_fields):
+    """
+    Make ``model`` hold the ``expected`` rows, and zero the rest.
+
+    Args:
+        expected (dict): Maps a tuple of ``key_fields`` values to a tuple of
+            ``value_fields`` values.
+
+    Returns:
+        int: The number of rows created or changed.
+    """
+    existing = {
+        tuple(getattr(row, field) for field in key_fields): row
+        for row in model.objects.select_for_update()
+    }
+    zero = (0,) * len(value_fields)
+    expected = {**{key: zero for key in existing}, **expected}
+    changed, created = [], []
+    for key, values in expected.items():
+        row = existing.get(key)
+        if row is None:
+            created.append(model(**dict(zip(key_fields + value_fields, key + values))))
+        elif tuple(getattr(row, field) for field in value_fields) != values:
+            for field, value in zip(value_fields, values):
+                setattr(row, field, value)
+            row.updated_at = now()
+            changed.append(row)
+    model.objects.bulk_update(changed, list(value_fields) + ["updated_at"], batch_size=1000)
+    model.objects.bulk_create(created, batch_size=1000)
+    return len(changed) + len(created)
+
+
+def reconcile():
+    """
+    Rebuild the summary tables from invoices and subscriptions.
+
+    Run it when few writes are in flight: a delta committed while it runs
+    may be counted twice.
+
+    Returns:
+        int: The number of summary rows that had drifted and were repaired.
+    """
+    with transaction.atomic():
+        repaired = _sync(
+            PlanSubscriptionSummary,
+            ("plan_id", "billing_interval"),
+            {
+                (row["plan_id"], row["billing_interval"]): (row["active"],)
+                for row in Subscription.objects.filter(status="active")
+                .values("plan_id", "billing_interval")
+                .annotate(active=Count("id"))
+                .order_by()
+            },
+            ("active_subscriptions",),
+        )
+        repaired += _sync(
+            ReceivableBalance,
+            ("due_date",),
+            {
+                (row["due_date"],): (row["unpaid"], row["total"])
+                for row in Invoice.objects.exclude(status="paid")
+                .values("due_date")
+                .annotate(unpaid=Count("id"), total=Sum("amount"))
+                .order_by()
+            },
+            ("invoices", "amount"),
+        )
+        repaired += _sync(
+            UserBillingSummary,
+            ("user_id",),
+            {
+                (row["user_id"],): (row["pending"], row["overdue"], row["total"])
+                for row in Invoice.objects.exclude(status="paid")
+                .values("user_id")
+                .annotate(
+                    pending=Count("id", filter=Q(status="pending")),
+                    overdue=Count("id", filter=Q(status="overdue")),
+                    total=Sum("amount"),
+                )
+                .order_by()
+            },
+            ("pending_invoices", "overdue_invoices", "outstanding_amount"),
+        )
+    if repaired:
+        logger.warning("Repaired %d drifted billing summary rows", repaired)
+    return repaired
+
+
+def _money(value):
+    return str(Decimal(value or 0).quantize(CENT))
+
+
+def build_report(today=None):
+    """
+    MRR per plan, outstanding receivables and their aging, from the summaries.
+
+    Days overdue count from the due date, so an invoice due today is
+    current; aging buckets cover invoices past their due date.
+    """
+    today = today or now().date()
+    catalog = get_catalog()
+
+    mrr_by_plan = {}
+    for row in PlanSubscriptionSummary.objects.filter(active_subscriptions__gt=0).order_by(
+        "plan_id", "billing_interval"
+    ):
+        plan = catalog.get(row.plan_id)
+        if plan is None:
+            continue
+        entry = mrr_by_plan.setdefault(
+            row.plan_id,
+            {
+                "plan_id": row.plan_id,
+                "plan": plan["name"],
+                "monthly_subscriptions": 0,
+                "yearly_subscriptions": 0,
+                "mrr": Decimal(0),
+            },
+        )
+        entry[f"{row.billing_interval}_subscriptions"] += row.active_subscriptions
+        entry["mrr"] += (
+            Decimal(plan["price"]) * row.active_subscriptions
+            / MONTHS_PER_INTERVAL[row.billing_interval]
+        )
+    plans = list(mrr_by_plan.values())
+    total_mrr = sum((entry["mrr"] for entry in plans), Decimal(0))
+    for entry in plans:
+        entry["mrr"] = _money(entry["mrr"])
+
+    ranges = {"current": Q(due_date__gte=today)}
+    for label, first_day, last_day in AGING_BUCKETS:
+        condition = Q(due_date__lte=today - timedelta(days=first_day))
+        if last_day is not None:
+            condition &= Q(due_date__gte=today - timedelta(days=last_day))
+        ranges[label] = condition
+    aggregates = {"outstanding_invoices": Sum("invoices"), "outstanding_amount": Sum("amount")}
+    for label, condition in ranges.items():
+        aggregates[f"{label}_invoices"] = Sum("invoices", filter=condition)
+        aggregates[f"{label}_amount"] = Sum("amount", filter=condition)
+    totals = ReceivableBalance.objects.aggregate(**aggregates)
+
+    return {
+        "as_of": today.isoformat(),
+        "mrr": {"total": _money(total_mrr), "plans": plans},
+        "receivables": {
+            "outstanding_invoices": totals["outstanding_invoices"] or 0,
+            "outstanding_amount": _money(totals["outstanding_amount"]),
+            "aging": {
+                label: {
+                    "invoices": totals[f"{label}_invoices"] or 0,
+                    "amount": _money(totals[f"{label}_amount"]),
+                }
+                for label in ranges
+            },
+        },
+    }
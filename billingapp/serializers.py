@@ -1,7 +1,8 @@
 """Serializers for the billing application."""
 
 from rest_framework import serializers
-from .models import User, Plan, Subscription, Invoice
+from rest_framework.relations import PrimaryKeyRelatedField
+from .models import User, Plan, Subscription, Invoice, ArchivedInvoice, UserBillingSummary
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -63,18 +64,127 @@ class SubscriptionSerializer(serializers.ModelSerializer):
 
         model = Subscription
         fields = "__all__"
-        read_only_fields = ["user", "created_at", "updated_at"]
+        read_only_fields = ["user", "next_billing_date", "created_at", "updated_at"]
+
+
+class BulkSubscriptionEntrySerializer(serializers.Serializer):
+    """
+    One entry of a bulk subscription request.
+
+    Users and plans are plain ids here so that validating an entry runs no
+    queries; provisioning checks them for the whole batch at once.
+    """
+
+    # pylint:disable=W0223
+    user = serializers.IntegerField(min_value=1)
+    plan = serializers.IntegerField(min_value=1)
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    billing_interval = serializers.ChoiceField(
+        choices=Subscription.BILLING_INTERVAL_CHOICES, default="monthly"
+    )
+
+    def validate(self, attrs):
+        if attrs["end_date"] < attrs["start_date"]:
+            raise serializers.ValidationError(
+                {"end_date": "End date must not be before the start date."}
+            )
+        return attrs
 
 
 class InvoiceSerializer(serializers.ModelSerializer):
     """
     Serializer for the Invoice model.
 
-    Serializes all fields of the invoice.
+    Serializes all fields of the invoice except the Stripe client secret.
     """
 
     class Meta:
         """Meta information for the InvoiceSerializer."""
 
         model = Invoice
+        exclude = ["payment_client_secret"]
+        read_only_fields = ["reminder_sent_at", "paid_at", "payment_intent_id"]
+
+
+class ArchivedInvoiceSerializer(serializers.ModelSerializer):
+    """
+    Read-only serializer for archived invoices.
+
+    Same fields as InvoiceSerializer, plus ``archived_at``.
+    """
+
+    class Meta:
+        """Meta information for the ArchivedInvoiceSerializer."""
+
+        model = ArchivedInvoice
         fields = "__all__"
+        read_only_fields = [field.name for field in ArchivedInvoice._meta.fields]
+
+
+class UserBillingSummarySerializer(serializers.ModelSerializer):
+    """Read-only serializer for a user's billing summary."""
+
+    class Meta:
+        """Meta information for the UserBillingSummarySerializer."""
+
+        model = UserBillingSummary
+        fields = "__all__"
+        read_only_fields = [field.name for field in UserBillingSummary._meta.fields]
+
+
+class ValuesReader:
+    """
+    Read-only fast path that serializes ``values()`` rows.
+
+    The readable fields of a ModelSerializer are compiled once into a list
+    of (name, column, to_representation) entries. Rows are then fetched
+    with ``values()`` and converted without building model instances or
+    running the serializer per row, giving output identical to the
+    serializer's. Only plain model columns and primary-key relations are
+    supported.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self._fields = None
+
+    @property
+    def fields(self):
+        """The compiled (name, column, to_representation) entries."""
+        if self._fields is None:
+            compiled = []
+            for name, field in self.serializer_class().fields.items():
+                if field.write_only:
+                    continue
+                assert "." not in field.source and field.source != "*", (
+                    f"ValuesReader cannot read the nested source of {name!r}."
+                )
+                if isinstance(field, PrimaryKeyRelatedField):
+                    # values() already returns the related pk.
+                    represent = None
+                else:
+                    represent = field.to_representation
+                compiled.append((name, field.source, represent))
+            self._fields = compiled
+        return self._fields
+
+    def values(self, queryset):
+        """Restrict a queryset to the columns the serializer reads."""
+        return queryset.values(*(column for _, column, _ in self.fields))
+
+    def to_representation(self, row):
+        """Serialize one ``values()`` row."""
+        return {
+            name: (
+                row[column]
+                if represent is None or row[column] is None
+                else represent(row[column])
+            )
+            for name, column, represent in self.fields
+        }
+
+    def serialize(self, rows):
+        """Serialize an iterable of ``values()`` rows."""
+        to_representation = self.to_representation
+        return [to_representation(row) for row in rows]
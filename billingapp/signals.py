@@ -0,0 +1,137 @@
+"""Signals sent by the billing app, and its model signal receivers."""
+
+# pylint:disable=W0613
+from celery.signals import task_failure, task_postrun, task_prerun
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+from .authentication import invalidate_cached_user
+from .catalog import invalidate_catalog
+from . import reports, telemetry
+from .middleware import record_query
+from .models import Invoice, Plan, Subscription, User
+
+# Sent after each committed chunk of mark_overdue_invoices, with
+# ``invoice_ids``: the ids of the invoices that became overdue.
+invoices_marked_overdue = Signal()
+
+
+@receiver([post_save, post_delete], sender=Plan)
+def plan_changed(sender, **kwargs):
+    """
+    Invalidate the plan catalog when a plan changes.
+
+    The version is bumped immediately and again on commit, so a process
+    that reloads the catalog before the transaction commits cannot keep
+    the stale copy.
+    """
+    invalidate_catalog()
+    transaction.on_commit(invalidate_catalog)
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    """Drop a changed user from the authentication cache, now and on commit."""
+    invalidate_cached_user(instance.pk)
+    transaction.on_commit(lambda: invalidate_cached_user(instance.pk))
+
+
+# Marks a save that cannot change the summaries (its update_fields skip them).
+UNSUMMARIZED = object()
+
+
+def _instance_state(sender, instance):
+    return reports.summary_state(
+        sender, {field: getattr(instance, field) for field in reports.SUMMARY_FIELDS[sender][0]}
+    )
+
+
+@receiver(pre_save, sender=Invoice)
+@receiver(pre_save, sender=Subscription)
+def summarized_saving(sender, instance, update_fields=None, **kwargs):
+    """
+    Remember the summary state of an invoice or subscription being saved.
+
+    That is the state it was loaded with; the row is only read when the
+    instance was not loaded with all the summarized fields. A save of an
+    instance whose row was changed since it was loaded (say by a
+    transition) moves the summaries from the state it was loaded in, and
+    the nightly reconcile repairs the difference.
+    """
+    fields = reports.SUMMARY_FIELDS[sender][0]
+    loaded = getattr(instance, "_loaded_values", {})
+    before = None
+    if update_fields is not None and not {
+        field.removesuffix("_id") for field in fields
+    } & set(update_fields):
+        before = UNSUMMARIZED
+    elif instance._state.adding:  # pylint:disable=W0212
+        before = None
+    elif all(field in loaded for field in fields):
+        before = reports.summary_state(sender, loaded)
+    else:
+        row = sender.objects.filter(pk=instance.pk).values(*fields).first()
+        before = row and reports.summary_state(sender, row)
+    instance._summary_before = before  # pylint:disable=W0212
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_save, sender=Subscription)
+def summarized_saved(sender, instance, **kwargs):
+    """Apply a saved invoice or subscription to the revenue summaries."""
+    before = getattr(instance, "_summary_before", None)
+    if before is not UNSUMMARIZED:
+        reports.summaries_changed(sender, before, _instance_state(sender, instance))
+        # The row now holds these values; a later save compares with them.
+        instance._loaded_values = {  # pylint:disable=W0212
+            **getattr(instance, "_loaded_values", {}),
+            **{field: getattr(instance, field) for field in reports.SUMMARY_FIELDS[sender][0]},
+        }
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    """Remove the invoices and subscriptions a user's deletion cascades to."""
+    reports.rows_deleted(
+        invoices=Invoice.objects.filter(Q(user=instance) | Q(subscription__user=instance)),
+        subscriptions=Subscription.objects.filter(user=instance),
+    )
+
+
+@receiver(pre_delete, sender=Plan)
+def plan_deleting(sender, instance, **kwargs):
+    """Remove the subscriptions and invoices a plan's deletion cascades to."""
+    reports.rows_deleted(
+        invoices=Invoice.objects.filter(subscription__plan=instance),
+        subscriptions=Subscription.objects.filter(plan=instance),
+    )
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    """Let QueryTimingMiddleware see the statements run on every connection."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@task_prerun.connect
+def task_started(sender=None, task_id=None, task=None, **kwargs):
+    """Open a run-history record for billing tasks."""
+    if telemetry.is_recorded(task):
+        telemetry.start_run(task_id)
+
+
+@task_failure.connect
+def task_failed(sender=None, task_id=None, exception=None, **kwargs):
+    """Keep the exception that failed a billing task."""
+    if telemetry.is_recorded(sender):
+        telemetry.fail_run(task_id, exception)
+
+
+@task_postrun.connect
+def task_finished(sender=None, task_id=None, task=None, state=None, **kwargs):
+    """Save the run-history record of a billing task."""
+    if telemetry.is_recorded(task):
+        telemetry.finish_run(task, task_id, state)
@@ -3,45 +3,152 @@ Celery tasks for managing the billing lifecycle:
 - Invoice generation
 - Overdue status updates
 - Reminder notifications
+- Stripe webhook event processing
+- Archival of old paid invoices
+- Revenue summary reconciliation
+- Task run-history pruning
+
+Runs of every task here are recorded in the TaskRun history; see
+``billingapp.telemetry``.
 """
 #pylint:disable=E1101
-from datetime import timedelta
-from celery import shared_task
+import logging
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from celery import chord, group, shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
 from django.utils.timezone import now
-from .models import Subscription, Invoice
+from .billing import (
+    archive_paid_before,
+    due_subscriptions,
+    iter_overdue_transitions,
+    mark_invoices_paid,
+    renew_due_subscriptions,
+)
+from .models import Subscription, Invoice, StripeEvent
+from . import reports, telemetry
+from .notifications import get_reminder_backend
+from .signals import invoices_marked_overdue
+
+logger = logging.getLogger(__name__)
 
 
 @shared_task
 def generate_daily_invoices():
     """
-    Generate invoices for all active subscriptions
-    whose start_date is today.
+    Generate invoices for all active subscriptions that are due for
+    billing, including renewals and billing dates missed by earlier runs.
 
     Ensures that invoices are not duplicated
     if the task runs more than once per day.
+
+    Returns:
+        str: A summary of how many invoices were generated.
+    """
+    result = renew_due_subscriptions(now().date())
+    return f"{result.invoiced} invoices generated."
+
+
+def _shard_ranges(first_id, last_id):
+    """
+    Split the inclusive id range into contiguous shards.
+
+    Shards are ``BILLING_INVOICE_SHARD_SIZE`` ids wide, widened when needed
+    so that no more than ``BILLING_INVOICE_MAX_SHARDS`` are dispatched.
+    """
+    shard_size = getattr(settings, "BILLING_INVOICE_SHARD_SIZE", 10000)
+    max_shards = getattr(settings, "BILLING_INVOICE_MAX_SHARDS", 32)
+    span = last_id - first_id + 1
+    shard_size = max(shard_size, -(-span // max_shards))
+    return [
+        (start, min(start + shard_size - 1, last_id))
+        for start in range(first_id, last_id + 1, shard_size)
+    ]
+
+
+@shared_task
+def generate_daily_invoices_sharded():
+    """
+    Fan out today's invoice generation across Celery workers.
+
+    Splits the subscriptions due today into id-range shards and runs
+    them as a chord; ``summarize_invoice_shards`` collects the per-shard
+    results once every shard has finished.
+
+    Returns:
+        str: A summary of how many shards were dispatched.
     """
     today = now().date()
-    active_subs = Subscription.objects.filter(start_date=today, status="active")
-
-    for sub in active_subs:
-        # Avoid duplicate invoices
-        invoice_exists = Invoice.objects.filter(
-            subscription=sub, issue_date=today
-        ).exists()
-
-        if invoice_exists:
-            continue
-
-        # Create new invoice
-        Invoice.objects.create(
-            user=sub.user,
-            plan=sub.plan,
-            subscription=sub,
-            amount=sub.plan.price,
-            issue_date=today,
-            due_date=today + timedelta(days=7),
-            status="pending",
+    bounds = due_subscriptions(today).aggregate(
+        first_id=Min("id"), last_id=Max("id")
+    )
+    if bounds["first_id"] is None:
+        return "0 invoice shards dispatched."
+
+    shards = _shard_ranges(bounds["first_id"], bounds["last_id"])
+    chord(
+        group(
+            generate_invoice_shard.s(start_id, end_id, today.isoformat())
+            for start_id, end_id in shards
         )
+    )(summarize_invoice_shards.s())
+    return f"{len(shards)} invoice shards dispatched."
+
+
+@shared_task
+def generate_invoice_shard(start_id, end_id, issue_date):
+    """
+    Renew due subscriptions with ids in [start_id, end_id].
+
+    The shard runs in a single transaction, so a failure rolls back the
+    whole shard and is reported instead of raised; the chord callback
+    still receives a result for every shard. ``created`` counts invoices;
+    ``skipped`` and ``failed`` count subscriptions, where skipped ones were
+    locked by another worker.
+
+    Returns:
+        dict: The shard range with its created, skipped and failed counts.
+    """
+    issue_date = date.fromisoformat(issue_date)
+    subs = Subscription.objects.filter(id__gte=start_id, id__lte=end_id)
+    result = {"start_id": start_id, "end_id": end_id}
+    total = due_subscriptions(issue_date).filter(
+        id__gte=start_id, id__lte=end_id
+    ).count()
+    try:
+        with transaction.atomic():
+            renewal = renew_due_subscriptions(issue_date, subs)
+    except Exception:  # pylint:disable=W0718
+        logger.exception("Invoice shard %s-%s failed", start_id, end_id)
+        result.update(created=0, skipped=0, failed=total)
+    else:
+        result.update(
+            created=renewal.invoiced, skipped=total - renewal.renewed, failed=0
+        )
+    return result
+
+
+@shared_task
+def summarize_invoice_shards(results):
+    """
+    Chord callback: combine the per-shard results of a sharded run.
+
+    Returns:
+        dict: Totals across shards plus the ranges of any failed shards.
+    """
+    summary = {
+        "shards": len(results),
+        "created": sum(r["created"] for r in results),
+        "skipped": sum(r["skipped"] for r in results),
+        "failed": sum(r["failed"] for r in results),
+        "failed_shards": [
+            [r["start_id"], r["end_id"]] for r in results if r["failed"]
+        ],
+    }
+    logger.info("Sharded invoice generation finished: %s", summary)
+    return summary
 
 
 @shared_task
@@ -49,31 +156,191 @@ def mark_overdue_invoices():
     """
     Mark all pending invoices as 'overdue' if their due_date has passed.
 
+    Invoices are updated in id-ordered chunks of
+    ``BILLING_OVERDUE_CHUNK_SIZE``, each in its own transaction, pausing
+    ``BILLING_OVERDUE_CHUNK_PAUSE`` seconds between chunks. The
+    ``invoices_marked_overdue`` signal is sent with the ids changed by
+    each chunk.
+
     Returns:
         str: A summary of how many invoices were updated.
     """
     today = now().date()
-    overdue_invoices = Invoice.objects.filter(status="pending", due_date__lt=today)
-    count = overdue_invoices.update(status="overdue")
+    count = 0
+    for invoice_ids in iter_overdue_transitions(
+        today,
+        chunk_size=getattr(settings, "BILLING_OVERDUE_CHUNK_SIZE", 1000),
+        pause=getattr(settings, "BILLING_OVERDUE_CHUNK_PAUSE", 0),
+    ):
+        count += len(invoice_ids)
+        invoices_marked_overdue.send(sender=Invoice, invoice_ids=invoice_ids)
     return f"{count} invoices marked as overdue."
 
 
+def _dispatch_reminders(backend, batch):
+    """Send one batch of reminders and record when they went out."""
+    started = time.monotonic()
+    sent = backend.send_reminders(batch)
+    sent_at = now()
+    Invoice.objects.filter(id__in=[invoice.id for invoice in batch]).update(
+        reminder_sent_at=sent_at, updated_at=sent_at
+    )
+    elapsed = time.monotonic() - started
+    telemetry.record_chunk(elapsed, scanned=len(batch), changed=sent)
+    logger.info(
+        "Sent %d reminders in %.3fs (%.0f reminders/s)",
+        sent,
+        elapsed,
+        sent / elapsed if elapsed else sent,
+    )
+    return sent
+
+
 @shared_task
 def send_pending_invoice_reminders():
     """
-    Send reminder notifications (via print/log) for all
-    pending invoices that are not yet due.
+    Send reminder notifications for pending invoices that are not yet
+    due and have not been reminded before.
+
+    Invoices are streamed with their user in a single query and handed to
+    the configured ``BILLING_REMINDER_BACKEND`` in batches of
+    ``BILLING_REMINDER_BATCH_SIZE``. Each delivered batch is stamped with
+    ``reminder_sent_at`` so reruns skip it.
 
     Returns:
         str: A summary of how many reminders were sent.
     """
     today = now().date()
-    pending_invoices = Invoice.objects.filter(status="pending", due_date__gte=today)
+    backend = get_reminder_backend()
+    batch_size = getattr(settings, "BILLING_REMINDER_BATCH_SIZE", 500)
+    pending_invoices = (
+        Invoice.objects.filter(
+            status="pending", due_date__gte=today, reminder_sent_at__isnull=True
+        )
+        .select_related("user")
+        .only("id", "due_date", "user__username", "user__email")
+        .order_by("id")
+    )
+
+    sent = 0
+    batch = []
+    for invoice in pending_invoices.iterator(chunk_size=batch_size):
+        batch.append(invoice)
+        if len(batch) >= batch_size:
+            sent += _dispatch_reminders(backend, batch)
+            batch = []
+    if batch:
+        sent += _dispatch_reminders(backend, batch)
+
+    return f"{sent} reminders sent."
+
+
+def _paid_invoice_id(event):
+    """The invoice id a payment_intent.succeeded event settles, if any."""
+    if event.type != "payment_intent.succeeded":
+        return None
+    metadata = event.payload.get("data", {}).get("object", {}).get("metadata") or {}
+    try:
+        return int(metadata["invoice_id"])
+    except (KeyError, TypeError, ValueError):
+        logger.warning("Stripe event %s has no invoice_id metadata", event.event_id)
+        return None
+
+
+def _event_time(event):
+    """When Stripe created the event, falling back to now."""
+    created = event.payload.get("created")
+    if created is None:
+        return now()
+    return datetime.fromtimestamp(created, tz=dt_timezone.utc)
+
 
-    for invoice in pending_invoices:
-        print(
-            f"[REMINDER] Invoice #{invoice.id} for user "
-            f"{invoice.user.username} is still pending. Due on {invoice.due_date}."
+@shared_task
+def process_stripe_events():
+    """
+    Drain the Stripe webhook inbox in batches.
+
+    Each batch of unprocessed events is locked (skipping batches another
+    worker holds), its succeeded payments are applied with one set-based
+    invoice update, and the events are stamped processed in the same
+    transaction.
+
+    Returns:
+        str: A summary of how many events were processed.
+    """
+    batch_size = getattr(settings, "BILLING_STRIPE_EVENT_BATCH_SIZE", 500)
+    processed = 0
+    while True:
+        started = time.perf_counter()
+        with transaction.atomic():
+            events = list(
+                StripeEvent.objects.select_for_update(skip_locked=True)
+                .filter(processed_at__isnull=True)
+                .order_by("id")
+                .only("id", "event_id", "type", "payload")[:batch_size]
+            )
+            if not events:
+                break
+            paid_at_by_id = {}
+            for event in events:
+                invoice_id = _paid_invoice_id(event)
+                if invoice_id is not None:
+                    paid_at_by_id.setdefault(invoice_id, _event_time(event))
+            paid = mark_invoices_paid(paid_at_by_id)
+            StripeEvent.objects.filter(id__in=[event.id for event in events]).update(
+                processed_at=now()
+            )
+        processed += len(events)
+        telemetry.record_chunk(
+            time.perf_counter() - started, scanned=len(events), changed=paid
         )
+    return f"{processed} Stripe events processed."
+
+
+@shared_task
+def archive_paid_invoices():
+    """
+    Move paid invoices issued more than ``BILLING_INVOICE_ARCHIVE_AFTER_DAYS``
+    ago to the archive table, ``BILLING_INVOICE_ARCHIVE_BATCH_SIZE`` at a
+    time. Archived invoices stay readable through ``/invoices/?archived=true``.
+
+    Returns:
+        str: A summary of how many invoices were archived.
+    """
+    issued_before = now().date() - timedelta(
+        days=getattr(settings, "BILLING_INVOICE_ARCHIVE_AFTER_DAYS", 365)
+    )
+    archived = archive_paid_before(
+        issued_before,
+        batch_size=getattr(settings, "BILLING_INVOICE_ARCHIVE_BATCH_SIZE", 1000),
+    )
+    return f"{archived} invoices archived."
+
+
+@shared_task
+def reconcile_billing_summaries():
+    """
+    Nightly repair of the revenue and receivables summary tables.
+
+    Rebuilds them from invoices and subscriptions; see
+    ``billingapp.reports``.
 
-    return f"{pending_invoices.count()} reminders sent."
+    Returns:
+        str: A summary of how many summary rows had drifted.
+    """
+    repaired = reports.reconcile()
+    telemetry.add_rows(changed=repaired)
+    return f"{repaired} summary rows repaired."
+
+
+@shared_task
+def prune_task_runs():
+    """
+    Delete task run history older than ``BILLING_TASK_RUN_RETENTION_DAYS``.
+
+    Returns:
+        str: A summary of how many runs were deleted.
+    """
+    deleted = telemetry.prune_runs()
+    telemetry.add_rows(changed=deleted)
+    return f"{deleted} task runs pruned."
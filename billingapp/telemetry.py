@@ -0,0 +1,185 @@
+"""
+Run history and metrics for the billing Celery tasks.
+
+Celery's task signals (connected in ``signals.py``) open a run when a task
+in ``billingapp.tasks`` starts and save it as a ``TaskRun`` when it ends.
+While it runs, the task and the billing engine report their work with
+``record_chunk`` and ``add_rows``; both are no-ops outside a recorded
+task. ``render_metrics`` turns the history into the Prometheus text
+format served at ``/api/metrics/``.
+"""
+
+# pylint:disable=E1101
+import logging
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.timezone import now
+from .models import TaskRun
+
+logger = logging.getLogger(__name__)
+
+TASK_PREFIX = "billingapp.tasks."
+
+_local = threading.local()
+
+
+class RunStats:
+    """Counters for one task run in progress."""
+
+    def __init__(self, task_id):
+        self.task_id = task_id
+        self.started_at = now()
+        self.started = time.perf_counter()
+        self.rows_scanned = 0
+        self.rows_changed = 0
+        self.chunks = 0
+        self.max_chunk_duration = 0.0
+        self.error = ""
+
+
+def _stack():
+    if not hasattr(_local, "runs"):
+        _local.runs = []
+    return _local.runs
+
+
+def is_recorded(task):
+    """Whether runs of ``task`` are recorded."""
+    return task is not None and task.name.startswith(TASK_PREFIX)
+
+
+def start_run(task_id):
+    """Open a run; nested runs (e.g. eager chords) stack."""
+    _stack().append(RunStats(task_id))
+
+
+def fail_run(task_id, exception):
+    """Note the exception that failed the current run."""
+    runs = _stack()
+    if runs and runs[-1].task_id == task_id:
+        runs[-1].error = f"{type(exception).__name__}: {exception}"
+
+
+def finish_run(task, task_id, state):
+    """Close the current run and save it."""
+    runs = _stack()
+    if not runs or runs[-1].task_id != task_id:
+        return
+    stats = runs.pop()
+    try:
+        TaskRun.objects.create(
+            task_name=task.name[len(TASK_PREFIX):],
+            task_id=task_id or "",
+            status="success" if state == "SUCCESS" else "failure",
+            started_at=stats.started_at,
+            finished_at=now(),
+            duration=time.perf_counter() - stats.started,
+            rows_scanned=stats.rows_scanned,
+            rows_changed=stats.rows_changed,
+            chunks=stats.chunks,
+            max_chunk_duration=stats.max_chunk_duration,
+            error=stats.error,
+        )
+    except Exception:  # pylint:disable=W0718
+        # Telemetry must never fail the task it describes.
+        logger.exception("Could not record run of %s", task.name)
+
+
+def add_rows(scanned=0, changed=0):
+    """Add to the rows scanned and changed by the current run."""
+    runs = _stack()
+    if runs:
+        runs[-1].rows_scanned += scanned
+        runs[-1].rows_changed += changed
+
+
+def record_chunk(duration, scanned=0, changed=0):
+    """Record one chunk of the current run, taking ``duration`` seconds."""
+    runs = _stack()
+    if runs:
+        runs[-1].chunks += 1
+        runs[-1].max_chunk_duration = max(runs[-1].max_chunk_duration, duration)
+    add_rows(scanned, changed)
+
+
+def prune_runs():
+    """Delete runs older than ``BILLING_TASK_RUN_RETENTION_DAYS``; return how many."""
+    cutoff = now() - timedelta(days=getattr(settings, "BILLING_TASK_RUN_RETENTION_DAYS", 30))
+    deleted, _ = TaskRun.objects.filter(started_at__lt=cutoff).delete()
+    return deleted
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_metrics():
+    """
+    Render the run history in the Prometheus text exposition format.
+
+    Run counts cover the retained history; the ``last_*`` gauges describe
+    each task's most recent run.
+    """
+    lines = [
+        "# HELP billing_task_runs Task runs in the retained history.",
+        "# TYPE billing_task_runs gauge",
+    ]
+    for row in TaskRun.objects.values("task_name", "status").annotate(
+        runs=Count("id")
+    ).order_by("task_name", "status"):
+        lines.append(
+            f'billing_task_runs{{task="{_label(row["task_name"])}",'
+            f'status="{row["status"]}"}} {row["runs"]}'
+        )
+
+    latest = list(
+        TaskRun.objects.filter(
+            id__in=TaskRun.objects.values("task_name")
+            .annotate(last_id=Max("id"))
+            .values("last_id")
+        ).order_by("task_name")
+    )
+    gauges = [
+        ("last_duration_seconds", "Duration of the last run.", lambda run: run.duration),
+        ("last_rows_scanned", "Rows scanned by the last run.", lambda run: run.rows_scanned),
+        ("last_rows_changed", "Rows changed by the last run.", lambda run: run.rows_changed),
+        ("last_chunks", "Chunks processed by the last run.", lambda run: run.chunks),
+        (
+            "last_max_chunk_seconds",
+            "Slowest chunk of the last run.",
+            lambda run: run.max_chunk_duration,
+        ),
+        (
+            "last_failed",
+            "1 if the last run failed.",
+            lambda run: int(run.status == "failure"),
+        ),
+        (
+            "last_finished_timestamp_seconds",
+            "When the last run finished.",
+            lambda run: run.finished_at.timestamp(),
+        ),
+    ]
+    for name, description, value in gauges:
+        lines.append(f"# HELP billing_task_{name} {description}")
+        lines.append(f"# TYPE billing_task_{name} gauge")
+        lines.extend(
+            f'billing_task_{name}{{task="{_label(run.task_name)}"}} {value(run)}'
+            for run in latest
+        )
+
+    lines.append(
+        "# HELP billing_task_last_success_timestamp_seconds When the task last succeeded."
+    )
+    lines.append("# TYPE billing_task_last_success_timestamp_seconds gauge")
+    for row in TaskRun.objects.filter(status="success").values("task_name").annotate(
+        finished_at=Max("finished_at")
+    ).order_by("task_name"):
+        lines.append(
+            f'billing_task_last_success_timestamp_seconds{{task="{_label(row["task_name"])}"}} '
+            f'{row["finished_at"].timestamp()}'
+        )
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,42 @@
+"""
+Test helpers for holding endpoints to a query budget.
+
+Usage::
+
+    class InvoiceTests(QueryBudgetMixin, APITestCase):
+        def test_list(self):
+            with self.assertQueryBudget(2):
+                self.client.get("/api/invoices/")
+"""
+
+from contextlib import contextmanager
+from .middleware import QueryRecorder, recording
+
+
+class QueryBudgetMixin:
+    """TestCase mixin asserting how many queries a block of code runs."""
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries, max_repeats=2):  # pylint:disable=C0103
+        """
+        Fail if the block runs more than ``max_queries`` statements, or runs
+        any one statement more than ``max_repeats`` times (a likely N+1).
+
+        Yields the ``QueryRecorder`` so the test can inspect the queries.
+        """
+        with recording(QueryRecorder()) as recorder:
+            yield recorder
+
+        statements = "\n".join(f"  {sql}" for sql, _ in recorder.queries)
+        self.assertLessEqual(
+            recorder.count,
+            max_queries,
+            f"{recorder.count} queries over a budget of {max_queries}:\n{statements}",
+        )
+        repeated = recorder.repeated(max_repeats + 1)
+        self.assertFalse(
+            repeated,
+            "Likely N+1, statements repeated more than "
+            f"{max_repeats} times:\n"
+            + "\n".join(f"  {times}x {sql}" for sql, times in repeated.items()),
+        )
@@ -1,5 +1,23 @@
 # pylint:disable=all
-from django.test import TestCase
+import csv
+import hashlib
+import hmac
+import io
+import json
+import os
+import time
+import tempfile
+from unittest import mock
+from urllib.parse import parse_qs
+import stripe
+from io import StringIO
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from rest_framework_simplejwt.tokens import RefreshToken
 
 # Create your tests here.
@@ -7,10 +25,57 @@ from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
-from .models import Plan, Subscription, Invoice
+from .models import (
+    ArchivedInvoice,
+    Invoice,
+    Plan,
+    PlanSubscriptionSummary,
+    ReceivableBalance,
+    StripeEvent,
+    Subscription,
+    TaskRun,
+    UserBillingSummary,
+)
+from billingapi.celery import app as celery_app
+from .billing import (
+    RenewalResult,
+    add_months,
+    mark_invoices_paid,
+    mark_overdue_chunk,
+    renew_due_subscriptions,
+)
+from . import catalog, payments, provisioning
+from .serializers import (
+    InvoiceSerializer,
+    PlanSerializer,
+    SubscriptionSerializer,
+    ValuesReader,
+)
+from .authentication import user_cache_key
+from .middleware import QueryTimingMiddleware
+from .signals import invoices_marked_overdue
+from .testing import QueryBudgetMixin
+from .tasks import (
+    archive_paid_invoices,
+    generate_daily_invoices,
+    generate_daily_invoices_sharded,
+    generate_invoice_shard,
+    mark_overdue_invoices,
+    process_stripe_events,
+    prune_task_runs,
+    reconcile_billing_summaries,
+    send_pending_invoice_reminders,
+    summarize_invoice_shards,
+)
+from . import notifications
+from .transitions import cancel_subscription, pay_invoice
 
 User = get_user_model()
 
@@ -154,6 +219,29 @@ class SubscriptionViewSetTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn("already have an active subscription", str(response.data))
 
+    def test_database_enforces_single_active_subscription(self):
+        Subscription.objects.create(
+            user=self.normal_user,
+            plan=self.plan,
+            start_date=datetime.now(),
+            end_date=datetime.now() + timedelta(days=30),
+        )
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Subscription.objects.create(
+                user=self.normal_user,
+                plan=self.plan,
+                start_date=datetime.now(),
+                end_date=datetime.now() + timedelta(days=30),
+            )
+        Subscription.objects.create(
+            user=self.normal_user,
+            plan=self.plan,
+            status="cancelled",
+            start_date=datetime.now(),
+            end_date=datetime.now() + timedelta(days=30),
+        )
+        self.assertEqual(Subscription.objects.count(), 2)
+
     def test_user_can_view_their_own_subscriptions(self):
         sub = Subscription.objects.create(
             user=self.normal_user,
@@ -166,8 +254,8 @@ class SubscriptionViewSetTests(APITestCase):
 
         response = self.client.get(self.subscription_list_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]["id"], sub.id)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["id"], sub.id)
 
     def test_admin_can_view_all_subscriptions(self):
         Subscription.objects.create(
@@ -181,7 +269,7 @@ class SubscriptionViewSetTests(APITestCase):
 
         response = self.client.get(self.subscription_list_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertGreaterEqual(len(response.data), 1)
+        self.assertGreaterEqual(len(response.data["results"]), 1)
 
     def test_unauthenticated_user_cannot_access_subscriptions(self):
         response = self.client.get(self.subscription_list_url)
@@ -279,21 +367,102 @@ class InvoiceViewSetTests(APITestCase):
         self.authenticate(self.normal_user)
         response = self.client.get(self.invoice_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]["id"], self.invoice.id)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["id"], self.invoice.id)
 
     def test_user_can_filter_invoices_by_status(self):
         self.authenticate(self.normal_user)
         response = self.client.get(self.invoice_url + "?status=pending")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]["status"], "pending")
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["status"], "pending")
 
     def test_admin_can_view_all_invoices(self):
         self.authenticate(self.admin_user)
         response = self.client.get(self.invoice_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertGreaterEqual(len(response.data), 1)
+        self.assertGreaterEqual(len(response.data["results"]), 1)
+
+    def test_invoice_list_is_cursor_paginated(self):
+        for days in range(1, 5):
+            Invoice.objects.create(
+                user=self.normal_user,
+                subscription=self.subscription,
+                plan=self.plan,
+                amount=100,
+                issue_date=timezone.now().date() - timedelta(days=days),
+                due_date=timezone.now().date(),
+            )
+        self.authenticate(self.normal_user)
+
+        seen = []
+        url = self.invoice_url + "?page_size=2"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data["results"]), 2)
+            seen += [row["issue_date"] for row in response.data["results"]]
+            url = response.data["next"]
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_cursor_walks_more_same_date_rows_than_an_offset_cutoff(self):
+        # More rows sharing one issue date than DRF's offset_cutoff (1000).
+        issue_date = timezone.now().date() - timedelta(days=1)
+        subscriptions = Subscription.objects.bulk_create(
+            Subscription(
+                user=self.normal_user, plan=self.plan, status="expired",
+                start_date=issue_date, end_date=issue_date, next_billing_date=issue_date,
+            )
+            for _ in range(1100)
+        )
+        Invoice.objects.bulk_create(
+            Invoice(
+                user=self.normal_user, subscription=subscription, plan=self.plan,
+                amount=100, issue_date=issue_date, due_date=issue_date,
+            )
+            for subscription in subscriptions
+        )
+        expected = list(
+            Invoice.objects.order_by("-issue_date", "-id").values_list("id", flat=True)
+        )
+        self.authenticate(self.admin_user)
+
+        seen, pages = [], []
+        url = self.invoice_url + "?page_size=500"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.data)
+            seen += [row["id"] for row in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(seen, expected)
+
+        back = self.client.get(pages[-1]["previous"]).data
+        self.assertEqual(back["results"], pages[-2]["results"])
+        self.assertEqual(self.client.get(back["previous"]).data["results"], pages[0]["results"])
+        self.assertIsNone(self.client.get(back["previous"]).data["previous"])
+
+    def test_invalid_cursor_is_not_found(self):
+        self.authenticate(self.normal_user)
+        response = self.client.get(self.invoice_url, {"cursor": "bm90LWEtY3Vyc29y"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(BILLING_MAX_PAGE_SIZE=1)
+    def test_page_size_is_capped(self):
+        Invoice.objects.create(
+            user=self.normal_user,
+            subscription=self.subscription,
+            plan=self.plan,
+            amount=100,
+            issue_date=timezone.now().date() - timedelta(days=1),
+            due_date=timezone.now().date(),
+        )
+        self.authenticate(self.normal_user)
+        response = self.client.get(self.invoice_url + "?page_size=100")
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertIsNotNone(response.data["next"])
 
     # def test_user_can_pay_invoice(self):
     #     self.authenticate(self.normal_user)
@@ -317,4 +486,1938 @@ class InvoiceViewSetTests(APITestCase):
 
     def test_unauthenticated_access_denied(self):
         response = self.client.get(self.invoice_url)
-        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class GenerateDailyInvoicesTests(TestCase):
+    def setUp(self):
+        self.plan = Plan.objects.create(name="pro", price=250)
+        self.today = timezone.now().date()
+        self.users = [
+            User.objects.create(username=f"bulk{i}") for i in range(3)
+        ]
+        self.subs = [
+            Subscription.objects.create(
+                user=user,
+                plan=self.plan,
+                start_date=self.today,
+                end_date=self.today + timedelta(days=30),
+                status="active",
+            )
+            for user in self.users
+        ]
+
+    def test_creates_one_invoice_per_active_subscription(self):
+        self.subs[2].status = "cancelled"
+        self.subs[2].save()
+
+        result = generate_daily_invoices()
+
+        self.assertEqual(result, "2 invoices generated.")
+        invoices = Invoice.objects.order_by("subscription_id")
+        self.assertEqual(
+            [inv.subscription_id for inv in invoices],
+            [self.subs[0].id, self.subs[1].id],
+        )
+        for invoice in invoices:
+            self.assertEqual(invoice.amount, 250)
+            self.assertEqual(invoice.status, "pending")
+            self.assertEqual(invoice.due_date, self.today + timedelta(days=7))
+
+    def test_rerun_is_idempotent(self):
+        generate_daily_invoices()
+        result = generate_daily_invoices()
+
+        self.assertEqual(result, "0 invoices generated.")
+        self.assertEqual(Invoice.objects.count(), 3)
+
+    def test_query_count_does_not_grow_with_subscriptions(self):
+        catalog.get_catalog()
+        with CaptureQueriesContext(connection) as small_run:
+            generate_daily_invoices()
+
+        Invoice.objects.all().delete()
+        for i in range(10):
+            Subscription.objects.create(
+                user=User.objects.create(username=f"more{i}"),
+                plan=self.plan,
+                start_date=self.today,
+                end_date=self.today + timedelta(days=30),
+            )
+        Subscription.objects.update(next_billing_date=self.today)
+        with CaptureQueriesContext(connection) as large_run:
+            generate_daily_invoices()
+
+        self.assertEqual(Invoice.objects.count(), 13)
+        self.assertEqual(len(small_run), len(large_run))
+
+
+class RenewalEngineTests(TestCase):
+    def setUp(self):
+        self.plan = Plan.objects.create(name="pro", price=250)
+        self.user = User.objects.create(username="renewer")
+
+    def subscribe(self, start_date, end_date, **kwargs):
+        return Subscription.objects.create(
+            user=self.user,
+            plan=self.plan,
+            start_date=start_date,
+            end_date=end_date,
+            **kwargs,
+        )
+
+    def test_new_subscription_is_due_on_start_date(self):
+        sub = self.subscribe(date(2025, 1, 31), date(2026, 1, 31))
+        self.assertEqual(sub.next_billing_date, date(2025, 1, 31))
+
+    def test_catches_up_missed_renewals_and_advances_next_billing_date(self):
+        sub = self.subscribe(date(2025, 1, 31), date(2026, 1, 31))
+
+        result = renew_due_subscriptions(date(2025, 3, 31))
+
+        self.assertEqual(result, RenewalResult(renewed=1, invoiced=3))
+        self.assertEqual(
+            list(Invoice.objects.order_by("issue_date").values_list("issue_date", flat=True)),
+            [date(2025, 1, 31), date(2025, 2, 28), date(2025, 3, 31)],
+        )
+        sub.refresh_from_db()
+        self.assertEqual(sub.next_billing_date, date(2025, 4, 30))
+
+    def test_already_issued_invoices_are_not_counted(self):
+        sub = self.subscribe(date(2025, 1, 31), date(2026, 1, 31))
+        Invoice.objects.create(
+            user=self.user, plan=self.plan, subscription=sub, amount=250,
+            issue_date=date(2025, 2, 28), due_date=date(2025, 3, 7),
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = renew_due_subscriptions(date(2025, 3, 31))
+
+        self.assertEqual(result, RenewalResult(renewed=1, invoiced=2))
+        self.assertEqual(Invoice.objects.count(), 3)
+        self.assertEqual(
+            UserBillingSummary.objects.values_list("pending_invoices", flat=True).get(
+                user=self.user
+            ),
+            3,
+        )
+
+    def test_not_due_and_inactive_subscriptions_are_ignored(self):
+        self.subscribe(date(2025, 4, 1), date(2026, 4, 1))
+        self.subscribe(date(2025, 1, 1), date(2026, 1, 1), status="cancelled")
+
+        result = renew_due_subscriptions(date(2025, 3, 31))
+
+        self.assertEqual(result, RenewalResult(renewed=0, invoiced=0))
+
+    def test_yearly_interval_and_end_date(self):
+        sub = self.subscribe(
+            date(2023, 6, 1), date(2024, 12, 31), billing_interval="yearly"
+        )
+
+        result = renew_due_subscriptions(date(2025, 6, 1))
+
+        self.assertEqual(result.invoiced, 2)
+        sub.refresh_from_db()
+        self.assertEqual(sub.next_billing_date, date(2026, 6, 1))
+        self.assertFalse(renew_due_subscriptions(date(2025, 6, 1)).renewed)
+
+    def test_add_months_clamps_to_month_end(self):
+        self.assertEqual(add_months(date(2024, 1, 31), 1), date(2024, 2, 29))
+        self.assertEqual(add_months(date(2024, 2, 29), 1, 31), date(2024, 3, 31))
+        self.assertEqual(add_months(date(2024, 11, 15), 2), date(2025, 1, 15))
+
+
+class ShardedInvoiceGenerationTests(TestCase):
+    def setUp(self):
+        self.plan = Plan.objects.create(name="basic", price=100)
+        self.today = timezone.now().date()
+        self.subs = [
+            Subscription.objects.create(
+                user=User.objects.create(username=f"shard{i}"),
+                plan=self.plan,
+                start_date=self.today,
+                end_date=self.today + timedelta(days=30),
+            )
+            for i in range(5)
+        ]
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", False)
+
+    def test_shard_only_renews_its_id_range(self):
+        first, last = self.subs[0].id, self.subs[-1].id
+        generate_invoice_shard(first, first + 1, self.today.isoformat())
+
+        result = generate_invoice_shard(first, last, self.today.isoformat())
+
+        self.assertEqual(
+            result,
+            {"start_id": first, "end_id": last, "created": 3, "skipped": 0, "failed": 0},
+        )
+        self.assertEqual(Invoice.objects.count(), 5)
+
+    def test_coordinator_splits_by_shard_size_and_max_shards(self):
+        with self.settings(BILLING_INVOICE_SHARD_SIZE=2, BILLING_INVOICE_MAX_SHARDS=10):
+            self.assertEqual(
+                generate_daily_invoices_sharded(), "3 invoice shards dispatched."
+            )
+        self.assertEqual(Invoice.objects.count(), 5)
+
+        Invoice.objects.all().delete()
+        Subscription.objects.update(next_billing_date=self.today)
+        with self.settings(BILLING_INVOICE_SHARD_SIZE=1, BILLING_INVOICE_MAX_SHARDS=2):
+            self.assertEqual(
+                generate_daily_invoices_sharded(), "2 invoice shards dispatched."
+            )
+        self.assertEqual(Invoice.objects.count(), 5)
+
+    def test_summary_collects_failed_shards(self):
+        summary = summarize_invoice_shards(
+            [
+                {"start_id": 1, "end_id": 10, "created": 8, "skipped": 2, "failed": 0},
+                {"start_id": 11, "end_id": 20, "created": 0, "skipped": 0, "failed": 4},
+            ]
+        )
+        self.assertEqual(
+            summary,
+            {
+                "shards": 2,
+                "created": 8,
+                "skipped": 2,
+                "failed": 4,
+                "failed_shards": [[11, 20]],
+            },
+        )
+
+
+@override_settings(
+    BILLING_REMINDER_BACKEND="billingapp.notifications.LocMemReminderBackend",
+    BILLING_REMINDER_BATCH_SIZE=2,
+)
+class PendingInvoiceReminderTests(TestCase):
+    def setUp(self):
+        notifications.outbox.clear()
+        self.addCleanup(notifications.outbox.clear)
+        plan = Plan.objects.create(name="basic", price=100)
+        self.today = timezone.now().date()
+        self.invoices = []
+        for i, (status_, due_in) in enumerate(
+            [("pending", 3), ("pending", 0), ("pending", 5), ("pending", -1), ("paid", 3)]
+        ):
+            user = User.objects.create(username=f"remind{i}")
+            sub = Subscription.objects.create(
+                user=user,
+                plan=plan,
+                start_date=self.today,
+                end_date=self.today + timedelta(days=30),
+            )
+            self.invoices.append(
+                Invoice.objects.create(
+                    user=user,
+                    plan=plan,
+                    subscription=sub,
+                    amount=100,
+                    issue_date=self.today,
+                    due_date=self.today + timedelta(days=due_in),
+                    status=status_,
+                )
+            )
+
+    def test_sends_reminders_for_pending_invoices_not_yet_due(self):
+        result = send_pending_invoice_reminders()
+
+        self.assertEqual(result, "3 reminders sent.")
+        self.assertEqual(len(notifications.outbox), 3)
+        self.assertIn(
+            f"Invoice #{self.invoices[0].id} for user remind0 is still pending.",
+            notifications.outbox[0],
+        )
+        self.assertEqual(
+            Invoice.objects.filter(reminder_sent_at__isnull=False).count(), 3
+        )
+
+    def test_rerun_skips_reminded_invoices(self):
+        send_pending_invoice_reminders()
+        notifications.outbox.clear()
+
+        self.assertEqual(send_pending_invoice_reminders(), "0 reminders sent.")
+        self.assertEqual(notifications.outbox, [])
+
+    def test_query_count_is_per_batch_not_per_invoice(self):
+        # One streaming select plus one stamp update per batch of two.
+        with self.assertNumQueries(3):
+            send_pending_invoice_reminders()
+
+    def test_file_backend_appends_reminders(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "reminders.log")
+            with self.settings(
+                BILLING_REMINDER_BACKEND="billingapp.notifications.FileReminderBackend",
+                BILLING_REMINDER_FILE_PATH=path,
+            ):
+                send_pending_invoice_reminders()
+            with open(path, encoding="utf-8") as stream:
+                self.assertEqual(len(stream.readlines()), 3)
+
+
+@override_settings(BILLING_OVERDUE_CHUNK_SIZE=2, BILLING_OVERDUE_CHUNK_PAUSE=0)
+class MarkOverdueInvoicesTests(TestCase):
+    def setUp(self):
+        plan = Plan.objects.create(name="basic", price=100)
+        self.user = User.objects.create(username="late")
+        self.sub = Subscription.objects.create(
+            user=self.user,
+            plan=plan,
+            start_date=date(2025, 1, 1),
+            end_date=date(2026, 1, 1),
+        )
+        self.today = timezone.now().date()
+        self.invoices = [
+            Invoice.objects.create(
+                user=self.user,
+                plan=plan,
+                subscription=self.sub,
+                amount=100,
+                issue_date=date(2025, 1, 1) + timedelta(days=i),
+                due_date=self.today + timedelta(days=due_in),
+                status=status_,
+            )
+            for i, (status_, due_in) in enumerate(
+                [
+                    ("pending", -3),
+                    ("pending", -2),
+                    ("paid", -2),
+                    ("pending", -1),
+                    ("pending", 0),
+                    ("pending", -5),
+                ]
+            )
+        ]
+
+    def test_marks_past_due_pending_invoices_in_chunks(self):
+        chunks = []
+
+        def receiver(sender, invoice_ids, **kwargs):
+            chunks.append(invoice_ids)
+
+        invoices_marked_overdue.connect(receiver)
+        self.addCleanup(invoices_marked_overdue.disconnect, receiver)
+
+        result = mark_overdue_invoices()
+
+        ids = [invoice.id for invoice in self.invoices]
+        self.assertEqual(result, "4 invoices marked as overdue.")
+        self.assertEqual(chunks, [[ids[0], ids[1]], [ids[3], ids[5]]])
+        self.assertEqual(
+            set(Invoice.objects.filter(status="overdue").values_list("id", flat=True)),
+            {ids[0], ids[1], ids[3], ids[5]},
+        )
+
+    def test_chunk_returns_only_changed_ids(self):
+        ids = [invoice.id for invoice in self.invoices]
+
+        self.assertEqual(
+            mark_overdue_chunk(self.today, after_id=ids[0], limit=10),
+            [ids[1], ids[3], ids[5]],
+        )
+        self.assertEqual(mark_overdue_chunk(self.today, after_id=ids[0], limit=10), [])
+
+
+class RevenueSummaryTests(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.now().date()
+        self.basic = Plan.objects.create(name="basic", price=100)
+        self.pro = Plan.objects.create(name="pro", price=1200)
+        self.admin = User.objects.create_user(username="finance", password="x", is_staff=True)
+        self.user = User.objects.create_user(username="payer", password="x")
+
+    def subscribe(self, plan, interval="monthly", username=None, **kwargs):
+        user = User.objects.create(username=username) if username else self.user
+        return Subscription.objects.create(
+            user=user, plan=plan, billing_interval=interval,
+            start_date=self.today, end_date=self.today + timedelta(days=730), **kwargs
+        )
+
+    def invoice(self, subscription, days_overdue, amount=100, status_="pending"):
+        due_date = self.today - timedelta(days=days_overdue)
+        return Invoice.objects.create(
+            user=subscription.user, plan=subscription.plan, subscription=subscription,
+            amount=amount, issue_date=due_date - timedelta(days=7), due_date=due_date,
+            status=status_,
+        )
+
+    def report(self):
+        token = RefreshToken.for_user(self.admin).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        response = self.client.get(reverse("reports"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def summaries(self):
+        return (
+            set(PlanSubscriptionSummary.objects.filter(active_subscriptions__gt=0).values_list(
+                "plan__name", "billing_interval", "active_subscriptions"
+            )),
+            {
+                row.due_date: (row.invoices, row.amount)
+                for row in ReceivableBalance.objects.filter(invoices__gt=0)
+            },
+        )
+
+    def test_subscription_changes_update_mrr(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            monthly = self.subscribe(self.basic)
+            self.subscribe(self.pro, "yearly", username="yearly")
+            self.subscribe(self.basic, username="gone", status="cancelled")
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("subscription-unsubscribe", kwargs={"pk": monthly.id}))
+
+        mrr = self.report()["mrr"]
+        self.assertEqual(mrr["total"], "100.00")
+        self.assertEqual(
+            mrr["plans"],
+            [{
+                "plan_id": self.pro.id, "plan": "pro",
+                "monthly_subscriptions": 0, "yearly_subscriptions": 1, "mrr": "100.00",
+            }],
+        )
+
+    def test_invoice_changes_update_receivables_and_aging(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            sub = self.subscribe(self.basic, next_billing_date=self.today)
+            for days_overdue in (-3, 0, 10, 45, 90):
+                self.invoice(sub, days_overdue)
+            self.invoice(sub, 20, status_="paid")
+            generate_daily_invoices()
+        late = Invoice.objects.get(due_date=self.today - timedelta(days=90))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("payment-success"), {"invoice_id": late.id})
+            mark_invoices_paid({Invoice.objects.get(due_date=self.today).id: timezone.now()})
+
+        receivables = self.report()["receivables"]
+        self.assertEqual(receivables["outstanding_invoices"], 4)
+        self.assertEqual(receivables["outstanding_amount"], "400.00")
+        self.assertEqual(
+            receivables["aging"],
+            {
+                "current": {"invoices": 2, "amount": "200.00"},
+                "1-30": {"invoices": 1, "amount": "100.00"},
+                "31-60": {"invoices": 1, "amount": "100.00"},
+                "61+": {"invoices": 0, "amount": "0.00"},
+            },
+        )
+
+    def test_summaries_match_reconcile(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            sub = self.subscribe(self.basic)
+            self.subscribe(self.pro, "yearly", username="yearly")
+            invoice = self.invoice(sub, 3, amount=Decimal("99.50"))
+            self.invoice(sub, 40)
+            invoice.amount = 120
+            invoice.save()
+            Invoice.objects.filter(due_date=self.today - timedelta(days=40)).get().delete()
+        maintained = self.summaries()
+
+        self.assertEqual(reconcile_billing_summaries(), "0 summary rows repaired.")
+        self.assertEqual(self.summaries(), maintained)
+
+    def test_reconcile_repairs_drift(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            sub = self.subscribe(self.basic)
+            self.invoice(sub, 3)
+        Invoice.objects.update(amount=250)
+        Subscription.objects.update(billing_interval="yearly")
+        ReceivableBalance.objects.create(due_date=date(2020, 1, 1), invoices=1, amount=5)
+
+        # The amount change also drifts the user's billing summary.
+        with self.assertLogs("billingapp.reports", "WARNING"):
+            self.assertEqual(reconcile_billing_summaries(), "5 summary rows repaired.")
+        self.assertEqual(
+            self.summaries(),
+            (
+                {("basic", "yearly", 1)},
+                {self.today - timedelta(days=3): (1, Decimal("250.00"))},
+            ),
+        )
+
+    def test_deleting_a_plan_with_active_subscriptions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.subscribe(self.basic)
+            self.subscribe(self.basic, "yearly", username="yearly")
+            self.subscribe(self.pro, username="pro")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.basic.delete()
+
+        self.assertEqual(self.summaries()[0], {("pro", "monthly", 1)})
+        self.assertEqual(reconcile_billing_summaries(), "0 summary rows repaired.")
+
+    def test_deletes_report_rows_with_one_grouped_query(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            sub = self.subscribe(self.basic)
+            other = self.subscribe(self.pro, username="other")
+            for days_overdue in range(20):
+                self.invoice(sub, days_overdue)
+            self.invoice(other, 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertQueryBudget(3) as recorder:
+                Invoice.objects.filter(subscription=sub).delete()
+        self.assertNotIn("payment_client_secret", " ".join(sql for sql, _ in recorder.queries))
+        with self.captureOnCommitCallbacks(execute=True):
+            sub.delete()
+            self.user.delete()
+            User.objects.get(username="other").delete()
+
+        self.assertEqual(self.summaries(), (set(), {}))
+        self.assertEqual(reconcile_billing_summaries(), "0 summary rows repaired.")
+
+    def test_saving_a_loaded_row_does_not_read_it_again(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.invoice(self.subscribe(self.basic), 3)
+        invoice = Invoice.objects.get()
+        invoice.status = "overdue"
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertQueryBudget(3) as recorder:
+                invoice.save()
+            invoice.amount = 80
+            invoice.save()
+        self.assertFalse(
+            [sql for sql, _ in recorder.queries if sql.startswith("SELECT")]
+        )
+        self.assertEqual(reconcile_billing_summaries(), "0 summary rows repaired.")
+
+    def test_report_reads_are_constant_and_admin_only(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            sub = self.subscribe(self.basic)
+            for days_overdue in range(40):
+                self.invoice(sub, days_overdue)
+        catalog.get_catalog()
+        self.report()
+        with self.assertQueryBudget(2):
+            self.client.get(reverse("reports"))
+
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(self.client.get(reverse("reports")).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class TaskTelemetryTests(APITestCase):
+    def setUp(self):
+        self.plan = Plan.objects.create(name="basic", price=100)
+        self.today = timezone.now().date()
+        for i in range(3):
+            user = User.objects.create(username=f"telemetry{i}")
+            sub = Subscription.objects.create(
+                user=user, plan=self.plan, start_date=date(2025, 1, 1),
+                end_date=self.today + timedelta(days=365),
+                next_billing_date=self.today,
+            )
+            Invoice.objects.create(
+                user=user, plan=self.plan, subscription=sub, amount=100,
+                issue_date=date(2025, 1, 1), due_date=self.today - timedelta(days=1),
+            )
+
+    @override_settings(BILLING_OVERDUE_CHUNK_SIZE=2, BILLING_OVERDUE_CHUNK_PAUSE=0)
+    def test_records_rows_and_chunks(self):
+        mark_overdue_invoices.apply()
+
+        run = TaskRun.objects.get()
+        self.assertEqual(run.task_name, "mark_overdue_invoices")
+        self.assertEqual(run.status, "success")
+        self.assertEqual((run.rows_scanned, run.rows_changed, run.chunks), (3, 3, 2))
+        self.assertGreaterEqual(run.max_chunk_duration, 0)
+        self.assertLessEqual(run.started_at, run.finished_at)
+
+    def test_records_failures(self):
+        with mock.patch(
+            "billingapp.tasks.renew_due_subscriptions", side_effect=RuntimeError("db down")
+        ):
+            generate_daily_invoices.apply()
+
+        run = TaskRun.objects.get()
+        self.assertEqual(run.status, "failure")
+        self.assertEqual(run.error, "RuntimeError: db down")
+
+    def test_records_nested_chord_runs_separately(self):
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", False)
+
+        generate_daily_invoices_sharded.apply()
+
+        runs = {run.task_name: run for run in TaskRun.objects.all()}
+        self.assertEqual(
+            set(runs),
+            {"generate_daily_invoices_sharded", "generate_invoice_shard", "summarize_invoice_shards"},
+        )
+        self.assertEqual(runs["generate_invoice_shard"].rows_changed, 3)
+        self.assertEqual(runs["generate_daily_invoices_sharded"].rows_changed, 0)
+
+    @override_settings(BILLING_TASK_RUN_RETENTION_DAYS=7)
+    def test_prunes_old_runs(self):
+        started = timezone.now() - timedelta(days=8)
+        TaskRun.objects.create(
+            task_name="generate_daily_invoices", status="success",
+            started_at=started, finished_at=started, duration=1,
+        )
+
+        self.assertEqual(prune_task_runs.apply().get(), "1 task runs pruned.")
+        self.assertEqual(
+            list(TaskRun.objects.values_list("task_name", "rows_changed")),
+            [("prune_task_runs", 1)],
+        )
+
+    @override_settings(BILLING_METRICS_TOKEN="scrape-me")
+    def test_metrics_endpoint(self):
+        mark_overdue_invoices.apply()
+        with mock.patch(
+            "billingapp.tasks.renew_due_subscriptions", side_effect=RuntimeError("db down")
+        ):
+            generate_daily_invoices.apply()
+
+        self.assertIn(
+            self.client.get(reverse("metrics")).status_code,
+            (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN),
+        )
+        response = self.client.get(reverse("metrics"), HTTP_X_METRICS_TOKEN="scrape-me")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        body = response.content.decode()
+        self.assertIn('billing_task_runs{task="mark_overdue_invoices",status="success"} 1', body)
+        self.assertIn('billing_task_last_rows_changed{task="mark_overdue_invoices"} 3', body)
+        self.assertIn('billing_task_last_failed{task="generate_daily_invoices"} 1', body)
+        self.assertIn('billing_task_last_success_timestamp_seconds{task="mark_overdue_invoices"}', body)
+        self.assertNotIn('billing_task_last_success_timestamp_seconds{task="generate_daily_invoices"}', body)
+
+        admin = User.objects.create_user(username="ops", password="opspass", is_staff=True)
+        token = RefreshToken.for_user(admin).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, status.HTTP_200_OK)
+
+
+class ValuesReaderParityTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="reader", password="readerpass")
+        self.plan = Plan.objects.create(name="pro", price="199.99", description="Pro")
+        self.subscription = Subscription.objects.create(
+            user=self.user,
+            plan=self.plan,
+            start_date=date(2025, 1, 31),
+            end_date=date(2026, 1, 31),
+        )
+        self.invoices = [
+            Invoice.objects.create(
+                user=self.user,
+                plan=plan,
+                subscription=self.subscription,
+                amount="199.99",
+                issue_date=date(2025, 1, 1) + timedelta(days=i),
+                due_date=date(2025, 1, 8) + timedelta(days=i),
+                status=status_,
+                reminder_sent_at=reminded,
+            )
+            for i, (plan, status_, reminded) in enumerate(
+                [
+                    (self.plan, "pending", None),
+                    (None, "paid", timezone.now()),
+                    (self.plan, "overdue", None),
+                ]
+            )
+        ]
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_rows_match_serializer_output(self):
+        for serializer_class, queryset in [
+            (InvoiceSerializer, Invoice.objects.order_by("id")),
+            (SubscriptionSerializer, Subscription.objects.order_by("id")),
+        ]:
+            reader = ValuesReader(serializer_class)
+            self.assertEqual(
+                reader.serialize(reader.values(queryset)),
+                serializer_class(queryset, many=True).data,
+            )
+
+    def test_list_and_retrieve_match_serializer_output(self):
+        expected = InvoiceSerializer(
+            Invoice.objects.order_by("-issue_date", "-id"), many=True
+        ).data
+        response = self.client.get(reverse("invoice-list"))
+        self.assertEqual(response.data["results"], expected)
+
+        invoice = self.invoices[1]
+        response = self.client.get(reverse("invoice-detail", kwargs={"pk": invoice.id}))
+        self.assertEqual(response.data, InvoiceSerializer(invoice).data)
+
+        response = self.client.get(
+            reverse("subscription-detail", kwargs={"pk": self.subscription.id})
+        )
+        self.assertEqual(response.data, SubscriptionSerializer(self.subscription).data)
+
+    def test_retrieve_is_scoped_to_owner(self):
+        other = User.objects.create_user(username="other", password="otherpass")
+        token = RefreshToken.for_user(other).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+        response = self.client.get(
+            reverse("invoice-detail", kwargs={"pk": self.invoices[0].id})
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse("invoice-detail", kwargs={"pk": "abc"}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(BILLING_EXPORT_CHUNK_SIZE=2)
+class InvoiceExportTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username="accounts", password="x", is_staff=True)
+        self.user = User.objects.create_user(username="billed", email="billed@example.com")
+        self.plan = Plan.objects.create(name="basic", price=100)
+        sub = Subscription.objects.create(
+            user=self.user, plan=self.plan, start_date=date(2025, 1, 1), end_date=date(2026, 1, 1)
+        )
+        self.invoices = [
+            Invoice.objects.create(
+                user=self.user, plan=self.plan, subscription=sub, amount="100.00",
+                issue_date=date(2025, month, 1), due_date=date(2025, month, 8), status=status_,
+            )
+            for month, status_ in [(1, "paid"), (2, "overdue"), (3, "pending"), (4, "pending")]
+        ]
+        self.authenticate(self.admin)
+
+    def authenticate(self, user):
+        token = RefreshToken.for_user(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def export(self, **params):
+        return self.client.get(reverse("invoice-export"), params)
+
+    def test_streams_filtered_csv(self):
+        response = self.export(issued_from="2025-02-01", issued_to="2025-03-31")
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertIn('filename="invoices.csv"', response["Content-Disposition"])
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual([row["id"] for row in rows], [str(i.id) for i in self.invoices[1:3]])
+        self.assertEqual(
+            {key: rows[0][key] for key in ("username", "email", "plan", "amount", "status", "paid_at")},
+            {
+                "username": "billed", "email": "billed@example.com", "plan": "basic",
+                "amount": "100.00", "status": "overdue", "paid_at": "",
+            },
+        )
+
+    def test_streams_jsonl_by_status(self):
+        response = self.export(fmt="jsonl", status="pending")
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson; charset=utf-8")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([row["id"] for row in rows], [i.id for i in self.invoices[2:]])
+        self.assertEqual(rows[0]["amount"], "100.00")
+        self.assertEqual(rows[0]["issue_date"], "2025-03-01")
+        self.assertIsNone(rows[0]["paid_at"])
+
+    def test_rejects_bad_parameters_and_non_staff(self):
+        self.assertEqual(self.export(fmt="xml").status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.export(issued_from="2025-13-01").status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.export(issued_to="soon").status_code, status.HTTP_400_BAD_REQUEST)
+        self.authenticate(self.user)
+        self.assertEqual(self.export().status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(BILLING_INVOICE_ARCHIVE_AFTER_DAYS=90, BILLING_INVOICE_ARCHIVE_BATCH_SIZE=2)
+class InvoiceArchiveTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.now().date()
+        self.user = User.objects.create_user(username="archived", password="x")
+        self.other = User.objects.create_user(username="neighbour", password="x")
+        plan = Plan.objects.create(name="basic", price=100)
+        self.invoices = {}
+        for user in (self.user, self.other):
+            sub = Subscription.objects.create(
+                user=user, plan=plan, start_date=date(2020, 1, 1), end_date=date(2030, 1, 1)
+            )
+            for days_ago, status_ in [(400, "paid"), (200, "paid"), (100, "overdue"), (30, "paid")]:
+                issue_date = self.today - timedelta(days=days_ago)
+                self.invoices[(user.username, days_ago)] = Invoice.objects.create(
+                    user=user, plan=plan, subscription=sub, amount=100, issue_date=issue_date,
+                    due_date=issue_date + timedelta(days=7), status=status_,
+                    paid_at=timezone.now() if status_ == "paid" else None,
+                    payment_client_secret="pi_secret",
+                )
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_moves_old_paid_invoices_in_batches(self):
+        self.assertEqual(archive_paid_invoices.apply().get(), "4 invoices archived.")
+
+        moved = [self.invoices[(name, days)] for name in ("archived", "neighbour") for days in (400, 200)]
+        self.assertEqual(
+            sorted(ArchivedInvoice.objects.values_list("id", flat=True)),
+            sorted(invoice.id for invoice in moved),
+        )
+        self.assertFalse(Invoice.objects.filter(id__in=[invoice.id for invoice in moved]).exists())
+        self.assertEqual(Invoice.objects.count(), 4)
+        archived = ArchivedInvoice.objects.get(id=moved[0].id)
+        self.assertEqual(
+            (archived.user_id, archived.amount, archived.issue_date, archived.paid_at),
+            (moved[0].user_id, moved[0].amount, moved[0].issue_date, moved[0].paid_at),
+        )
+        self.assertEqual(TaskRun.objects.get().chunks, 2)
+        self.assertEqual(archive_paid_invoices.apply().get(), "0 invoices archived.")
+
+    def test_viewset_reads_archive_on_request(self):
+        archive_paid_invoices()
+        old = self.invoices[("archived", 400)]
+
+        live = self.client.get(reverse("invoice-list")).data["results"]
+        self.assertEqual(len(live), 2)
+        response = self.client.get(reverse("invoice-list"), {"archived": "true"})
+        self.assertEqual(
+            [row["id"] for row in response.data["results"]],
+            [self.invoices[("archived", 200)].id, old.id],
+        )
+        self.assertNotIn("payment_client_secret", response.data["results"][0])
+
+        detail = reverse("invoice-detail", kwargs={"pk": old.id})
+        self.assertEqual(self.client.get(detail).status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(detail, {"archived": "true"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["amount"], "100.00")
+        self.assertIsNotNone(response.data["archived_at"])
+
+        other = reverse("invoice-detail", kwargs={"pk": self.invoices[("neighbour", 400)].id})
+        self.assertEqual(
+            self.client.get(other, {"archived": "true"}).status_code, status.HTTP_404_NOT_FOUND
+        )
+
+
+class QueryBudgetTests(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="budget", password="budgetpass")
+        self.plan = Plan.objects.create(name="basic", price=100)
+        self.subscription = Subscription.objects.create(
+            user=self.user, plan=self.plan, start_date=date(2025, 1, 1), end_date=date(2027, 1, 1)
+        )
+        self.add_invoices(3)
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        # Prime the cached user so every request below costs the same.
+        self.client.get(reverse("invoice-list"))
+
+    def add_invoices(self, count):
+        start = Invoice.objects.count()
+        Invoice.objects.bulk_create(
+            Invoice(
+                user=self.user, plan=self.plan, subscription=self.subscription, amount=100,
+                issue_date=date(2025, 1, 1) + timedelta(days=start + i),
+                due_date=date(2025, 1, 8), status="pending",
+            )
+            for i in range(count)
+        )
+
+    def test_invoice_list_does_not_grow_with_rows(self):
+        for extra in (0, 40):
+            self.add_invoices(extra)
+            # The page, plus the aggregate its ETag is built from.
+            with self.assertQueryBudget(2):
+                response = self.client.get(reverse("invoice-list"), {"page_size": 100})
+            self.assertEqual(len(response.data["results"]), Invoice.objects.count())
+
+    def test_invoice_and_subscription_endpoints(self):
+        invoice = Invoice.objects.first()
+        for url in [
+            reverse("invoice-detail", kwargs={"pk": invoice.id}),
+            reverse("subscription-list"),
+            reverse("subscription-detail", kwargs={"pk": self.subscription.id}),
+        ]:
+            with self.subTest(url=url), self.assertQueryBudget(2):
+                self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+    def test_admin_changelists_select_related(self):
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        for i in range(5):
+            user = User.objects.create_user(username=f"listed{i}")
+            subscription = Subscription.objects.create(
+                user=user, plan=self.plan, start_date=date(2025, 1, 1), end_date=date(2026, 1, 1)
+            )
+            Invoice.objects.create(
+                user=user, plan=self.plan, subscription=subscription, amount=100,
+                issue_date=date(2025, 1, 1), due_date=date(2025, 1, 8),
+            )
+        self.client.force_login(self.user)
+
+        for model in ("invoice", "subscription"):
+            with self.subTest(model=model), self.assertQueryBudget(6):
+                response = self.client.get(reverse(f"admin:billingapp_{model}_changelist"))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_budget_reports_repeated_statements(self):
+        with self.assertRaisesMessage(AssertionError, "Likely N+1"):
+            with self.assertQueryBudget(10):
+                for invoice in Invoice.objects.all():
+                    str(invoice)
+
+
+@override_settings(
+    BILLING_SERVER_TIMING=True,
+    BILLING_SLOW_REQUEST_MS=10_000,
+    BILLING_SLOW_REQUEST_QUERIES=3,
+    BILLING_REPEATED_QUERY_THRESHOLD=3,
+)
+class QueryTimingMiddlewareTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="timed", password="timedpass")
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse("invoice-list"))
+        metrics = [metric.strip() for metric in response["Server-Timing"].split(",")]
+        self.assertRegex(metrics[0], r'^db;dur=[\d.]+;desc="3 queries"$')
+        self.assertRegex(metrics[1], r"^app;dur=[\d.]+$")
+        self.assertRegex(metrics[2], r"^total;dur=[\d.]+$")
+
+    @override_settings(BILLING_SERVER_TIMING=False)
+    def test_header_is_optional(self):
+        response = self.client.get(reverse("invoice-list"))
+        self.assertNotIn("Server-Timing", response)
+
+    def test_logs_slow_requests_and_repeated_queries(self):
+        plan = Plan.objects.create(name="basic", price=100)
+        subscription = Subscription.objects.create(
+            user=self.user, plan=plan, start_date=date(2025, 1, 1), end_date=date(2026, 1, 1)
+        )
+        for i in range(3):
+            Invoice.objects.create(
+                user=self.user, plan=plan, subscription=subscription, amount=100,
+                issue_date=date(2025, 1, 1) + timedelta(days=i), due_date=date(2025, 1, 8),
+            )
+
+        def view(request):
+            return HttpResponse(", ".join(str(invoice) for invoice in Invoice.objects.all()))
+
+        with self.assertLogs("billingapp.middleware", "WARNING") as logs:
+            QueryTimingMiddleware(view)(RequestFactory().get("/report/"))
+        self.assertIn("Slow request GET /report/", logs.output[0])
+        self.assertIn("4 queries", logs.output[0])
+        self.assertIn("Likely N+1 on GET /report/: query ran 3 times", logs.output[1])
+
+    def test_counts_async_view_queries(self):
+        token = RefreshToken.for_user(self.user).access_token
+        response = async_to_sync(self.async_client.get)(
+            reverse("async-invoice-list"), headers={"Authorization": f"Bearer {token}"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('desc="2 queries"', response["Server-Timing"])
+
+
+class PlanCatalogCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="viewer", password="viewerpass")
+        self.basic = Plan.objects.create(name="basic", price=100)
+        self.pro = Plan.objects.create(name="pro", price="250.50")
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_warm_catalog_is_served_without_plan_queries(self):
+        catalog.get_catalog()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("plan-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data, PlanSerializer(Plan.objects.order_by("id"), many=True).data
+        )
+        self.assertFalse(
+            [q for q in queries.captured_queries if "billingapp_plan" in q["sql"]]
+        )
+
+    def test_retrieve_uses_catalog(self):
+        response = self.client.get(reverse("plan-detail", kwargs={"pk": self.pro.id}))
+        self.assertEqual(response.data, PlanSerializer(self.pro).data)
+        response = self.client.get(reverse("plan-detail", kwargs={"pk": 0}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_plan_save_and_delete_invalidate_catalog(self):
+        self.assertEqual(catalog.plan_prices()[self.pro.id], Decimal("250.50"))
+        version = catalog.catalog_version()
+
+        self.pro.price = 300
+        self.pro.save()
+        self.assertNotEqual(catalog.catalog_version(), version)
+        self.assertEqual(catalog.plan_prices()[self.pro.id], Decimal("300"))
+
+        self.basic.delete()
+        self.assertIsNone(catalog.get_plan(self.basic.id))
+
+    def test_other_processes_see_version_bump(self):
+        catalog.get_catalog()
+        Plan.objects.filter(pk=self.pro.pk).update(price=1)
+        # Another process bumps the shared version; the local copy is dropped.
+        cache.set(catalog.VERSION_KEY, catalog.catalog_version() + 1)
+        self.assertEqual(catalog.plan_prices()[self.pro.id], Decimal("1"))
+
+
+class CachedJWTAuthenticationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="cached", password="cachedpass")
+        self.url = reverse("invoice-list")
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def user_queries(self, queries):
+        return [
+            q for q in queries.captured_queries if 'FROM "billingapp_user"' in q["sql"]
+        ]
+
+    def test_user_is_loaded_once_then_served_from_cache(self):
+        with CaptureQueriesContext(connection) as first:
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        with CaptureQueriesContext(connection) as second:
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+        self.assertEqual(len(self.user_queries(first)), 1)
+        self.assertEqual(self.user_queries(second), [])
+
+    def test_deactivating_user_invalidates_cache(self):
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_staff_change_applies_on_next_request(self):
+        other = User.objects.create_user(username="other", password="otherpass")
+        sub = Subscription.objects.create(
+            user=other,
+            plan=Plan.objects.create(name="basic", price=100),
+            start_date=date(2025, 1, 1),
+            end_date=date(2025, 2, 1),
+        )
+        Invoice.objects.create(
+            user=other, subscription=sub, amount=100,
+            issue_date=date(2025, 1, 1), due_date=date(2025, 1, 8),
+        )
+        self.assertEqual(self.client.get(self.url).data["results"], [])
+
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(len(self.client.get(self.url).data["results"]), 1)
+
+    def test_cache_holds_no_password_hash(self):
+        self.client.get(self.url)
+        cached = cache.get(user_cache_key(self.user.id), version=1)
+        self.assertEqual(
+            cached,
+            {"id": self.user.id, "username": "cached", "is_active": True,
+             "is_staff": False, "is_superuser": False},
+        )
+
+    def test_revoked_token_is_rejected_after_password_change(self):
+        with mock.patch.object(jwt_settings, "CHECK_REVOKE_TOKEN", True):
+            token = RefreshToken.for_user(self.user).access_token
+            self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+            self.assertNotIn(
+                self.user.password,
+                str(cache.get(user_cache_key(self.user.id), version=1)),
+            )
+
+            self.user.set_password("changed")
+            self.user.save()
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class StubStripeHTTPClient(stripe.HTTPClient):
+    """Local stand-in for the Stripe API, in the spirit of stripe-mock."""
+
+    name = "stub"
+
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+        self.intents = {}
+
+    async def request_async(self, method, url, headers, post_data=None):
+        return self.request(method, url, headers, post_data)
+
+    async def close_async(self):
+        pass
+
+    def request(self, method, url, headers, post_data=None):
+        self.requests.append((method, url, dict(headers), post_data))
+        key = headers.get("Idempotency-Key")
+        if key not in self.intents:
+            params = parse_qs(post_data or "")
+            number = len(self.intents) + 1
+            self.intents[key] = {
+                "id": f"pi_{number}",
+                "object": "payment_intent",
+                "amount": int(params["amount"][0]),
+                "client_secret": f"pi_{number}_secret",
+            }
+        return json.dumps(self.intents[key]).encode(), 200, {}
+
+    def close(self):
+        pass
+
+
+@override_settings(STRIPE_SECRET_KEY="sk_test_stub")
+class PaymentIntentServiceTests(APITestCase):
+    def setUp(self):
+        self.http = StubStripeHTTPClient()
+        client = stripe.StripeClient(
+            "sk_test_stub", http_client=self.http, max_network_retries=0
+        )
+        patcher = mock.patch.object(payments, "get_stripe_client", return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        user = User.objects.create(username="payer")
+        plan = Plan.objects.create(name="basic", price=100)
+        sub = Subscription.objects.create(
+            user=user, plan=plan, start_date=date(2025, 1, 1), end_date=date(2025, 2, 1)
+        )
+        self.invoice = Invoice.objects.create(
+            user=user, plan=plan, subscription=sub, amount=Decimal("123.45"),
+            issue_date=date(2025, 1, 1), due_date=date(2025, 1, 8),
+        )
+        self.url = reverse("create-payment-intent")
+
+    def test_intent_is_created_once_and_then_served_from_invoice(self):
+        first = self.client.post(self.url, {"invoice_id": self.invoice.id}, format="json")
+        second = self.client.post(self.url, {"invoice_id": self.invoice.id}, format="json")
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            first.data, {"client_secret": "pi_1_secret", "payment_intent_id": "pi_1"}
+        )
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(len(self.http.requests), 1)
+
+        method, url, headers, post_data = self.http.requests[0]
+        self.assertEqual(method, "post")
+        self.assertTrue(url.endswith("/v1/payment_intents"))
+        self.assertEqual(headers["Idempotency-Key"], f"invoice-{self.invoice.id}-12345")
+        self.assertEqual(parse_qs(post_data)["amount"], ["12345"])
+
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.payment_intent_id, "pi_1")
+
+    def test_client_secret_is_not_exposed_by_invoice_api(self):
+        payments.get_or_create_payment_intent(self.invoice)
+        self.assertNotIn("payment_client_secret", InvoiceSerializer(self.invoice).data)
+
+    def test_paid_invoice_is_not_found(self):
+        self.invoice.status = "paid"
+        self.invoice.save()
+        response = self.client.post(self.url, {"invoice_id": self.invoice.id}, format="json")
+        self.assertNotEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.http.requests, [])
+
+    @override_settings(STRIPE_SECRET_KEY=None)
+    def test_missing_api_key(self):
+        mock.patch.stopall()
+        with self.assertRaisesMessage(ValueError, "Stripe api key not found"):
+            payments.get_stripe_client()
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET="whsec_test")
+class StripeWebhookInboxTests(APITestCase):
+    def setUp(self):
+        self.url = reverse("stripe-webhook")
+        user = User.objects.create(username="hooked")
+        plan = Plan.objects.create(name="basic", price=100)
+        sub = Subscription.objects.create(
+            user=user, plan=plan, start_date=date(2025, 1, 1), end_date=date(2025, 2, 1)
+        )
+        self.invoices = [
+            Invoice.objects.create(
+                user=user, plan=plan, subscription=sub, amount=100,
+                issue_date=date(2025, 1, 1) + timedelta(days=i),
+                due_date=date(2025, 1, 8), status=status_,
+            )
+            for i, status_ in enumerate(["pending", "overdue", "pending"])
+        ]
+
+    def event(self, event_id, invoice_id, event_type="payment_intent.succeeded"):
+        return {
+            "id": event_id,
+            "type": event_type,
+            "data": {"object": {"id": "pi_1", "metadata": {"invoice_id": str(invoice_id)}}},
+        }
+
+    def deliver(self, event, secret="whsec_test"):
+        payload = json.dumps(event)
+        timestamp = int(time.time())
+        signature = hmac.new(
+            secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256
+        ).hexdigest()
+        return self.client.post(
+            self.url,
+            payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=f"t={timestamp},v1={signature}",
+        )
+
+    def test_verified_events_are_stored_once(self):
+        event = self.event("evt_1", self.invoices[0].id)
+        self.assertEqual(self.deliver(event).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.deliver(event).status_code, status.HTTP_200_OK)
+
+        self.assertEqual(StripeEvent.objects.count(), 1)
+        self.invoices[0].refresh_from_db()
+        self.assertEqual(self.invoices[0].status, "pending")
+
+    def test_bad_signature_is_rejected(self):
+        response = self.deliver(self.event("evt_1", 1), secret="whsec_wrong")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    @override_settings(BILLING_STRIPE_EVENT_BATCH_SIZE=2)
+    def test_consumer_applies_payments_in_batches(self):
+        self.deliver(self.event("evt_1", self.invoices[0].id))
+        self.deliver(self.event("evt_2", self.invoices[1].id))
+        self.deliver(self.event("evt_3", self.invoices[2].id, "payment_intent.payment_failed"))
+        self.deliver(self.event("evt_4", self.invoices[0].id))
+
+        self.assertEqual(process_stripe_events(), "4 Stripe events processed.")
+        self.assertEqual(
+            [inv.status for inv in Invoice.objects.order_by("id")],
+            ["paid", "paid", "pending"],
+        )
+        self.assertFalse(StripeEvent.objects.filter(processed_at__isnull=True).exists())
+        self.assertEqual(process_stripe_events(), "0 Stripe events processed.")
+
+
+class ImportSettlementsCommandTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username="settled")
+        plan = Plan.objects.create(name="basic", price=100)
+        sub = Subscription.objects.create(
+            user=user, plan=plan, start_date=date(2025, 1, 1), end_date=date(2025, 2, 1)
+        )
+        self.invoices = [
+            Invoice.objects.create(
+                user=user, plan=plan, subscription=sub, amount=amount,
+                issue_date=date(2025, 1, 1) + timedelta(days=i),
+                due_date=date(2025, 1, 8), status=status_,
+            )
+            for i, (amount, status_) in enumerate(
+                [(100, "pending"), (100, "overdue"), (100, "pending"), (100, "paid")]
+            )
+        ]
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def run_import(self, name, content, *args):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w", encoding="utf-8") as stream:
+            stream.write(content)
+        out = StringIO()
+        call_command("import_settlements", path, *args, stdout=out)
+        return dict(line.split(": ") for line in out.getvalue().splitlines())
+
+    def test_csv_import_reports_and_applies_in_chunks(self):
+        ids = [invoice.id for invoice in self.invoices]
+        report = self.run_import(
+            "settlement.csv",
+            "invoice_id,amount,paid_at\n"
+            f"{ids[0]},100.00,2025-01-05T10:00:00Z\n"
+            f"{ids[1]},100,2025-01-06\n"
+            f"{ids[2]},99.50,2025-01-06\n"
+            f"{ids[3]},100,2025-01-06\n"
+            "999999,100,2025-01-06\n"
+            "oops,100,2025-01-06\n",
+            "--chunk-size=2",
+        )
+
+        self.assertEqual(
+            report,
+            {"matched": "2", "mismatched": "1", "already_paid": "1", "missing": "1", "invalid": "1"},
+        )
+        self.invoices[0].refresh_from_db()
+        self.assertEqual(self.invoices[0].status, "paid")
+        self.assertEqual(
+            self.invoices[0].paid_at,
+            datetime(2025, 1, 5, 10, tzinfo=timezone.get_current_timezone()),
+        )
+        self.assertEqual(
+            list(Invoice.objects.order_by("id").values_list("status", flat=True)),
+            ["paid", "paid", "pending", "paid"],
+        )
+
+    def test_jsonl_dry_run_changes_nothing(self):
+        report = self.run_import(
+            "settlement.jsonl",
+            json.dumps({"invoice_id": self.invoices[0].id, "amount": "100", "paid_at": "2025-01-05"})
+            + "\n",
+            "--dry-run",
+        )
+        self.assertEqual(report["matched"], "1")
+        self.invoices[0].refresh_from_db()
+        self.assertEqual(self.invoices[0].status, "pending")
+
+
+class ImportUsersCommandTests(TestCase):
+    def setUp(self):
+        User.objects.create(username="taken")
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def run_import(self, name, content, *args):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w", encoding="utf-8") as stream:
+            stream.write(content)
+        out = StringIO()
+        call_command("import_users", path, *args, stdout=out)
+        return dict(line.split(": ") for line in out.getvalue().splitlines())
+
+    def test_csv_import_hashes_in_worker_processes(self):
+        legacy = make_password("legacy-secret")
+        report = self.run_import(
+            "users.csv",
+            "username,email,first_name,password,password_hash\n"
+            "alice,alice@example.com,Alice,s3cret,\n"
+            f"bob,bob@example.com,Bob,,{legacy}\n"
+            "carol,,,,\n"
+            "taken,,,x,\n"
+            "alice,,,y,\n"
+            "bad name,,,x,\n"
+            "dave,not-an-email,,x,\n"
+            "erin,,,,md5crypt$abc\n",
+            "--chunk-size=2",
+            "--workers=2",
+        )
+
+        self.assertEqual(report, {"created": "3", "existing": "2", "invalid": "3"})
+        alice = User.objects.get(username="alice")
+        self.assertEqual((alice.email, alice.first_name), ("alice@example.com", "Alice"))
+        self.assertTrue(alice.check_password("s3cret"))
+        bob = User.objects.get(username="bob")
+        self.assertEqual(bob.password, legacy)
+        self.assertTrue(bob.check_password("legacy-secret"))
+        self.assertFalse(User.objects.get(username="carol").has_usable_password())
+
+    def test_jsonl_in_process_and_dry_run(self):
+        line = json.dumps({"username": "frank", "password": "pw"}) + "\n"
+        self.assertEqual(
+            self.run_import("users.jsonl", line + "[]\n", "--dry-run"),
+            {"created": "1", "existing": "0", "invalid": "1"},
+        )
+        self.assertFalse(User.objects.filter(username="frank").exists())
+
+        self.run_import("users.jsonl", line, "--workers=1")
+        self.assertTrue(User.objects.get(username="frank").check_password("pw"))
+
+
+class BillingBenchCommandTests(TestCase):
+    def test_reports_each_task_and_cleans_up(self):
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(
+                "billing_bench", "--users=40", "--due-fraction=0.5", "--batch-size=7", stdout=out
+            )
+        report = json.loads(out.getvalue())
+
+        self.assertEqual(report["seed"]["users"], 40)
+        self.assertEqual(report["seed"]["subscriptions"], 40)
+        self.assertGreater(report["seed"]["invoices"], 0)
+        self.assertEqual(
+            set(report["tasks"]),
+            {"generate_daily_invoices", "mark_overdue_invoices", "send_pending_invoice_reminders"},
+        )
+        generated = report["tasks"]["generate_daily_invoices"]
+        self.assertGreater(generated["rows"], 0)
+        self.assertGreater(generated["queries"], 0)
+        self.assertEqual(User.objects.count(), 0)
+        self.assertEqual(Invoice.objects.count(), 0)
+        self.assertEqual(Plan.objects.count(), 0)
+        self.assertEqual(TaskRun.objects.count(), 0)
+        self.assertFalse(
+            PlanSubscriptionSummary.objects.filter(active_subscriptions__gt=0).exists()
+        )
+        self.assertFalse(ReceivableBalance.objects.filter(invoices__gt=0).exists())
+
+    def test_refuses_a_database_with_billing_rows(self):
+        Subscription.objects.create(
+            user=User.objects.create(username="real"),
+            plan=Plan.objects.create(name="basic", price=100),
+            start_date=date(2025, 1, 1), end_date=date(2026, 1, 1),
+        )
+        with self.assertRaises(CommandError):
+            call_command("billing_bench", "--users=5", stdout=StringIO())
+        self.assertEqual(User.objects.count(), 1)
+
+
+class BenchReadPathCommandTests(TestCase):
+    def test_times_only_the_seeded_rows(self):
+        plan = Plan.objects.create(name="pro", price=200)
+        user = User.objects.create(username="existing")
+        sub = Subscription.objects.create(
+            user=user, plan=plan, start_date=date(2025, 1, 1), end_date=date(2026, 1, 1)
+        )
+        for month in (1, 2, 3):
+            Invoice.objects.create(
+                user=user, plan=plan, subscription=sub, amount=200,
+                issue_date=date(2025, month, 1), due_date=date(2025, month, 8),
+            )
+        out = StringIO()
+
+        call_command("bench_read_path", "--rows=25", "--repeat=1", stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("serializer 25 rows in "))
+        self.assertTrue(lines[1].startswith("values     25 rows in "))
+        self.assertEqual(Invoice.objects.count(), 3)
+
+
+@override_settings(STRIPE_SECRET_KEY="sk_test_stub", BILLING_PAGE_SIZE=2)
+class AsyncEndpointTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.http = StubStripeHTTPClient()
+        client = stripe.StripeClient(
+            "sk_test_stub", http_client=self.http, max_network_retries=0
+        )
+        patcher = mock.patch.object(payments, "get_stripe_client", return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user(username="async", password="asyncpass")
+        plan = Plan.objects.create(name="basic", price=100)
+        sub = Subscription.objects.create(
+            user=self.user, plan=plan, start_date=date(2025, 1, 1), end_date=date(2025, 2, 1)
+        )
+        self.invoices = [
+            Invoice.objects.create(
+                user=self.user, plan=plan, subscription=sub, amount=Decimal("100.00"),
+                issue_date=date(2025, 1, 1) + timedelta(days=i), due_date=date(2025, 1, 8),
+            )
+            for i in range(3)
+        ]
+        token = RefreshToken.for_user(self.user).access_token
+        self.auth = {"headers": {"Authorization": f"Bearer {token}"}}
+
+    async def test_payment_intent_and_success(self):
+        invoice = self.invoices[0]
+        response = await self.async_client.post(
+            reverse("async-create-payment-intent"),
+            {"invoice_id": invoice.id},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(), {"client_secret": "pi_1_secret", "payment_intent_id": "pi_1"}
+        )
+        self.assertEqual(
+            self.http.requests[0][2]["Idempotency-Key"], f"invoice-{invoice.id}-10000"
+        )
+
+        response = await self.async_client.post(
+            reverse("async-payment-success"),
+            {"invoice_id": invoice.id},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        await invoice.arefresh_from_db()
+        self.assertEqual(invoice.status, "paid")
+
+        response = await self.async_client.post(
+            reverse("async-payment-success"),
+            {"invoice_id": invoice.id},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 404)
+
+        response = await self.async_client.post(
+            reverse("async-payment-success"),
+            {"invoice_id": "abc"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    async def test_payment_success_uses_the_guarded_transition(self):
+        invoice = self.invoices[0]
+        with mock.patch(
+            "billingapp.async_views.pay_invoice", wraps=pay_invoice
+        ) as transition:
+            response = await self.async_client.post(
+                reverse("async-payment-success"),
+                {"invoice_id": invoice.id},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        transition.assert_called_once_with(invoice.id)
+        await invoice.arefresh_from_db()
+        self.assertEqual(invoice.status, "paid")
+        self.assertIsNotNone(invoice.paid_at)
+
+    async def test_invoice_list_pages_match_serializer(self):
+        response = await self.async_client.get(reverse("async-invoice-list"))
+        self.assertEqual(response.status_code, 401)
+
+        seen = []
+        url = reverse("async-invoice-list")
+        while url:
+            response = await self.async_client.get(url, **self.auth)
+            self.assertEqual(response.status_code, 200)
+            seen += response.json()["results"]
+            url = response.json()["next"]
+
+        expected = await sync_to_async(
+            lambda: json.loads(
+                json.dumps(
+                    InvoiceSerializer(
+                        Invoice.objects.order_by("-issue_date", "-id"), many=True
+                    ).data
+                )
+            )
+        )()
+        self.assertEqual(seen, expected)
+
+    async def test_invoice_list_pages_like_the_drf_list(self):
+        def cursor(url):
+            return url and parse_qs(url.split("?", 1)[1])["cursor"][0]
+
+        url, drf_url = reverse("async-invoice-list"), reverse("invoice-list")
+        params = {"page_size": 1}
+        for _ in range(len(self.invoices) + 1):
+            page = (await self.async_client.get(url, params, **self.auth)).json()
+            expected = (await self.async_client.get(drf_url, params, **self.auth)).json()
+            self.assertEqual(page["results"], expected["results"])
+            self.assertEqual(cursor(page["next"]), cursor(expected["next"]))
+            self.assertEqual(cursor(page["previous"]), cursor(expected["previous"]))
+            if not page["next"]:
+                break
+            params["cursor"] = cursor(page["next"])
+        self.assertIsNone(page["next"])
+
+        response = await self.async_client.get(url, {"cursor": "bogus"}, **self.auth)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_invoice_detail(self):
+        invoice = self.invoices[1]
+        response = await self.async_client.get(
+            reverse("async-invoice-detail", kwargs={"pk": invoice.id}), **self.auth
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["id"], invoice.id)
+        self.assertEqual(response.json()["amount"], "100.00")
+
+
+@override_settings(BILLING_BULK_SUBSCRIPTION_MAX=50)
+class BulkSubscriptionProvisioningTests(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username="onboarding", password="x", is_staff=True)
+        self.plan = Plan.objects.create(name="team", price=20)
+        self.users = [User.objects.create_user(username=f"seat{i}") for i in range(30)]
+        self.authenticate(self.admin)
+
+    def authenticate(self, user):
+        token = RefreshToken.for_user(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def entry(self, user, **overrides):
+        return {
+            "user": user.id,
+            "plan": self.plan.id,
+            "start_date": "2025-01-01",
+            "end_date": "2026-01-01",
+            **overrides,
+        }
+
+    def provision(self, body):
+        return self.client.post(reverse("subscription-bulk"), body, format="json")
+
+    def test_creates_valid_entries_and_reports_the_rest(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Subscription.objects.create(
+                user=self.users[4], plan=self.plan,
+                start_date=date(2024, 1, 1), end_date=date(2025, 1, 1),
+            )
+        entries = [
+            self.entry(self.users[0]),
+            self.entry(self.users[1], billing_interval="yearly"),
+            self.entry(self.users[2], end_date="2024-01-01"),
+            self.entry(self.users[3], plan=9999),
+            self.entry(self.users[0]),
+            self.entry(self.users[4]),
+            {**self.entry(self.users[5]), "user": 9999},
+            self.entry(self.users[6], start_date="someday"),
+        ]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.provision({"subscriptions": entries})
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([row["index"] for row in response.data["created"]], [0, 1])
+        self.assertEqual([row["index"] for row in response.data["errors"]], [2, 3, 4, 5, 6, 7])
+        errors = {row["index"]: row["errors"] for row in response.data["errors"]}
+        self.assertIn("end_date", errors[2])
+        self.assertEqual(errors[3], {"plan": ["Plan not found."]})
+        self.assertEqual(errors[4], {"user": ["User is also subscribed by entry 0."]})
+        self.assertEqual(errors[5], {"user": ["User already has an active subscription."]})
+        self.assertEqual(errors[6], {"user": ["User not found."]})
+        self.assertIn("start_date", errors[7])
+
+        yearly = Subscription.objects.get(id=response.data["created"][1]["id"])
+        self.assertEqual(yearly.user, self.users[1])
+        self.assertEqual(yearly.billing_interval, "yearly")
+        self.assertEqual(yearly.status, "active")
+        self.assertEqual(yearly.next_billing_date, date(2025, 1, 1))
+        self.assertEqual(
+            dict(
+                PlanSubscriptionSummary.objects.values_list(
+                    "billing_interval", "active_subscriptions"
+                )
+            ),
+            {"monthly": 2, "yearly": 1},
+        )
+
+    def test_concurrently_activated_users_are_reported_per_entry(self):
+        # Another request subscribes seat0 after the bulk request's check.
+        Subscription.objects.create(
+            user=self.users[0], plan=self.plan, start_date=date(2025, 1, 1),
+            end_date=date(2026, 1, 1),
+        )
+        with mock.patch.object(provisioning, "_drop_active"):
+            response = self.client.post(
+                reverse("subscription-bulk"),
+                [self.entry(self.users[0]), self.entry(self.users[1])],
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([row["index"] for row in response.data["created"]], [1])
+        self.assertEqual(
+            response.data["errors"],
+            [{"index": 0, "errors": {"user": ["User already has an active subscription."]}}],
+        )
+        self.assertEqual(Subscription.objects.filter(status="active").count(), 2)
+
+    def test_query_count_does_not_grow_with_entries(self):
+        self.provision([self.entry(self.users[0])])
+        with self.assertQueryBudget(12):
+            response = self.provision([self.entry(user) for user in self.users[1:]])
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["created"]), 29)
+        self.assertEqual(Subscription.objects.filter(status="active").count(), 30)
+
+    def test_rejects_malformed_and_oversized_requests(self):
+        self.assertEqual(self.provision({"user": 1}).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.provision([self.entry(self.users[0])] * 51)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.provision([self.entry(self.users[0], plan=9999)])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["created"], [])
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_requires_staff(self):
+        self.authenticate(self.users[0])
+        response = self.provision([self.entry(self.users[0])])
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(Subscription.objects.exists())
+
+
+class ConditionalGetTests(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="poller", password="x")
+        self.other = User.objects.create_user(username="neighbour", password="x")
+        self.plan = Plan.objects.create(name="basic", price=100)
+        self.subscription = Subscription.objects.create(
+            user=self.user, plan=self.plan, start_date=date(2025, 1, 1), end_date=date(2026, 1, 1)
+        )
+        self.invoices = [
+            Invoice.objects.create(
+                user=self.user, plan=self.plan, subscription=self.subscription, amount="100.00",
+                issue_date=date(2025, month, 1), due_date=date(2025, month, 8),
+            )
+            for month in (1, 2)
+        ]
+        self.authenticate(self.user)
+
+    def authenticate(self, user):
+        token = RefreshToken.for_user(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def revalidate(self, url, response, **params):
+        return self.client.get(url, params, HTTP_IF_NONE_MATCH=response["ETag"])
+
+    def test_unchanged_invoice_list_is_not_modified_without_reading_rows(self):
+        url = reverse("invoice-list")
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertTrue(first["ETag"].startswith('W/"'))
+        self.assertIn("Authorization", first["Vary"])
+
+        with self.assertQueryBudget(2) as recorder:
+            cached = self.revalidate(url, first)
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(cached["ETag"], first["ETag"])
+        self.assertFalse(cached.content)
+        self.assertNotIn("billingapp_invoice.amount", " ".join(sql for sql, _ in recorder.queries))
+
+        # Lists are revalidated by ETag only.
+        self.assertNotIn("Last-Modified", first)
+        since = self.client.get(url, HTTP_IF_MODIFIED_SINCE="Wed, 01 Jan 2100 00:00:00 GMT")
+        self.assertEqual(since.status_code, status.HTTP_200_OK)
+
+    def test_changes_deletions_and_other_views_get_fresh_responses(self):
+        url = reverse("invoice-list")
+        first = self.client.get(url)
+
+        self.assertEqual(self.revalidate(url, first, status="pending").status_code, 200)
+        self.authenticate(self.other)
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+        self.authenticate(self.user)
+
+        invoice = self.invoices[0]
+        invoice.status = "paid"
+        invoice.save()
+        changed = self.revalidate(url, first)
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(changed["ETag"], first["ETag"])
+
+        self.invoices[1].delete()
+        self.assertEqual(self.revalidate(url, changed).status_code, status.HTTP_200_OK)
+
+    def test_list_fingerprint_reads_only_the_page(self):
+        url = reverse("invoice-list")
+        first = self.client.get(url, {"page_size": 1})
+        self.assertEqual(first.data["results"][0]["id"], self.invoices[1].id)
+
+        # An older invoice, on the next page, changes.
+        self.invoices[0].status = "paid"
+        self.invoices[0].save()
+        with self.assertQueryBudget(2) as recorder:
+            cached = self.revalidate(url, first, page_size=1)
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+        fingerprint = recorder.queries[-1][0]
+        self.assertIn("LIMIT 2", fingerprint)
+        self.assertNotIn("COUNT(", fingerprint)
+
+        self.invoices[1].delete()
+        self.assertEqual(self.revalidate(url, first, page_size=1).status_code, 200)
+
+    def test_subscription_detail_and_plans(self):
+        url = reverse("subscription-detail", kwargs={"pk": self.subscription.id})
+        first = self.client.get(url)
+        since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(since.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.revalidate(url, first).status_code, status.HTTP_304_NOT_MODIFIED)
+        self.subscription.status = "cancelled"
+        self.subscription.save()
+        self.assertEqual(self.revalidate(url, first).status_code, status.HTTP_200_OK)
+        missing = self.client.get(reverse("subscription-detail", kwargs={"pk": "nope"}))
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+
+        url = reverse("plan-list")
+        first = self.client.get(url)
+        with self.assertQueryBudget(1):
+            self.assertEqual(self.revalidate(url, first).status_code, status.HTTP_304_NOT_MODIFIED)
+        self.plan.price = 120
+        self.plan.save()
+        refreshed = self.revalidate(url, first)
+        self.assertEqual(refreshed.status_code, status.HTTP_200_OK)
+        self.assertEqual(refreshed.json()[0]["price"], "120.00")
+
+
+class UserBillingSummaryTests(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.now().date()
+        self.plan = Plan.objects.create(name="basic", price=100)
+        self.user = User.objects.create_user(username="badged", password="x")
+        self.other = User.objects.create_user(username="other", password="x")
+        self.subscription = Subscription.objects.create(
+            user=self.user, plan=self.plan, start_date=self.today - timedelta(days=90),
+            end_date=self.today + timedelta(days=365), next_billing_date=self.today,
+        )
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def invoice(self, days_ago, amount=100, status_="pending"):
+        return Invoice.objects.create(
+            user=self.user, plan=self.plan, subscription=self.subscription, amount=amount,
+            issue_date=self.today - timedelta(days=days_ago),
+            due_date=self.today - timedelta(days=days_ago - 7), status=status_,
+        )
+
+    def counters(self, user=None):
+        summary = UserBillingSummary.objects.filter(user=user or self.user).first()
+        if summary is None:
+            return (0, 0, Decimal(0))
+        return (summary.pending_invoices, summary.overdue_invoices, summary.outstanding_amount)
+
+    def test_every_invoice_path_updates_the_counters(self):
+        old = self.invoice(30, amount=40)
+        self.invoice(60, status_="paid")
+        self.assertEqual(self.counters(), (1, 0, Decimal("40.00")))
+
+        generate_daily_invoices()
+        self.assertEqual(self.counters(), (2, 0, Decimal("140.00")))
+
+        mark_overdue_invoices()
+        self.assertEqual(self.counters(), (1, 1, Decimal("140.00")))
+
+        self.client.post(reverse("payment-success"), {"invoice_id": old.id})
+        self.assertEqual(self.counters(), (1, 0, Decimal("100.00")))
+
+        mark_invoices_paid({Invoice.objects.get(status="pending").id: timezone.now()})
+        self.assertEqual(self.counters(), (0, 0, Decimal(0)))
+        # The row is kept at zero for the next delta to update.
+        self.assertTrue(UserBillingSummary.objects.filter(user=self.user).exists())
+
+    def test_edits_and_deletes_move_the_counters(self):
+        invoice = self.invoice(30, amount=40)
+        invoice.amount = 55
+        invoice.status = "overdue"
+        invoice.save()
+        self.assertEqual(self.counters(), (0, 1, Decimal("55.00")))
+        invoice.user = self.other
+        invoice.save()
+        self.assertEqual(self.counters(), (0, 0, Decimal(0)))
+        self.assertEqual(self.counters(self.other), (0, 1, Decimal("55.00")))
+        invoice.delete()
+        self.assertEqual(self.counters(self.other), (0, 0, Decimal(0)))
+
+    def test_deleting_a_user_with_unpaid_invoices(self):
+        self.invoice(30, amount=40)
+        self.invoice(45, status_="overdue")
+        self.user.delete()
+        self.assertFalse(UserBillingSummary.objects.exists())
+
+        self.user = self.other
+        self.subscription = Subscription.objects.create(
+            user=self.other, plan=self.plan, start_date=self.today,
+            end_date=self.today + timedelta(days=365),
+        )
+        self.invoice(10, amount=20)
+        token = RefreshToken.for_user(self.other).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        response = self.client.delete(reverse("user-detail", kwargs={"pk": self.other.id}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(User.objects.filter(id=self.other.id).exists())
+        self.assertFalse(UserBillingSummary.objects.exists())
+
+    def test_summary_endpoint_reads_one_row(self):
+        self.invoice(30, amount=40)
+        self.invoice(45, status_="overdue")
+        url = reverse("invoice-summary")
+        self.client.get(url)
+
+        with self.assertQueryBudget(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {key: response.data[key] for key in ("user", "pending_invoices", "overdue_invoices")},
+            {"user": self.user.id, "pending_invoices": 1, "overdue_invoices": 1},
+        )
+        self.assertEqual(response.data["outstanding_amount"], "140.00")
+
+        # Other users' summaries are only visible to staff.
+        response = self.client.get(url, {"user": self.other.id})
+        self.assertEqual(response.data["user"], self.user.id)
+        token = RefreshToken.for_user(
+            User.objects.create_user(username="support", password="x", is_staff=True)
+        ).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        response = self.client.get(url, {"user": self.other.id})
+        self.assertEqual(response.data["user"], self.other.id)
+        self.assertEqual(response.data["outstanding_amount"], "0.00")
+
+    def test_reconcile_repairs_drift(self):
+        self.invoice(30, amount=40)
+        with self.assertLogs("billingapp.reports", "WARNING"):
+            # The plan and receivables deltas only apply on commit.
+            reconcile_billing_summaries()
+        UserBillingSummary.objects.update(pending_invoices=7)
+        UserBillingSummary.objects.create(user=self.other, overdue_invoices=2, outstanding_amount=5)
+
+        with self.assertLogs("billingapp.reports", "WARNING") as logs:
+            reconcile_billing_summaries()
+        self.assertIn("Repaired 2 drifted", logs.output[0])
+        self.assertEqual(self.counters(), (1, 0, Decimal("40.00")))
+        self.assertEqual(self.counters(self.other), (0, 0, Decimal(0)))
+        self.assertTrue(UserBillingSummary.objects.filter(user=self.other).exists())
+
+
+class StateTransitionTests(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.plan = Plan.objects.create(name="basic", price=100)
+        self.user = User.objects.create_user(username="payer", password="x")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.subscription = Subscription.objects.create(
+                user=self.user, plan=self.plan, start_date=date(2025, 1, 1),
+                end_date=date(2026, 1, 1),
+            )
+            self.invoice = Invoice.objects.create(
+                user=self.user, plan=self.plan, subscription=self.subscription, amount=100,
+                issue_date=date(2025, 1, 1), due_date=date(2025, 1, 8), status="overdue",
+            )
+
+    def active_subscriptions(self):
+        return sum(
+            PlanSubscriptionSummary.objects.values_list("active_subscriptions", flat=True)
+        )
+
+    def test_payment_applies_once_and_writes_only_changed_columns(self):
+        with self.assertQueryBudget(5) as recorder:
+            response = self.client.post(reverse("payment-success"), {"invoice_id": self.invoice.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        updates = [sql for sql, _ in recorder.queries if sql.startswith('UPDATE "billingapp_invoice"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(
+            updates[0].split(" WHERE ")[0],
+            'UPDATE "billingapp_invoice" SET "status" = %s, "updated_at" = %s, "paid_at" = %s',
+        )
+
+        again = self.client.post(reverse("payment-success"), {"invoice_id": self.invoice.id})
+        self.assertEqual(again.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(pay_invoice(self.invoice.id))
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.status, "paid")
+        self.assertIsNotNone(self.invoice.paid_at)
+        self.assertEqual(
+            UserBillingSummary.objects.values_list(
+                "overdue_invoices", "outstanding_amount"
+            ).get(user=self.user),
+            (0, Decimal(0)),
+        )
+
+    def test_stale_cancellations_apply_once(self):
+        first = Subscription.objects.get(id=self.subscription.id)
+        second = Subscription.objects.get(id=self.subscription.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(cancel_subscription(first))
+            self.assertFalse(cancel_subscription(second))
+        self.assertEqual(self.active_subscriptions(), 0)
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.status, "cancelled")
+
+    def test_transition_rereads_a_row_changed_since_it_was_loaded(self):
+        Subscription.objects.filter(id=self.subscription.id).update(status="expired")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(cancel_subscription(self.subscription))
+        self.assertEqual(
+            Subscription.objects.get(id=self.subscription.id).status, "cancelled"
+        )
+        # It left "expired", which the summaries do not count.
+        self.assertEqual(self.active_subscriptions(), 1)
@@ -0,0 +1,84 @@
+"""
+Guarded state transitions for invoices and subscriptions.
+
+A transition is one conditional ``UPDATE`` that only matches while the row
+is still in the state the caller saw: its status and the other fields the
+billing summaries depend on. It writes only the status, ``updated_at`` and
+any values the transition sets, instead of every column as ``save()`` does.
+The matched row count says whether it happened, so of two concurrent
+requests exactly one applies it, and the summaries are moved by the state
+the row actually left.
+
+The update bypasses ``save()``, so the summaries are told here rather than
+by the model signals. When the row changed between the read and the
+update, the transition reads it again and retries.
+"""
+
+# pylint:disable=E1101
+from django.db import transaction
+from django.utils.timezone import now
+from . import reports
+from .models import Invoice, Subscription
+
+UNPAID = ("pending", "overdue")
+CANCELLABLE = ("active", "expired")
+
+# Reads of a row that keeps changing under the transition before giving up.
+ATTEMPTS = 3
+
+
+def transition(model, pk, allowed, to_status, observed=None, **values):
+    """
+    Move one row from any status in ``allowed`` to ``to_status``.
+
+    Args:
+        model: ``Invoice`` or ``Subscription``.
+        allowed (tuple): Statuses the transition may start from.
+        observed (dict): The row's ``reports.SUMMARY_FIELDS`` values, if the
+            caller has already read them; saves a read.
+        **values: Other columns the transition sets.
+
+    Returns:
+        bool: Whether this call made the transition.
+    """
+    fields = reports.SUMMARY_FIELDS[model][0]
+    for _ in range(ATTEMPTS):
+        if observed is None:
+            observed = (
+                model.objects.filter(pk=pk, status__in=allowed).values(*fields).first()
+            )
+        if observed is None or observed["status"] not in allowed:
+            return False
+        with transaction.atomic(savepoint=False):
+            changed = model.objects.filter(pk=pk, **observed).update(
+                status=to_status, updated_at=now(), **values
+            )
+            if changed:
+                reports.summaries_changed(
+                    model,
+                    reports.summary_state(model, observed),
+                    reports.summary_state(model, {**observed, "status": to_status}),
+                )
+                return True
+        observed = None
+    return False
+
+
+def _observed(model, instance):
+    return {field: getattr(instance, field) for field in reports.SUMMARY_FIELDS[model][0]}
+
+
+def pay_invoice(invoice_id, paid_at=None):
+    """Mark an unpaid invoice paid; False if it is missing or already paid."""
+    return transition(Invoice, invoice_id, UNPAID, "paid", paid_at=paid_at or now())
+
+
+def cancel_subscription(subscription):
+    """Cancel a loaded subscription; False if it is (or was just) cancelled."""
+    return transition(
+        Subscription,
+        subscription.pk,
+        CANCELLABLE,
+        "cancelled",
+        observed=_observed(Subscription, subscription),
+    )
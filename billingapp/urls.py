@@ -4,12 +4,16 @@ URL routing for the billing app.
 Includes:
 - JWT auth (login & token refresh)
 - User, Plan, Subscription, and Invoice viewsets
+- Stripe payment and webhook endpoints
+- Finance reports and Prometheus metrics for the billing tasks
+- Async (ASGI) payment and invoice read endpoints
 """
 
 from django.urls import path
 from rest_framework import routers
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from . import async_views
 from .views import (
     UserViewSet,
     PlanViewSet,
@@ -17,6 +21,9 @@ from .views import (
     InvoiceViewSet,
     CreatePaymentIntentView,
     PaymentSuccesstView,
+    StripeWebhookView,
+    ReportsView,
+    MetricsView,
     payment_page,
 )
 
@@ -44,6 +51,26 @@ urlpatterns = [
         name="payment-success",
     ),
     path("pay/", payment_page, name="payment-page"),
+    path("stripe/webhook/", StripeWebhookView.as_view(), name="stripe-webhook"),
+    path("reports/", ReportsView.as_view(), name="reports"),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
+    # Async counterparts of the payment and invoice read endpoints (ASGI)
+    path(
+        "async/create-payment-intent/",
+        async_views.create_payment_intent,
+        name="async-create-payment-intent",
+    ),
+    path(
+        "async/payment-success/",
+        async_views.payment_success,
+        name="async-payment-success",
+    ),
+    path("async/invoices/", async_views.invoice_list, name="async-invoice-list"),
+    path(
+        "async/invoices/<int:pk>/",
+        async_views.invoice_detail,
+        name="async-invoice-detail",
+    ),
 ]
 
 # Include all router-generated URLs
@@ -4,23 +4,52 @@ Handles CRUD operations, custom actions (unsubscribe, pay), and permission logic
 """
 
 # pylint:disable=E1101,W0613, W0718
+import hashlib
+import json
 import os
+from functools import partial
 import stripe
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
-from django.db import DatabaseError
-from rest_framework import status, viewsets, serializers
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.utils.dateparse import parse_date
+from rest_framework import generics, status, viewsets, serializers
 from rest_framework.views import APIView
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
-from .models import User, Plan, Subscription, Invoice
+from .models import (
+    User,
+    Plan,
+    Subscription,
+    Invoice,
+    ArchivedInvoice,
+    StripeEvent,
+    UserBillingSummary,
+)
 from .serializers import (
     UserSerializer,
     PlanSerializer,
     SubscriptionSerializer,
     InvoiceSerializer,
+    ArchivedInvoiceSerializer,
+    UserBillingSummarySerializer,
+    ValuesReader,
 )
-from .permissions import IsAdminUser, IsOwnerOrAdmin
+from .catalog import catalog_version, get_plan, list_plans
+from .exports import CONTENT_TYPES, STREAMS, export_rows
+from .payments import get_or_create_payment_intent
+from .permissions import IsAdminOrMetricsToken, IsAdminUser, IsOwnerOrAdmin
+from .provisioning import max_entries, provision_subscriptions
+from .reports import build_report
+from .telemetry import render_metrics
+from .transitions import cancel_subscription, pay_invoice
+from .pagination import InvoiceCursorPagination, SubscriptionCursorPagination
 
 
 def payment_page(request):
@@ -32,6 +61,35 @@ def payment_page(request):
     )
 
 
+def conditional_get(request, view, *parts, last_modified=None):
+    """
+    Serve ``view`` unless the client's cached copy is current.
+
+    The ETag is a digest of ``parts`` (which must change whenever the
+    response would), the URL, the user and the negotiated media type, so
+    a 304 is answered without calling ``view`` at all.
+
+    Args:
+        last_modified (datetime): When the response last changed, if known.
+    """
+    digest = hashlib.md5(usedforsecurity=False)
+    for part in (request.get_full_path(), request.user.pk, request.accepted_media_type, *parts):
+        digest.update(f"{part}|".encode())
+    etag = f'W/"{digest.hexdigest()}"'
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = view()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+    response["ETag"] = etag
+    if timestamp is not None:
+        response["Last-Modified"] = http_date(timestamp)
+    patch_vary_headers(response, ("Authorization",))
+    return response
+
+
 class UserViewSet(viewsets.ModelViewSet):
     """
     ViewSet for creating and retrieving users.
@@ -63,8 +121,114 @@ class PlanViewSet(viewsets.ModelViewSet):
             return [IsAuthenticated()]
         return [IsAdminUser()]
 
+    def list(self, request, *args, **kwargs):
+        """List plans from the cached plan catalog."""
+        return conditional_get(request, lambda: Response(list_plans()), catalog_version())
+
+    def retrieve(self, request, *args, **kwargs):
+        """Retrieve a plan from the cached plan catalog."""
+        return conditional_get(
+            request, lambda: self._retrieve(kwargs["pk"]), catalog_version()
+        )
+
+    @staticmethod
+    def _retrieve(pk):
+        try:
+            plan = get_plan(int(pk))
+        except ValueError:
+            plan = None
+        if plan is None:
+            return Response(
+                {"detail": "No Plan matches the given query."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response(plan)
 
-class SubscriptionViewSet(viewsets.ModelViewSet):
+
+class ValuesReadMixin:
+    """
+    Serve list and retrieve from ``values()`` rows through a ValuesReader.
+
+    ``get_queryset`` must already restrict non-staff users to their own
+    rows; object permissions are not re-checked against the row.
+    """
+
+    values_reader = None
+
+    def list(self, request, *args, **kwargs):
+        """List rows without instantiating models."""
+        rows = self.values_reader.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.values_reader.serialize(page))
+        return Response(self.values_reader.serialize(rows))
+
+    def retrieve(self, request, *args, **kwargs):
+        """Retrieve one row without instantiating a model."""
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = generics.get_object_or_404(
+            self.values_reader.values(self.filter_queryset(self.get_queryset())),
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]},
+        )
+        return Response(self.values_reader.to_representation(row))
+
+
+class ConditionalReadMixin:
+    """
+    Answer list and retrieve with 304 Not Modified while the rows are unchanged.
+
+    A page's fingerprint is its rows' ids and latest ``updated_at`` plus its
+    cursors, read with the same keyset query as the page itself (ids and
+    timestamps only), so it costs one indexed page read however large the
+    list is. Every write path sets ``updated_at``, and a row added to or
+    deleted from the page changes its ids. A detail's fingerprint is its
+    row's ``updated_at``.
+
+    Lists are only revalidated with the ETag: a ``Last-Modified`` of the
+    page would not move when a row is deleted from it or updated again
+    within the same second, so lists do not send one.
+    """
+
+    def _conditional(self, view, *parts, last_modified=None):
+        return conditional_get(
+            self.request, view, *parts, last_modified, last_modified=last_modified
+        )
+
+    def list(self, request, *args, **kwargs):
+        """List rows, or 304 if none on the page changed since the client's copy."""
+        view = partial(super().list, request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.paginator is None:
+            state = queryset.aggregate(rows=Count("pk"), last_modified=Max("updated_at"))
+            return self._conditional(view, state["rows"], state["last_modified"])
+        page = self.paginator.paginate_queryset(
+            queryset.values("id", "updated_at", self.paginator.key), request, view=self
+        )
+        return self._conditional(
+            view,
+            [(row["id"], row["updated_at"]) for row in page],
+            self.paginator.next_cursor,
+            self.paginator.previous_cursor,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        """Retrieve a row, or 304 if it is unchanged since the client's copy."""
+        view = partial(super().retrieve, request, *args, **kwargs)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        except (TypeError, ValueError, DjangoValidationError):
+            # A malformed lookup; let the view answer it (404).
+            return view()
+        row = queryset.values("id", "updated_at").first()
+        if row is None:
+            return view()
+        return self._conditional(view, row["id"], last_modified=row["updated_at"])
+
+
+class SubscriptionViewSet(ConditionalReadMixin, ValuesReadMixin, viewsets.ModelViewSet):
     """
     ViewSet for user subscriptions.
     Users can subscribe, view their own, or cancel.
@@ -73,6 +237,8 @@ class SubscriptionViewSet(viewsets.ModelViewSet):
 
     serializer_class = SubscriptionSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
+    pagination_class = SubscriptionCursorPagination
+    values_reader = ValuesReader(SubscriptionSerializer)
 
     def get_queryset(self):
         """
@@ -97,19 +263,18 @@ class SubscriptionViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         """
         Ensure user can only have one active subscription.
+
+        Enforced by the unique_active_subscription_per_user constraint, so
+        concurrent requests cannot both succeed.
         """
         try:
-            active_subscription = Subscription.objects.filter(
-                user=self.request.user, status="active"
-            ).exists()
-
-            if active_subscription:
-                raise serializers.ValidationError(
-                    "You already have an active subscription."
-                )
-
-            serializer.save(user=self.request.user)
+            with transaction.atomic():
+                serializer.save(user=self.request.user)
 
+        except IntegrityError:
+            raise serializers.ValidationError(
+                "You already have an active subscription."
+            )
         except DatabaseError as db_err:
             raise serializers.ValidationError(f"Database error occurred: {str(db_err)}")
 
@@ -119,14 +284,12 @@ class SubscriptionViewSet(viewsets.ModelViewSet):
         """
         try:
             instance = self.get_object()
-            if instance.status == "cancelled":
+            if not cancel_subscription(instance):
                 return Response(
                     {"detail": "Subscription already cancelled."},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            instance.status = "cancelled"
-            instance.save()
             return Response(
                 {"detail": "Subscription cancelled."}, status=status.HTTP_200_OK
             )
@@ -143,15 +306,12 @@ class SubscriptionViewSet(viewsets.ModelViewSet):
         try:
             subscription = self.get_object()
 
-            if subscription.status == "cancelled":
+            if not cancel_subscription(subscription):
                 return Response(
                     {"detail": "Subscription already cancelled."},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            subscription.status = "cancelled"
-            subscription.save()
-
             return Response(
                 {"detail": "Subscription cancelled successfully."},
                 status=status.HTTP_200_OK,
@@ -165,8 +325,41 @@ class SubscriptionViewSet(viewsets.ModelViewSet):
                 {"detail": str(ex)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="bulk",
+        permission_classes=[IsAuthenticated, IsAdminUser],
+    )
+    def bulk(self, request):
+        """
+        Provision many subscriptions via /subscriptions/bulk/ (staff only).
+
+        The body is a list of entries, or ``{"subscriptions": [...]}``.
+        Valid entries are created even when others are rejected.
+        """
+        entries = request.data
+        if isinstance(entries, dict):
+            entries = entries.get("subscriptions")
+        if not isinstance(entries, list):
+            return Response(
+                {"detail": "Expected a list of subscriptions."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(entries) > max_entries():
+            return Response(
+                {"detail": f"At most {max_entries()} subscriptions per request."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        created, errors = provision_subscriptions(entries)
+        return Response(
+            {"created": created, "errors": errors},
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST,
+        )
+
 
-class InvoiceViewSet(viewsets.ModelViewSet):
+class InvoiceViewSet(ConditionalReadMixin, ValuesReadMixin, viewsets.ModelViewSet):
     """
     ViewSet for viewing and managing invoices.
     Users can view/pay their own invoices.
@@ -176,18 +369,39 @@ class InvoiceViewSet(viewsets.ModelViewSet):
     queryset = Invoice.objects.all()
     serializer_class = InvoiceSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = InvoiceCursorPagination
+    live_reader = ValuesReader(InvoiceSerializer)
+    archived_reader = ValuesReader(ArchivedInvoiceSerializer)
+
+    # Actions that read the archive table when called with ?archived=true
+    archive_actions = ("list", "retrieve", "export")
+
+    @property
+    def archived(self):
+        """Whether this request reads archived invoices."""
+        return (
+            self.action in self.archive_actions
+            and self.request.query_params.get("archived", "").lower() in ("true", "1")
+        )
+
+    @property
+    def values_reader(self):
+        """Reader for the table this request reads."""
+        return self.archived_reader if self.archived else self.live_reader
 
     def get_queryset(self):
         """
         Return invoices for the current user.
         Admins can view all invoices.
         Can filter by `status`.
+        Reads archived invoices with `?archived=true`.
         """
         user = self.request.user
+        model = ArchivedInvoice if self.archived else Invoice
         queryset = (
-            Invoice.objects.all()
+            model.objects.all()
             if user.is_staff
-            else Invoice.objects.filter(user=user)
+            else model.objects.filter(user=user)
         )
 
         status_param = self.request.query_params.get("status")
@@ -196,6 +410,63 @@ class InvoiceViewSet(viewsets.ModelViewSet):
 
         return queryset
 
+    @action(detail=False, methods=["get"], url_path="summary")
+    def summary(self, request):
+        """
+        Pending and overdue invoice counts and the outstanding amount via
+        /invoices/summary/, read from the user's billing summary row.
+        Staff may pass ``?user=<id>`` to read another user's summary.
+        """
+        user_id = request.user.pk
+        if request.user.is_staff and request.query_params.get("user"):
+            try:
+                user_id = int(request.query_params["user"])
+            except ValueError as err:
+                raise serializers.ValidationError({"user": "Must be a user id."}) from err
+        summary = UserBillingSummary.objects.filter(pk=user_id).first()
+        if summary is None:
+            # Rows are kept at zero, so only users who never had an unpaid
+            # invoice have none.
+            summary = UserBillingSummary(user_id=user_id)
+        return Response(UserBillingSummarySerializer(summary).data)
+
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="export",
+        permission_classes=[IsAuthenticated, IsAdminUser],
+    )
+    def export(self, request):
+        """
+        Stream invoices as CSV or JSONL via /invoices/export/ (staff only).
+
+        ``?fmt=csv|jsonl`` picks the format (``format`` is taken by DRF's
+        content negotiation); ``?issued_from=`` and ``?issued_to=`` bound
+        the issue date (inclusive, YYYY-MM-DD), ``?status=`` filters by
+        status and ``?archived=true`` exports archived invoices.
+        """
+        fmt = request.query_params.get("fmt", "csv")
+        if fmt not in STREAMS:
+            raise serializers.ValidationError({"fmt": f"Choose one of {', '.join(STREAMS)}."})
+        queryset = self.get_queryset()
+        for param, lookup in (("issued_from", "issue_date__gte"), ("issued_to", "issue_date__lte")):
+            value = request.query_params.get(param)
+            if value:
+                try:
+                    day = parse_date(value)
+                except ValueError:
+                    day = None
+                if day is None:
+                    raise serializers.ValidationError({param: "Use YYYY-MM-DD."})
+                queryset = queryset.filter(**{lookup: day})
+
+        response = StreamingHttpResponse(
+            STREAMS[fmt](export_rows(queryset)), content_type=CONTENT_TYPES[fmt]
+        )
+        response["Content-Disposition"] = f'attachment; filename="invoices.{fmt}"'
+        return response
+
+
 class CreatePaymentIntentView(APIView):
     """Stripe payment"""
 
@@ -203,12 +474,6 @@ class CreatePaymentIntentView(APIView):
     def post(self, request):
         """Stripe payment create"""
         try:
-            api_key = os.environ.get(
-                "STRIPE_SECRET_KEY"
-            )  # it needs to be in DB or some secret store like aws ssm
-            if not api_key:
-                raise ValueError("Stripe api key not found")
-            stripe.api_key = api_key
             invoice_id = request.data.get("invoice_id")
             if not invoice_id:
                 return Response(
@@ -216,19 +481,18 @@ class CreatePaymentIntentView(APIView):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            invoice = get_object_or_404(Invoice.objects.exclude(status="paid"), id=invoice_id)
-            amount_in_paisa = int(invoice.amount * 100)  # Convert to paisa/cents
-
-            # Create the payment intent
-            intent = stripe.PaymentIntent.create(
-                amount=int(amount_in_paisa),
-                currency="inr",
-                payment_method_types=["card"],
-                metadata={"invoice_id": invoice.id},
+            invoice = get_object_or_404(
+                Invoice.objects.exclude(status="paid").only(
+                    "id", "amount", "payment_intent_id", "payment_client_secret"
+                ),
+                id=invoice_id,
             )
 
+            # Reuses the invoice's stored intent, or creates one idempotently
+            intent_id, client_secret = get_or_create_payment_intent(invoice)
+
             return Response(
-                {"client_secret": intent.client_secret, "payment_intent_id": intent.id},
+                {"client_secret": client_secret, "payment_intent_id": intent_id},
                 status=status.HTTP_200_OK,
             )
 
@@ -260,10 +524,20 @@ class PaymentSuccesstView(APIView):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            invoice = get_object_or_404(Invoice.objects.exclude(status="paid"), id=invoice_id)
-            # Update invoice status to 'paid'
-            invoice.status = "paid"
-            invoice.save()
+            try:
+                invoice_id = int(invoice_id)
+            except (TypeError, ValueError):
+                return Response(
+                    {"detail": "Invoice ID must be a number."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            # Guarded update: a concurrent payment cannot apply twice
+            if not pay_invoice(invoice_id):
+                return Response(
+                    {"detail": "No unpaid invoice matches the given id."},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
 
             return Response(
                 {"detail": f"Invoice {invoice_id} marked as paid."},
@@ -276,3 +550,68 @@ class PaymentSuccesstView(APIView):
             return Response(
                 {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+class StripeWebhookView(APIView):
+    """
+    Stripe webhook receiver.
+
+    Verifies the signature, stores the event in the StripeEvent inbox
+    (ignoring event ids already stored) and returns immediately; the
+    process_stripe_events task applies it.
+    """
+
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        """Store a verified Stripe event"""
+        payload = request.body
+        try:
+            stripe.WebhookSignature.verify_header(
+                payload,
+                request.META.get("HTTP_STRIPE_SIGNATURE"),
+                settings.STRIPE_WEBHOOK_SECRET,
+                tolerance=stripe.Webhook.DEFAULT_TOLERANCE,
+            )
+            event = json.loads(payload)
+            event_id, event_type = event["id"], event["type"]
+        except stripe.SignatureVerificationError:
+            return Response(
+                {"detail": "Invalid signature."}, status=status.HTTP_400_BAD_REQUEST
+            )
+        except (ValueError, KeyError, TypeError):
+            return Response(
+                {"detail": "Invalid payload."}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        StripeEvent.objects.bulk_create(
+            [StripeEvent(event_id=event_id, type=event_type, payload=event)],
+            ignore_conflicts=True,
+        )
+        return Response({"received": True}, status=status.HTTP_200_OK)
+
+
+class ReportsView(APIView):
+    """
+    Finance report for admins: MRR per plan, outstanding receivables and
+    their aging, read from the summary tables.
+    """
+
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        """Build the report"""
+        return Response(build_report())
+
+
+class MetricsView(APIView):
+    """Billing task run history in the Prometheus text format."""
+
+    permission_classes = [IsAdminOrMetricsToken]
+
+    def get(self, request):
+        """Render the metrics"""
+        return HttpResponse(
+            render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )